@@ -27,6 +27,11 @@ _C.MODEL.MASK_ON = False
 _C.MODEL.KEYPOINT_ON = False
 _C.MODEL.DEVICE = "cuda"
 _C.MODEL.META_ARCHITECTURE = "GeneralizedRCNN"
+# When matching anchors or proposals with ground-truth boxes (in RPN, RetinaNet and
+# ROI heads), compute their IoU for at most this many anchors or proposals at a time,
+# instead of materializing the full (#gt x #anchors) IoU matrix. This bounds the memory
+# used by images with many ground-truth boxes. 0 disables chunking.
+_C.MODEL.MATCHER_CHUNK_SIZE = 0
 
 # Path (a file path, or URL like detectron2://.., https://..) to a checkpoint file
 # to be loaded to the model. You can find available models in the model zoo.
@@ -84,7 +89,7 @@ _C.INPUT.CROP.SIZE = [0.9, 0.9]
 _C.INPUT.FORMAT = "BGR"
 # The ground truth mask format that the model will use.
 # Mask R-CNN supports either "polygon" or "bitmask" as ground truth.
-_C.INPUT.MASK_FORMAT = "polygon"  # alternative: "bitmask"
+_C.INPUT.MASK_FORMAT = "polygon"  # alternative: "bitmask", "rle"
 
 
 # -----------------------------------------------------------------------------
@@ -112,10 +117,23 @@ _C.DATASETS.PRECOMPUTED_PROPOSAL_TOPK_TEST = 1000
 _C.DATALOADER = CN()
 # Number of data loading threads
 _C.DATALOADER.NUM_WORKERS = 4
+# If > 0, training data loader workers send the tensors of each batch (e.g. images)
+# to the main process through pre-allocated shared memory slots of this size (in MiB),
+# instead of allocating new shared memory for every tensor.
+# See `SharedMemoryBatchTransfer`.
+_C.DATALOADER.SHARED_MEMORY_SLOT_MB = 0
 # If True, each batch should contain only images for which the aspect ratio
 # is compatible. This groups portrait images together, and landscape images
 # are not batched with portrait images.
 _C.DATALOADER.ASPECT_RATIO_GROUPING = True
+# If > 0 and ASPECT_RATIO_GROUPING is True, images are instead grouped by their
+# (height, width) after augmentation, quantized by this number of pixels, into any
+# number of buckets. See `SizeGroupedDataset`.
+_C.DATALOADER.SIZE_GROUPING_QUANTUM = 0
+# The size divisibility of the backbone (e.g. 32 for FPN, 0 for the default C4 backbone),
+# to which the images of a batch are padded. Used to log the padding overhead of
+# the batches formed with SIZE_GROUPING_QUANTUM.
+_C.DATALOADER.SIZE_DIVISIBILITY = 0
 # Options: TrainingSampler, RepeatFactorTrainingSampler
 _C.DATALOADER.SAMPLER_TRAIN = "TrainingSampler"
 # Repeat threshold for RepeatFactorTrainingSampler
@@ -123,6 +141,30 @@ _C.DATALOADER.REPEAT_THRESHOLD = 0.0
 # Tf True, when working on datasets that have instance annotations, the
 # training dataloader will filter out images without associated annotations
 _C.DATALOADER.FILTER_EMPTY_ANNOTATIONS = True
+# If not empty, serialized datasets are cached as files under this (local) directory
+# and memory-mapped by all processes, so that processes on the same machine share
+# one copy of the dataset. Later runs use a valid cache file without loading the datasets.
+# A cache file is rebuilt when the dataset names, the loading settings (e.g. filtering,
+# proposal files) or the modification time of the annotation files change. Remove the
+# cache files after changing datasets in other ways (e.g. the code that loads them).
+_C.DATALOADER.SERIALIZED_CACHE_DIR = ""
+# If True, only the first process on each machine loads the datasets (parsing the
+# annotation files, filtering, printing statistics), and shares the serialized
+# datasets with other processes on the machine through POSIX shared memory.
+# SERIALIZED_CACHE_DIR is not used if this is enabled.
+_C.DATALOADER.LOAD_ON_LOCAL_MASTER = False
+# Number of images per batch (per device) of the test data loader. If larger than 1,
+# images with similar aspect ratios are batched together to reduce padding.
+_C.DATALOADER.TEST_IMS_PER_BATCH = 1
+# If True, the test data loader splits the dataset among workers so that every worker
+# gets about the same estimated cost of inference (instead of the same number of images).
+# The cost of an image is estimated from its number of pixels and annotations, or taken
+# from INFERENCE_TIMINGS_FILE if available.
+_C.DATALOADER.BALANCE_INFERENCE_COST = False
+# A json file with a dict that maps str(image_id) to the measured inference time (in
+# seconds) of the image, used by BALANCE_INFERENCE_COST. Such files are written by
+# `inference_on_dataset(timings_file=...)`, e.g. with TEST.DUMP_INFERENCE_TIMINGS.
+_C.DATALOADER.INFERENCE_TIMINGS_FILE = ""
 
 # ---------------------------------------------------------------------------- #
 # Backbone options
@@ -280,6 +322,10 @@ _C.MODEL.ROI_HEADS.NMS_THRESH_TEST = 0.5
 # If True, augment proposals with ground-truth boxes before sampling proposals to
 # train ROI heads.
 _C.MODEL.ROI_HEADS.PROPOSAL_APPEND_GT = True
+# If True, match and sample the proposals of all images in a batch at once, using
+# padded tensors, instead of one image at a time. The sampled proposals follow the same
+# distribution, but are not the same as the ones sampled one image at a time.
+_C.MODEL.ROI_HEADS.BATCHED_LABEL_AND_SAMPLE = False
 
 # ---------------------------------------------------------------------------- #
 # Box Head
@@ -584,9 +630,24 @@ _C.TEST.EVAL_PERIOD = 0
 # When empty, it will use the defaults in COCO.
 # Otherwise it should be a list[float] with the same length as ROI_KEYPOINT_HEAD.NUM_KEYPOINTS.
 _C.TEST.KEYPOINT_OKS_SIGMAS = []
+# Number of threads used by the C++ implementation of COCO evaluation to match
+# detections and accumulate precision/recall curves. Set to 0 to use all CPU cores.
+# The results do not depend on it.
+_C.TEST.EVAL_NUM_THREADS = 1
+# If True, DatasetEvaluator.process of each batch runs in a background thread while the
+# model runs on the next batch. See `inference_on_dataset`.
+_C.TEST.PIPELINED_EVAL = False
+# If True, the inference time of every image is saved to
+# OUTPUT_DIR/inference_timings_{dataset name}.json during evaluation,
+# which can be used as DATALOADER.INFERENCE_TIMINGS_FILE in later runs.
+_C.TEST.DUMP_INFERENCE_TIMINGS = False
 # Maximum number of detections to return per image during inference (100 is
 # based on the limit established for the COCO dataset).
 _C.TEST.DETECTIONS_PER_IMAGE = 100
+# The format of the "pred_masks" of the inference outputs. Options: "bitmask" (a full-image
+# bool Tensor) or "rle" (RLEMasks, which are pasted and encoded within their boxes on CPU,
+# without creating full-image masks). See `detector_postprocess`.
+_C.TEST.MASK_FORMAT = "bitmask"
 
 _C.TEST.AUG = CN({"ENABLED": False})
 _C.TEST.AUG.MIN_SIZES = (400, 500, 600, 700, 800, 900, 1000, 1100, 1200)
@@ -1,8 +1,11 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import hashlib
 import itertools
+import json
 import logging
 import numpy as np
 import operator
+import os
 import pickle
 import torch.utils.data
 from fvcore.common.file_io import PathManager
@@ -10,15 +13,23 @@ from tabulate import tabulate
 from termcolor import colored
 
 from detectron2.structures import BoxMode
+from detectron2.utils import comm
 from detectron2.utils.comm import get_world_size
 from detectron2.utils.env import seed_all_rng
 from detectron2.utils.logger import log_first_n
 
 from .catalog import DatasetCatalog, MetadataCatalog
-from .common import AspectRatioGroupedDataset, DatasetFromList, MapDataset
+from .columnar import ColumnarDatasetDicts
+from .common import AspectRatioGroupedDataset, DatasetFromList, MapDataset, SizeGroupedDataset
 from .dataset_mapper import DatasetMapper
 from .detection_utils import check_metadata_consistency
-from .samplers import InferenceSampler, RepeatFactorTrainingSampler, TrainingSampler
+from .samplers import (
+    InferenceGroupedBatchSampler,
+    InferenceSampler,
+    RepeatFactorTrainingSampler,
+    TrainingSampler,
+)
+from .shared_memory import SharedMemoryBatchTransfer
 
 """
 This file contains the default logic to build a dataloader for training or testing.
@@ -54,7 +65,10 @@ def filter_images_with_only_crowd_annotations(dataset_dicts):
                 return True
         return False
 
-    dataset_dicts = [x for x in dataset_dicts if valid(x["annotations"])]
+    if isinstance(dataset_dicts, ColumnarDatasetDicts):
+        dataset_dicts = dataset_dicts.subset(dataset_dicts.num_non_crowd_instances() > 0)
+    else:
+        dataset_dicts = [x for x in dataset_dicts if valid(x["annotations"])]
     num_after = len(dataset_dicts)
     logger = logging.getLogger(__name__)
     logger.info(
@@ -86,9 +100,14 @@ def filter_images_with_few_keypoints(dataset_dicts, min_keypoints_per_image):
             if "keypoints" in ann
         )
 
-    dataset_dicts = [
-        x for x in dataset_dicts if visible_keypoints_in_image(x) >= min_keypoints_per_image
-    ]
+    if isinstance(dataset_dicts, ColumnarDatasetDicts):
+        dataset_dicts = dataset_dicts.subset(
+            dataset_dicts.num_visible_keypoints() >= min_keypoints_per_image
+        )
+    else:
+        dataset_dicts = [
+            x for x in dataset_dicts if visible_keypoints_in_image(x) >= min_keypoints_per_image
+        ]
     num_after = len(dataset_dicts)
     logger = logging.getLogger(__name__)
     logger.info(
@@ -160,12 +179,15 @@ def print_instances_class_histogram(dataset_dicts, class_names):
         class_names (list[str]): list of class names (zero-indexed).
     """
     num_classes = len(class_names)
-    hist_bins = np.arange(num_classes + 1)
-    histogram = np.zeros((num_classes,), dtype=np.int)
-    for entry in dataset_dicts:
-        annos = entry["annotations"]
-        classes = [x["category_id"] for x in annos if not x.get("iscrowd", 0)]
-        histogram += np.histogram(classes, bins=hist_bins)[0]
+    if isinstance(dataset_dicts, ColumnarDatasetDicts):
+        histogram = dataset_dicts.category_histogram(num_classes)
+    else:
+        hist_bins = np.arange(num_classes + 1)
+        histogram = np.zeros((num_classes,), dtype=np.int)
+        for entry in dataset_dicts:
+            annos = entry["annotations"]
+            classes = [x["category_id"] for x in annos if not x.get("iscrowd", 0)]
+            histogram += np.histogram(classes, bins=hist_bins)[0]
 
     N_COLS = min(6, len(class_names) * 2)
 
@@ -223,12 +245,18 @@ def get_detection_dataset_dicts(
     if proposal_files is not None:
         assert len(dataset_names) == len(proposal_files)
         # load precomputed proposals from proposal files
+        # proposals are added to the dicts in place, so lazily created dicts
+        # have to be materialized first
         dataset_dicts = [
-            load_proposals_into_dataset(dataset_i_dicts, proposal_file)
+            load_proposals_into_dataset(list(dataset_i_dicts), proposal_file)
             for dataset_i_dicts, proposal_file in zip(dataset_dicts, proposal_files)
         ]
 
-    dataset_dicts = list(itertools.chain.from_iterable(dataset_dicts))
+    if len(dataset_dicts) == 1 and isinstance(dataset_dicts[0], ColumnarDatasetDicts):
+        # keep the compact representation, dicts will be created when they are used
+        dataset_dicts = dataset_dicts[0]
+    else:
+        dataset_dicts = list(itertools.chain.from_iterable(dataset_dicts))
 
     has_instances = "annotations" in dataset_dicts[0]
     if filter_empty and has_instances:
@@ -249,7 +277,15 @@ def get_detection_dataset_dicts(
 
 
 def build_batch_data_loader(
-    dataset, sampler, total_batch_size, *, aspect_ratio_grouping=False, num_workers=0
+    dataset,
+    sampler,
+    total_batch_size,
+    *,
+    aspect_ratio_grouping=False,
+    size_grouping_quantum=0,
+    size_divisibility=0,
+    num_workers=0,
+    shared_memory_slot_bytes=0
 ):
     """
     Build a batched dataloader for training.
@@ -261,7 +297,13 @@ def build_batch_data_loader(
         aspect_ratio_grouping (bool): whether to group images with similar
             aspect ratio for efficiency. When enabled, it requires each
             element in dataset be a dict with keys "width" and "height".
+        size_grouping_quantum (int): if > 0 and `aspect_ratio_grouping` is enabled,
+            group images by their size instead, using :class:`SizeGroupedDataset`.
+        size_divisibility (int): the size divisibility the model pads the batches to.
+            Used to log the padding overhead of :class:`SizeGroupedDataset`.
         num_workers (int): number of parallel data loading workers
+        shared_memory_slot_bytes (int): if > 0, workers send tensors to the main process
+            through shared memory slots of this size, using :class:`SharedMemoryBatchTransfer`.
 
     Returns:
         iterable[list]. Length of each list is the batch size of the current
@@ -275,27 +317,52 @@ def build_batch_data_loader(
     )
 
     batch_size = total_batch_size // world_size
+
+    def shared_memory_transfer(collate_fn):
+        """
+        Returns:
+            the collate function to use, and a function to wrap the data loader.
+        """
+        if shared_memory_slot_bytes > 0 and num_workers > 0:
+            transfer = SharedMemoryBatchTransfer(
+                num_workers, shared_memory_slot_bytes, collate_fn=collate_fn
+            )
+            return transfer.collate, transfer.wrap
+        return collate_fn, lambda data_loader: data_loader
+
     if aspect_ratio_grouping:
+        # don't batch, but yield individual elements
+        collate_fn, wrap = shared_memory_transfer(operator.itemgetter(0))
         data_loader = torch.utils.data.DataLoader(
             dataset,
             sampler=sampler,
             num_workers=num_workers,
             batch_sampler=None,
-            collate_fn=operator.itemgetter(0),  # don't batch, but yield individual elements
+            collate_fn=collate_fn,
             worker_init_fn=worker_init_reset_seed,
         )  # yield individual mapped dict
+        data_loader = wrap(data_loader)
+        if size_grouping_quantum > 0:
+            return SizeGroupedDataset(
+                data_loader,
+                batch_size,
+                quantum=size_grouping_quantum,
+                size_divisibility=size_divisibility,
+            )
         return AspectRatioGroupedDataset(data_loader, batch_size)
     else:
         batch_sampler = torch.utils.data.sampler.BatchSampler(
             sampler, batch_size, drop_last=True
         )  # drop_last so the batch always have the same size
-        return torch.utils.data.DataLoader(
+        collate_fn, wrap = shared_memory_transfer(trivial_batch_collator)
+        data_loader = torch.utils.data.DataLoader(
             dataset,
             num_workers=num_workers,
             batch_sampler=batch_sampler,
-            collate_fn=trivial_batch_collator,
+            collate_fn=collate_fn,
             worker_init_fn=worker_init_reset_seed,
         )
+        return wrap(data_loader)
 
 
 def build_detection_train_loader(cfg, mapper=None):
@@ -319,30 +386,80 @@ def build_detection_train_loader(cfg, mapper=None):
     Returns:
         an infinite iterator of training data
     """
-    dataset_dicts = get_detection_dataset_dicts(
-        cfg.DATASETS.TRAIN,
-        filter_empty=cfg.DATALOADER.FILTER_EMPTY_ANNOTATIONS,
-        min_keypoints=cfg.MODEL.ROI_KEYPOINT_HEAD.MIN_KEYPOINTS_PER_IMAGE
+    load_settings = {
+        "filter_empty": cfg.DATALOADER.FILTER_EMPTY_ANNOTATIONS,
+        "min_keypoints": cfg.MODEL.ROI_KEYPOINT_HEAD.MIN_KEYPOINTS_PER_IMAGE
         if cfg.MODEL.KEYPOINT_ON
         else 0,
-        proposal_files=cfg.DATASETS.PROPOSAL_FILES_TRAIN if cfg.MODEL.LOAD_PROPOSALS else None,
-    )
-    dataset = DatasetFromList(dataset_dicts, copy=False)
+        "proposal_files": cfg.DATASETS.PROPOSAL_FILES_TRAIN if cfg.MODEL.LOAD_PROPOSALS else None,
+    }
+
+    def load_dataset_dicts():
+        return get_detection_dataset_dicts(cfg.DATASETS.TRAIN, **load_settings)
+
+    sampler_name = cfg.DATALOADER.SAMPLER_TRAIN
+
+    def compute_repeat_factors(dataset_dicts):
+        return RepeatFactorTrainingSampler.repeat_factors_from_category_frequency(
+            dataset_dicts, cfg.DATALOADER.REPEAT_THRESHOLD
+        )
+
+    cache_file = _get_serialized_cache_file(cfg, "train", cfg.DATASETS.TRAIN)
+    repeat_factors = None
+    if cfg.DATALOADER.LOAD_ON_LOCAL_MASTER:
+        # The dicts only exist in the local master, where they are kept for the sampler
+        local_master_dicts = []
+
+        def load_and_keep_dataset_dicts():
+            local_master_dicts.append(load_dataset_dicts())
+            return local_master_dicts[0]
+
+        dataset = DatasetFromList.from_local_master(load_and_keep_dataset_dicts, copy=False)
+        _share_metadata_from_local_master(cfg.DATASETS.TRAIN)
+    elif cache_file is not None:
+        # The repeat factors are stored in the cache file, so that a valid cache file
+        # can be used without loading the dataset dicts.
+        cache_settings = dict(load_settings)
+        if sampler_name == "RepeatFactorTrainingSampler":
+            cache_settings["repeat_threshold"] = cfg.DATALOADER.REPEAT_THRESHOLD
+
+        def compute_extra(dataset_dicts):
+            extra = {"metadata": _get_metadata(cfg.DATASETS.TRAIN)}
+            if sampler_name == "RepeatFactorTrainingSampler":
+                extra["repeat_factors"] = compute_repeat_factors(dataset_dicts).numpy()
+            return extra
+
+        dataset, extra = DatasetFromList.from_cache_file(
+            load_dataset_dicts,
+            cache_file,
+            _get_dataset_cache_key(cfg.DATASETS.TRAIN, **cache_settings),
+            copy=False,
+            extra_func=compute_extra,
+        )
+        _set_missing_metadata(extra["metadata"])
+        if sampler_name == "RepeatFactorTrainingSampler":
+            repeat_factors = torch.from_numpy(extra["repeat_factors"])
+    else:
+        dataset_dicts = load_dataset_dicts()
+        dataset = DatasetFromList(dataset_dicts, copy=False)
 
     if mapper is None:
         mapper = DatasetMapper(cfg, True)
     dataset = MapDataset(dataset, mapper)
 
-    sampler_name = cfg.DATALOADER.SAMPLER_TRAIN
     logger = logging.getLogger(__name__)
     logger.info("Using training sampler {}".format(sampler_name))
     # TODO avoid if-else?
     if sampler_name == "TrainingSampler":
         sampler = TrainingSampler(len(dataset))
     elif sampler_name == "RepeatFactorTrainingSampler":
-        repeat_factors = RepeatFactorTrainingSampler.repeat_factors_from_category_frequency(
-            dataset_dicts, cfg.DATALOADER.REPEAT_THRESHOLD
-        )
+        if cfg.DATALOADER.LOAD_ON_LOCAL_MASTER:
+            repeat_factors = comm.share_arrays_from_local_master(
+                lambda: {"repeat_factors": compute_repeat_factors(local_master_dicts[0]).numpy()}
+            )["repeat_factors"]
+            repeat_factors = torch.from_numpy(np.array(repeat_factors))
+        elif repeat_factors is None:  # not loaded from the cache file
+            repeat_factors = compute_repeat_factors(dataset_dicts)
         sampler = RepeatFactorTrainingSampler(repeat_factors)
     else:
         raise ValueError("Unknown training sampler: {}".format(sampler_name))
@@ -351,7 +468,10 @@ def build_detection_train_loader(cfg, mapper=None):
         sampler,
         cfg.SOLVER.IMS_PER_BATCH,
         aspect_ratio_grouping=cfg.DATALOADER.ASPECT_RATIO_GROUPING,
+        size_grouping_quantum=cfg.DATALOADER.SIZE_GROUPING_QUANTUM,
+        size_divisibility=cfg.DATALOADER.SIZE_DIVISIBILITY,
         num_workers=cfg.DATALOADER.NUM_WORKERS,
+        shared_memory_slot_bytes=cfg.DATALOADER.SHARED_MEMORY_SLOT_MB * 1024 ** 2,
     )
 
 
@@ -359,7 +479,9 @@ def build_detection_test_loader(cfg, dataset_name, mapper=None):
     """
     Similar to `build_detection_train_loader`.
     But this function uses the given `dataset_name` argument (instead of the names in cfg),
-    and uses batch size 1.
+    and uses batch size `cfg.DATALOADER.TEST_IMS_PER_BATCH` (1 by default).
+    With a larger batch size, each batch contains images of similar aspect ratios, which may
+    not be in the order of the dataset. :func:`inference_on_dataset` restores the order.
 
     Args:
         cfg: a detectron2 CfgNode
@@ -372,26 +494,53 @@ def build_detection_test_loader(cfg, dataset_name, mapper=None):
         DataLoader: a torch DataLoader, that loads the given detection
         dataset, with test-time transformation and batching.
     """
-    dataset_dicts = get_detection_dataset_dicts(
-        [dataset_name],
-        filter_empty=False,
-        proposal_files=[
+    load_settings = {
+        "filter_empty": False,
+        "proposal_files": [
             cfg.DATASETS.PROPOSAL_FILES_TEST[list(cfg.DATASETS.TEST).index(dataset_name)]
         ]
         if cfg.MODEL.LOAD_PROPOSALS
         else None,
-    )
+    }
+
+    def load_dataset_dicts():
+        return get_detection_dataset_dicts([dataset_name], **load_settings)
+
+    cache_file = _get_serialized_cache_file(cfg, "test", [dataset_name])
+    if cfg.DATALOADER.LOAD_ON_LOCAL_MASTER:
+        dataset = DatasetFromList.from_local_master(load_dataset_dicts)
+        _share_metadata_from_local_master([dataset_name])
+    elif cache_file is not None:
+        dataset, metadata = DatasetFromList.from_cache_file(
+            load_dataset_dicts,
+            cache_file,
+            _get_dataset_cache_key([dataset_name], **load_settings),
+            extra_func=lambda _: _get_metadata([dataset_name]),
+        )
+        _set_missing_metadata(metadata)
+    else:
+        dataset = DatasetFromList(load_dataset_dicts())
+    batch_size = cfg.DATALOADER.TEST_IMS_PER_BATCH
+    if cfg.DATALOADER.BALANCE_INFERENCE_COST:
+        sampler = InferenceSampler(
+            len(dataset), costs=_get_inference_costs(dataset, cfg.DATALOADER.INFERENCE_TIMINGS_FILE)
+        )
+    else:
+        sampler = InferenceSampler(len(dataset))
+    if batch_size > 1:
+        aspect_ratios = [
+            d["width"] / d["height"] if "width" in d and "height" in d else 1.0 for d in dataset
+        ]
+        batch_sampler = InferenceGroupedBatchSampler(sampler, aspect_ratios, batch_size)
+    else:
+        # Use 1 image per worker during inference by default since this is the
+        # standard when reporting inference time in papers.
+        batch_sampler = torch.utils.data.sampler.BatchSampler(sampler, 1, drop_last=False)
 
-    dataset = DatasetFromList(dataset_dicts)
     if mapper is None:
         mapper = DatasetMapper(cfg, False)
     dataset = MapDataset(dataset, mapper)
 
-    sampler = InferenceSampler(len(dataset))
-    # Always use 1 image per worker during inference since this is the
-    # standard when reporting inference time in papers.
-    batch_sampler = torch.utils.data.sampler.BatchSampler(sampler, 1, drop_last=False)
-
     data_loader = torch.utils.data.DataLoader(
         dataset,
         num_workers=cfg.DATALOADER.NUM_WORKERS,
@@ -401,6 +550,113 @@ def build_detection_test_loader(cfg, dataset_name, mapper=None):
     return data_loader
 
 
+def _get_inference_costs(dataset_dicts, timings_file=""):
+    """
+    Estimate the relative cost of inference of each image, by its number of pixels
+    and annotations (a proxy of the number of detections). Measured timings in
+    `timings_file` are used instead for the images they contain, after scaling them
+    to the same mean as the estimates.
+
+    Returns:
+        ndarray: float64 array of length len(dataset_dicts).
+    """
+    num_pixels = np.asarray(
+        [d.get("height", 0) * d.get("width", 0) for d in dataset_dicts], dtype=np.float64
+    )
+    num_annotations = np.asarray([len(d.get("annotations", [])) for d in dataset_dicts])
+    mean_pixels = num_pixels.mean() if num_pixels.any() else 1.0
+    num_pixels[num_pixels == 0] = mean_pixels
+    # A cost of 1 for an image of average size, and 0.01 for each annotation
+    costs = num_pixels / mean_pixels + 0.01 * num_annotations
+    if timings_file:
+        with PathManager.open(timings_file, "r") as f:
+            timings = {str(k): v for k, v in json.load(f).items()}
+        measured = np.asarray(
+            [timings.get(str(d.get("image_id")), -1.0) for d in dataset_dicts], dtype=np.float64
+        )
+        has_timing = measured >= 0
+        logger = logging.getLogger(__name__)
+        logger.info(
+            "Using measured inference time of {}/{} images in {}".format(
+                has_timing.sum(), len(dataset_dicts), timings_file
+            )
+        )
+        if has_timing.any() and measured[has_timing].mean() > 0:
+            scale = costs[has_timing].mean() / measured[has_timing].mean()
+            costs[has_timing] = measured[has_timing] * scale
+    return costs
+
+
+def _share_metadata_from_local_master(dataset_names):
+    """
+    Loading a dataset may add metadata to :class:`MetadataCatalog` (e.g. "thing_classes").
+    Copy such metadata from the local master to other processes that did not load the dataset.
+    """
+    local_rank = comm.get_local_rank()
+    metadata = None
+    if local_rank == 0:
+        metadata = _get_metadata(dataset_names)
+    metadata = comm.all_gather(metadata)[comm.get_rank() - local_rank]
+    if local_rank != 0:
+        _set_missing_metadata(metadata)
+
+
+def _get_metadata(dataset_names):
+    return {name: MetadataCatalog.get(name).as_dict() for name in dataset_names}
+
+
+def _set_missing_metadata(metadata):
+    """
+    Set the metadata returned by :func:`_get_metadata` that is not set in this process.
+    """
+    for name, meta in metadata.items():
+        existing = MetadataCatalog.get(name)
+        existing.set(**{k: v for k, v in meta.items() if existing.get(k) is None})
+
+
+def _get_serialized_cache_file(cfg, split, dataset_names):
+    """
+    Returns:
+        str or None: the cache file used by :class:`DatasetFromList` to store the
+            serialized datasets, or None if caching is disabled.
+    """
+    cache_dir = cfg.DATALOADER.SERIALIZED_CACHE_DIR
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, "{}_{}.bin".format(split, "+".join(dataset_names)))
+
+
+# Metadata of datasets that point to their annotation files
+_ANNOTATION_FILE_METADATA = ["json_file", "panoptic_json", "sem_seg_root", "dirname"]
+
+
+def _get_dataset_cache_key(dataset_names, **settings):
+    """
+    Returns:
+        str: a key of the dataset dicts loaded by :func:`get_detection_dataset_dicts` with
+            `settings`, to detect stale cache files. It is a hash of the dataset names,
+            the settings, and the modification time and size of the annotation files and
+            proposal files of the datasets. Changes to other sources of the dataset dicts
+            are not detected.
+    """
+    files = list(settings.get("proposal_files") or [])
+    for name in dataset_names:
+        metadata = MetadataCatalog.get(name)
+        files.extend(metadata.get(k) for k in _ANNOTATION_FILE_METADATA if metadata.get(k))
+    file_stats = {}
+    for f in files:
+        try:
+            stat = os.stat(f)
+            file_stats[f] = [stat.st_mtime_ns, stat.st_size]
+        except OSError:  # e.g. remote files
+            file_stats[f] = None
+    content = json.dumps(
+        {"datasets": list(dataset_names), "settings": settings, "files": file_stats},
+        sort_keys=True,
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
 def trivial_batch_collator(batch):
     """
     A batch collator that does nothing.
@@ -0,0 +1,298 @@
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import numpy as np
+import os
+from collections.abc import Sequence
+from fvcore.common.file_io import PathManager
+
+from detectron2.structures import BoxMode
+
+"""
+A compact, columnar representation of instance detection datasets.
+"""
+
+__all__ = ["ColumnarDatasetDicts"]
+
+
+_IMAGE_KEYS = {"file_name", "height", "width", "image_id", "annotations"}
+_ANNOTATION_KEYS = {"bbox", "bbox_mode", "category_id", "iscrowd", "keypoints", "segmentation"}
+
+
+def _offsets(lengths):
+    """
+    Returns:
+        ndarray: int64 array of size len(lengths) + 1, the start offsets of each
+            segment followed by the total length.
+    """
+    ret = np.zeros((len(lengths) + 1,), dtype=np.int64)
+    np.cumsum(lengths, out=ret[1:])
+    return ret
+
+
+def _segment_sum(values, offsets):
+    """
+    Sum `values` within each segment described by `offsets`.
+    """
+    cumsum = np.zeros((len(values) + 1,), dtype=np.int64)
+    np.cumsum(values, out=cumsum[1:])
+    return cumsum[offsets[1:]] - cumsum[offsets[:-1]]
+
+
+class ColumnarDatasetDicts(Sequence):
+    """
+    A read-only sequence of dataset dicts (in Detectron2 Dataset format) for instance
+    detection/segmentation and keypoint detection, which stores all annotations
+    in a few numpy arrays instead of millions of python objects.
+
+    The dicts are created lazily in :meth:`__getitem__`. Therefore modifications to
+    the returned dicts are not reflected in this object. Call ``list()`` on it if
+    in-place modification is needed.
+
+    It also provides vectorized versions of the statistics that are computed over
+    entire datasets, e.g. the number of non-crowd instances in every image.
+    """
+
+    def __init__(self, columns, image_root="", indices=None):
+        """
+        Args:
+            columns (dict[str, ndarray]): the columns created by :meth:`from_dicts`.
+            image_root (str): the directory that "file_name" is relative to.
+            indices (ndarray or None): if given, this object only contains images at
+                these indices of the columns, in this order.
+        """
+        self._columns = columns
+        self._image_root = image_root
+        if indices is None:
+            indices = np.arange(len(columns["file_name"]), dtype=np.int64)
+        self._indices = np.asarray(indices, dtype=np.int64)
+
+    @staticmethod
+    def from_dicts(dataset_dicts):
+        """
+        Convert dataset dicts into columns. Only the keys used for instance detection,
+        instance segmentation and keypoint detection are supported.
+
+        Args:
+            dataset_dicts (list[dict]): annotations in Detectron2 Dataset format.
+
+        Returns:
+            dict[str, ndarray]: the columns to be used to create :class:`ColumnarDatasetDicts`.
+        """
+        file_name, height, width, image_id, num_anns = [], [], [], [], []
+        bbox, bbox_mode, category_id, iscrowd = [], [], [], []
+        keypoints, num_keypoints = [], []
+        polygons, num_polygons = [], []
+        rle_counts, rle_size = [], []
+
+        for record in dataset_dicts:
+            assert set(record.keys()) <= _IMAGE_KEYS, (
+                "Unsupported keys in dataset dicts: "
+                "{}".format(set(record.keys()) - _IMAGE_KEYS)
+            )
+            file_name.append(record["file_name"])
+            height.append(record["height"])
+            width.append(record["width"])
+            image_id.append(record["image_id"])
+            annos = record.get("annotations", [])
+            num_anns.append(len(annos))
+
+            for anno in annos:
+                assert set(anno.keys()) <= _ANNOTATION_KEYS, (
+                    "Unsupported keys in annotations: "
+                    "{}".format(set(anno.keys()) - _ANNOTATION_KEYS)
+                )
+                bbox.append(anno["bbox"])
+                bbox_mode.append(int(anno["bbox_mode"]))
+                category_id.append(anno["category_id"])
+                # -1 means the key does not exist
+                iscrowd.append(anno.get("iscrowd", -1))
+
+                kpts = anno.get("keypoints", [])
+                keypoints.append(np.asarray(kpts, dtype=np.float64).reshape(-1))
+                num_keypoints.append(len(kpts))
+
+                segm = anno.get("segmentation", None)
+                if isinstance(segm, dict):
+                    counts = segm["counts"]
+                    if isinstance(counts, str):
+                        counts = counts.encode("ascii")
+                    assert isinstance(counts, bytes), "Only compressed RLE is supported!"
+                    rle_counts.append(counts)
+                    rle_size.append(segm["size"])
+                    num_polygons.append(0)
+                else:
+                    segm = segm or []
+                    polygons.extend(np.asarray(p, dtype=np.float64).reshape(-1) for p in segm)
+                    num_polygons.append(len(segm))
+                    rle_counts.append(b"")
+                    rle_size.append([0, 0])
+
+        polygon_lengths = [len(p) for p in polygons]
+        rle_lengths = [len(c) for c in rle_counts]
+        return {
+            "file_name": np.asarray(file_name, dtype=np.str_),
+            "height": np.asarray(height, dtype=np.int64),
+            "width": np.asarray(width, dtype=np.int64),
+            "image_id": np.asarray(image_id),
+            "annotation_offsets": _offsets(num_anns),
+            "bbox": np.asarray(bbox, dtype=np.float64).reshape(-1, 4),
+            "bbox_mode": np.asarray(bbox_mode, dtype=np.int8),
+            "category_id": np.asarray(category_id, dtype=np.int64),
+            "iscrowd": np.asarray(iscrowd, dtype=np.int8),
+            "keypoint_offsets": _offsets(num_keypoints),
+            "keypoints": np.concatenate(keypoints) if keypoints else np.zeros((0,)),
+            "polygon_offsets": _offsets(num_polygons),
+            "polygon_coord_offsets": _offsets(polygon_lengths),
+            "polygon_coords": np.concatenate(polygons) if polygons else np.zeros((0,)),
+            "rle_offsets": _offsets(rle_lengths),
+            "rle_counts": np.frombuffer(b"".join(rle_counts), dtype=np.uint8),
+            "rle_size": np.asarray(rle_size, dtype=np.int64).reshape(-1, 2),
+        }
+
+    def save(self, file):
+        """
+        Save all columns (regardless of the images selected by this object)
+        to a ".npz" file.
+        """
+        with PathManager.open(file, "wb") as f:
+            np.savez(f, **self._columns)
+
+    @staticmethod
+    def load(file, image_root=""):
+        """
+        Load columns saved by :meth:`save`.
+
+        Returns:
+            ColumnarDatasetDicts
+        """
+        with PathManager.open(file, "rb") as f:
+            npz = np.load(f)
+            columns = {k: npz[k] for k in npz.files}
+        return ColumnarDatasetDicts(columns, image_root)
+
+    @property
+    def columns(self):
+        """
+        dict[str, ndarray]: all columns, including those of unselected images.
+        """
+        return self._columns
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.subset(np.arange(len(self))[idx])
+        c = self._columns
+        i = self._indices[idx]
+        record = {
+            "file_name": os.path.join(self._image_root, str(c["file_name"][i])),
+            "height": int(c["height"][i]),
+            "width": int(c["width"][i]),
+            "image_id": c["image_id"][i].item(),
+        }
+        start, end = c["annotation_offsets"][i : i + 2]
+        record["annotations"] = [self._get_annotation(j) for j in range(start, end)]
+        return record
+
+    def _get_annotation(self, j):
+        c = self._columns
+        obj = {
+            "bbox": c["bbox"][j].tolist(),
+            "bbox_mode": BoxMode(int(c["bbox_mode"][j])),
+            "category_id": int(c["category_id"][j]),
+        }
+        if c["iscrowd"][j] >= 0:
+            obj["iscrowd"] = int(c["iscrowd"][j])
+
+        start, end = c["keypoint_offsets"][j : j + 2]
+        if end > start:
+            obj["keypoints"] = c["keypoints"][start:end].tolist()
+
+        start, end = c["polygon_offsets"][j : j + 2]
+        if end > start:
+            coord_offsets = c["polygon_coord_offsets"]
+            obj["segmentation"] = [
+                c["polygon_coords"][coord_offsets[k] : coord_offsets[k + 1]].tolist()
+                for k in range(start, end)
+            ]
+        start, end = c["rle_offsets"][j : j + 2]
+        if end > start:
+            obj["segmentation"] = {
+                "counts": c["rle_counts"][start:end].tobytes().decode("ascii"),
+                "size": c["rle_size"][j].tolist(),
+            }
+        return obj
+
+    def subset(self, indices):
+        """
+        Args:
+            indices (ndarray): a boolean mask of length len(self), or integer indices.
+
+        Returns:
+            ColumnarDatasetDicts: a new object that contains the selected images.
+                The columns are shared with this object.
+        """
+        return ColumnarDatasetDicts(self._columns, self._image_root, self._indices[indices])
+
+    def _annotation_image_weights(self):
+        """
+        Returns:
+            ndarray: for every annotation in the columns, the number of times its
+                image is selected by this object.
+        """
+        offsets = self._columns["annotation_offsets"]
+        num_images = len(offsets) - 1
+        image_weights = np.bincount(self._indices, minlength=num_images)
+        return np.repeat(image_weights, np.diff(offsets))
+
+    def num_non_crowd_instances(self):
+        """
+        Returns:
+            ndarray: int64 array of length len(self), the number of non-crowd
+                annotations in each image.
+        """
+        non_crowd = self._columns["iscrowd"] <= 0
+        counts = _segment_sum(non_crowd, self._columns["annotation_offsets"])
+        return counts[self._indices]
+
+    def num_visible_keypoints(self):
+        """
+        Returns:
+            ndarray: int64 array of length len(self), the number of visible
+                keypoints in each image.
+        """
+        c = self._columns
+        # Every keypoint has the format (x, y, v) where v is visibility
+        visible = c["keypoints"][2::3] > 0
+        per_annotation = _segment_sum(visible, c["keypoint_offsets"] // 3)
+        counts = _segment_sum(per_annotation, c["annotation_offsets"])
+        return counts[self._indices]
+
+    def annotation_categories(self):
+        """
+        Returns:
+            tuple[ndarray, ndarray]: two int64 arrays of the same length, the index
+                (in this object) of the image and the category id of every annotation
+                of the selected images.
+        """
+        c = self._columns
+        starts = c["annotation_offsets"][self._indices]
+        counts = c["annotation_offsets"][self._indices + 1] - starts
+        image_indices = np.repeat(np.arange(len(self), dtype=np.int64), counts)
+        # the index of every annotation in the columns
+        annotation_indices = np.arange(counts.sum(), dtype=np.int64) + np.repeat(
+            starts - _offsets(counts)[:-1], counts
+        )
+        return image_indices, c["category_id"][annotation_indices]
+
+    def category_histogram(self, num_classes):
+        """
+        Returns:
+            ndarray: int64 array of length num_classes, the number of non-crowd
+                instances of each category.
+        """
+        c = self._columns
+        non_crowd = c["iscrowd"] <= 0
+        weights = self._annotation_image_weights()[non_crowd]
+        histogram = np.bincount(c["category_id"][non_crowd], weights=weights, minlength=num_classes)
+        return histogram[:num_classes].astype(np.int64)
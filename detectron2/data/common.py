@@ -2,13 +2,22 @@
 import copy
 import logging
 import numpy as np
+import os
 import pickle
 import random
 import torch.utils.data as data
+from typing import Optional
 
+from detectron2.utils import comm
+from detectron2.utils.events import get_event_storage
 from detectron2.utils.serialize import PicklableWrapper
 
-__all__ = ["MapDataset", "DatasetFromList", "AspectRatioGroupedDataset"]
+__all__ = ["MapDataset", "DatasetFromList", "AspectRatioGroupedDataset", "SizeGroupedDataset"]
+
+
+def _serialize(data):
+    buffer = pickle.dumps(data, protocol=-1)
+    return np.frombuffer(buffer, dtype=np.uint8)
 
 
 class MapDataset(data.Dataset):
@@ -62,7 +71,14 @@ class DatasetFromList(data.Dataset):
     Wrap a list to a torch Dataset. It produces elements of the list as data.
     """
 
-    def __init__(self, lst: list, copy: bool = True, serialize: bool = True):
+    def __init__(
+        self,
+        lst: list,
+        copy: bool = True,
+        serialize: bool = True,
+        cache_file: Optional[str] = None,
+        cache_key: str = "",
+    ):
         """
         Args:
             lst (list): a list which contains elements to produce.
@@ -72,16 +88,36 @@ class DatasetFromList(data.Dataset):
             serialize (bool): whether to hold memory using serialized objects, when
                 enabled, data loader workers can use shared RAM from master
                 process instead of making a copy.
+            cache_file (str): only used when `serialize` is True. If given, the
+                serialized objects are written to this (local) file once, and every
+                process memory-maps the file instead of holding its own copy.
+                Processes on the same machine then share one copy in page cache,
+                and later runs reuse the file without serializing again.
+            cache_key (str): a key that identifies the content of `lst`, stored in the
+                cache file. An existing cache file with a different key is rewritten.
+                Use :meth:`from_cache_file` to also skip building `lst` when the cache
+                file is valid.
         """
         self._lst = lst
         self._copy = copy
         self._serialize = serialize
+        self._cache_file = cache_file if serialize else None
+        self._cache_key = cache_key
 
-        def _serialize(data):
-            buffer = pickle.dumps(data, protocol=-1)
-            return np.frombuffer(buffer, dtype=np.uint8)
-
-        if self._serialize:
+        if self._cache_file is not None:
+            if comm.get_local_rank() == 0:
+                header = self._read_cache_header(self._cache_file)
+                if header is None or header[0] != cache_key:
+                    self._write_cache_file(self._cache_file, lst, cache_key)
+            comm.synchronize()
+            self._load_cache_file()
+            assert len(self._addr) == len(lst), (
+                "Cache file {} contains {} elements but the dataset has {}! "
+                "Please remove the stale cache file.".format(
+                    self._cache_file, len(self._addr), len(lst)
+                )
+            )
+        elif self._serialize:
             logger = logging.getLogger(__name__)
             logger.info(
                 "Serializing {} elements to byte tensors and concatenating them all ...".format(
@@ -94,6 +130,166 @@ class DatasetFromList(data.Dataset):
             self._lst = np.concatenate(self._lst)
             logger.info("Serialized dataset takes {:.2f} MiB".format(len(self._lst) / 1024 ** 2))
 
+    @classmethod
+    def from_local_master(cls, load_func, copy: bool = True):
+        """
+        Same as ``DatasetFromList(load_func(), copy=copy)``, but `load_func` is only called
+        by the local master process (local rank 0) of each machine. The serialized dataset
+        is shared with the other processes on the same machine through POSIX shared memory,
+        so they neither load the dataset nor hold their own copy of it.
+        All processes have to call this function, otherwise it will deadlock.
+
+        Args:
+            load_func (callable): a callable which takes no arguments and returns a list.
+            copy (bool): see :meth:`__init__`.
+
+        Returns:
+            DatasetFromList
+        """
+
+        def serialize():
+            dataset = cls(load_func(), copy=copy, serialize=True)
+            return {"lst": dataset._lst, "addr": dataset._addr}
+
+        arrays = comm.share_arrays_from_local_master(serialize)
+        ret = cls.__new__(cls)
+        ret._copy, ret._serialize, ret._cache_file = copy, True, None
+        ret._lst, ret._addr = arrays["lst"], arrays["addr"]
+        return ret
+
+    @classmethod
+    def from_cache_file(
+        cls, load_func, cache_file: str, cache_key: str, copy: bool = True, extra_func=None
+    ):
+        """
+        Same as ``DatasetFromList(load_func(), copy=copy, cache_file=cache_file,
+        cache_key=cache_key)``, but `load_func` is only called (by the local master process
+        of each machine) if `cache_file` does not exist or was written with another key.
+        Otherwise, the dataset is memory-mapped from the file without building the list.
+        All processes have to call this function, otherwise it will deadlock.
+
+        Args:
+            load_func (callable): a callable which takes no arguments and returns a list.
+            cache_file (str): a (local) file to store the serialized list.
+            cache_key (str): a key that identifies the list returned by `load_func`,
+                e.g. a hash of its sources and settings.
+            copy (bool): see :meth:`__init__`.
+            extra_func (callable): if given, a callable which takes the list and returns
+                a picklable object that is computed from the list, e.g. statistics of it.
+                It is stored in the cache file together with the list.
+
+        Returns:
+            DatasetFromList
+            object: the result of `extra_func`, or None.
+        """
+        if comm.get_local_rank() == 0:
+            header = cls._read_cache_header(cache_file)
+            if header is None or header[0] != cache_key:
+                lst = load_func()
+                extra = extra_func(lst) if extra_func is not None else None
+                cls._write_cache_file(cache_file, lst, cache_key, extra)
+        comm.synchronize()
+        ret = cls.__new__(cls)
+        ret._copy, ret._serialize = copy, True
+        ret._cache_file, ret._cache_key = cache_file, cache_key
+        extra = ret._load_cache_file()
+        return ret, extra
+
+    # Layout of the cache file: magic, the length of the key (int64), the key,
+    # the length of the extra object (int64), the pickled extra object, padding to
+    # 8 bytes, number of elements N (int64), N end addresses (int64), then the
+    # concatenated serialized bytes.
+    _CACHE_MAGIC = b"D2LIST02"
+
+    @classmethod
+    def _write_cache_file(cls, cache_file, lst, cache_key, extra=None):
+        """
+        Write the cache file. The file is moved into place atomically, so it is also safe
+        when several machines share a file system.
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("Serializing {} elements to cache file {} ...".format(len(lst), cache_file))
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        tmp_file = "{}.tmp.{}".format(cache_file, os.getpid())
+        key = cache_key.encode("utf-8")
+        extra = pickle.dumps(extra, protocol=-1)
+        addr = np.zeros((len(lst),), dtype=np.int64)
+        with open(tmp_file, "wb") as f:
+            f.write(cls._CACHE_MAGIC)
+            for buffer in [key, extra]:
+                f.write(np.asarray([len(buffer)], dtype=np.int64).tobytes())
+                f.write(buffer)
+            f.write(b"\0" * (-f.tell() % 8))
+            f.write(np.asarray([len(lst)], dtype=np.int64).tobytes())
+            addr_offset = f.tell()
+            f.write(addr.tobytes())  # placeholder, filled below
+            end = 0
+            for i, x in enumerate(lst):
+                buffer = _serialize(x)
+                f.write(buffer.tobytes())
+                end += len(buffer)
+                addr[i] = end
+            f.seek(addr_offset)
+            f.write(addr.tobytes())
+        os.replace(tmp_file, cache_file)
+        logger.info("Serialized dataset takes {:.2f} MiB".format(end / 1024 ** 2))
+
+    @classmethod
+    def _read_cache_header(cls, cache_file):
+        """
+        Returns:
+            tuple[str, object, int]: the key and the extra object stored in the cache file,
+                and the offset of the number of elements; or None if the file does not
+                exist or has an old format.
+        """
+        if not os.path.isfile(cache_file):
+            return None
+        with open(cache_file, "rb") as f:
+            if f.read(len(cls._CACHE_MAGIC)) != cls._CACHE_MAGIC:
+                return None
+            key, extra = [
+                f.read(int(np.frombuffer(f.read(8), dtype=np.int64)[0])) for _ in range(2)
+            ]
+            offset = f.tell() + (-f.tell() % 8)
+        return key.decode("utf-8"), pickle.loads(extra), offset
+
+    def _load_cache_file(self):
+        """
+        Returns:
+            object: the extra object stored in the cache file.
+        """
+        header = self._read_cache_header(self._cache_file)
+        assert header is not None, "{} is not a valid dataset cache file!".format(self._cache_file)
+        key, extra, offset = header
+        assert key == self._cache_key, "Cache file {} was written with another key!".format(
+            self._cache_file
+        )
+        with open(self._cache_file, "rb") as f:
+            f.seek(offset)
+            num = int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+        offset += 8
+        self._addr = np.memmap(
+            self._cache_file, dtype=np.int64, mode="r", offset=offset, shape=(num,)
+        )
+        offset += num * 8
+        if os.path.getsize(self._cache_file) > offset:
+            self._lst = np.memmap(self._cache_file, dtype=np.uint8, mode="r", offset=offset)
+        else:  # np.memmap does not support empty files
+            self._lst = np.zeros((0,), dtype=np.uint8)
+        return extra
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._cache_file is not None:
+            # Do not pickle the mapped content; every worker maps the file by itself.
+            del state["_lst"], state["_addr"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._cache_file is not None:
+            self._load_cache_file()
+
     def __len__(self):
         if self._serialize:
             return len(self._addr)
@@ -147,3 +343,100 @@ class AspectRatioGroupedDataset(data.IterableDataset):
             if len(bucket) == self.batch_size:
                 yield bucket[:]
                 del bucket[:]
+
+
+class SizeGroupedDataset(data.IterableDataset):
+    """
+    Batch data that have similar size together.
+    Compared to :class:`AspectRatioGroupedDataset`, images are grouped by their
+    (height, width) after augmentation, quantized by `quantum` pixels, into any number
+    of buckets. Therefore the images in a batch need even less padding.
+
+    A bucket produces a batch when it has `batch_size` images. To bound the memory,
+    when more than `max_buffered` images are buffered in all buckets, the bucket with the
+    most images is flushed: it is filled with images from the buckets of the closest sizes
+    to form a batch.
+
+    It assumes the underlying dataset produces dicts with an "image" tensor of shape
+    (C, H, W), or with "height" and "width" keys.
+    The padding overhead of each batch, i.e. the ratio of padded pixels to the pixels of
+    the images, is added to the current :class:`EventStorage` as "padding_overhead".
+    """
+
+    def __init__(self, dataset, batch_size, quantum=128, max_buffered=None, size_divisibility=0):
+        """
+        Args:
+            dataset: an iterable of dicts.
+            batch_size (int):
+            quantum (int): images whose height and width fall into the same interval
+                of `quantum` pixels are in the same bucket.
+            max_buffered (int): the maximum number of images to buffer.
+                Defaults to 8 batches.
+            size_divisibility (int): the size divisibility the batch is padded to by
+                :meth:`ImageList.from_tensors`. Only used to compute the padding overhead.
+        """
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.quantum = quantum
+        if max_buffered is None:
+            max_buffered = batch_size * 8
+        assert max_buffered >= batch_size, (max_buffered, batch_size)
+        self.max_buffered = max_buffered
+        self.size_divisibility = size_divisibility
+        self._buckets = {}
+        self._num_buffered = 0
+
+    @staticmethod
+    def _image_size(d):
+        if "image" in d:
+            return tuple(d["image"].shape[-2:])
+        return d["height"], d["width"]
+
+    def __iter__(self):
+        for d in self.dataset:
+            h, w = self._image_size(d)
+            key = (h // self.quantum, w // self.quantum)
+            bucket = self._buckets.setdefault(key, [])
+            bucket.append(d)
+            self._num_buffered += 1
+            if len(bucket) == self.batch_size:
+                yield self._pop_batch(key)
+            elif self._num_buffered > self.max_buffered:
+                key = max(self._buckets.keys(), key=lambda k: len(self._buckets[k]))
+                yield self._pop_batch(key)
+
+    def _pop_batch(self, key):
+        """
+        Remove a batch of images from the bucket `key` and the buckets closest to it.
+        """
+        batch = []
+        # buckets ordered by their distance to the given bucket, including itself
+        keys = sorted(self._buckets.keys(), key=lambda k: abs(k[0] - key[0]) + abs(k[1] - key[1]))
+        for k in keys:
+            bucket = self._buckets[k]
+            num = min(len(bucket), self.batch_size - len(batch))
+            batch.extend(bucket[:num])
+            del bucket[:num]
+            if not bucket:
+                del self._buckets[k]
+            if len(batch) == self.batch_size:
+                break
+        self._num_buffered -= len(batch)
+        self._put_padding_overhead(batch)
+        return batch
+
+    def _put_padding_overhead(self, batch):
+        try:
+            storage = get_event_storage()
+        except AssertionError:
+            # not in training
+            return
+        sizes = np.asarray([self._image_size(d) for d in batch], dtype=np.float64)
+        max_size = sizes.max(axis=0)
+        if self.size_divisibility > 1:
+            # the same padding as ImageList.from_tensors
+            stride = self.size_divisibility
+            max_size = np.ceil(max_size / stride) * stride
+        padded_area = len(batch) * max_size[0] * max_size[1]
+        area = (sizes[:, 0] * sizes[:, 1]).sum()
+        storage.put_scalar("padding_overhead", padded_area / area - 1)
@@ -57,8 +57,8 @@ class DatasetMapper:
             image_format: an image format supported by :func:`detection_utils.read_image`.
             use_instance_mask: whether to process instance segmentation annotations, if available
             use_keypoint: whether to process keypoint annotations if available
-            instance_mask_format: one of "polygon" or "bitmask". Process instance segmentation
-                masks into this format.
+            instance_mask_format: one of "polygon", "bitmask" or "rle". Process instance
+                segmentation masks into this format.
             keypoint_hflip_indices: see :func:`detection_utils.create_keypoint_hflip_indices`
             precomputed_proposal_topk: if given, will load pre-computed
                 proposals from dataset_dict and keep the top k proposals for each image.
@@ -165,15 +165,15 @@ class DatasetMapper:
                     anno.pop("keypoints", None)
 
             # USER: Implement additional transformations if you have other types of data
-            annos = [
-                utils.transform_instance_annotations(
-                    obj, transforms, image_shape, keypoint_hflip_indices=self.keypoint_hflip_indices
-                )
-                for obj in dataset_dict.pop("annotations")
-                if obj.get("iscrowd", 0) == 0
-            ]
-            instances = utils.annotations_to_instances(
-                annos, image_shape, mask_format=self.instance_mask_format
+            annos = [obj for obj in dataset_dict.pop("annotations") if obj.get("iscrowd", 0) == 0]
+            # Equivalent to transform_instance_annotations + annotations_to_instances,
+            # but transforms all instances together
+            instances = utils.transform_annotations_to_instances(
+                annos,
+                transforms,
+                image_shape,
+                mask_format=self.instance_mask_format,
+                keypoint_hflip_indices=self.keypoint_hflip_indices,
             )
 
             # After transforms such as cropping are applied, the bounding box may no longer
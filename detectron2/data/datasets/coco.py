@@ -1,6 +1,7 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import contextlib
 import datetime
+import hashlib
 import io
 import json
 import logging
@@ -15,6 +16,7 @@ from PIL import Image
 from detectron2.structures import Boxes, BoxMode, PolygonMasks
 
 from .. import DatasetCatalog, MetadataCatalog
+from ..columnar import ColumnarDatasetDicts
 
 """
 This file contains functions to parse COCO-format annotations into dicts in "Detectron2 format".
@@ -23,7 +25,13 @@ This file contains functions to parse COCO-format annotations into dicts in "Det
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["load_coco_json", "load_sem_seg", "convert_to_coco_json", "register_coco_instances"]
+__all__ = [
+    "load_coco_json",
+    "load_coco_json_cached",
+    "load_sem_seg",
+    "convert_to_coco_json",
+    "register_coco_instances",
+]
 
 
 def load_coco_json(json_file, image_root, dataset_name=None, extra_annotation_keys=None):
@@ -205,6 +213,75 @@ Category ids in annotations are not in [1, #categories]! We'll apply a mapping f
     return dataset_dicts
 
 
+def _file_sha1(file_name):
+    sha1 = hashlib.sha1()
+    with PathManager.open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 24), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def load_coco_json_cached(json_file, image_root, dataset_name=None, cache_dir=None):
+    """
+    Same as :func:`load_coco_json`, but the annotations are cached in a compact binary
+    file under `cache_dir`, keyed by the hash of the json file. Later calls load the
+    cache in a fraction of the time needed to parse the json file.
+
+    Args:
+        json_file, image_root, dataset_name: see :func:`load_coco_json`.
+        cache_dir (str): directory of the cache files. If None, the cache file
+            is placed next to `json_file`.
+
+    Returns:
+        ColumnarDatasetDicts: a sequence of dicts in Detectron2 standard dataset dicts format,
+        which are created lazily when accessed. Modifications to the dicts are therefore
+        not preserved. See :class:`ColumnarDatasetDicts` for details.
+    """
+    timer = Timer()
+    if cache_dir is None:
+        cache_dir = os.path.dirname(json_file)
+    # The category ids are mapped to contiguous ids only when dataset_name is given
+    cache_file = os.path.join(
+        cache_dir,
+        "{}-{}.{}.npz".format(
+            os.path.splitext(os.path.basename(json_file))[0],
+            _file_sha1(json_file),
+            "contiguous" if dataset_name is not None else "raw",
+        ),
+    )
+    PathManager.mkdirs(cache_dir)
+    with file_lock(cache_file):
+        if PathManager.exists(cache_file):
+            dataset_dicts = ColumnarDatasetDicts.load(cache_file, image_root)
+            logger.info(
+                "Loaded {} images in COCO format from cache file {} in {:.2f} seconds.".format(
+                    len(dataset_dicts), cache_file, timer.seconds()
+                )
+            )
+        else:
+            columns = ColumnarDatasetDicts.from_dicts(load_coco_json(json_file, "", dataset_name))
+            if dataset_name is not None:
+                # Keep the metadata, so that it can be restored without parsing the json file
+                meta = MetadataCatalog.get(dataset_name)
+                id_map = meta.thing_dataset_id_to_contiguous_id
+                columns["meta_thing_classes"] = np.asarray(meta.thing_classes, dtype=np.str_)
+                columns["meta_thing_dataset_ids"] = np.asarray(sorted(id_map), dtype=np.int64)
+            dataset_dicts = ColumnarDatasetDicts(columns, image_root)
+            logger.info("Caching COCO format annotations at '{}' ...".format(cache_file))
+            tmp_file = cache_file + ".tmp"
+            dataset_dicts.save(tmp_file)
+            shutil.move(tmp_file, cache_file)
+
+    if dataset_name is not None:
+        columns = dataset_dicts.columns
+        meta = MetadataCatalog.get(dataset_name)
+        meta.thing_classes = columns["meta_thing_classes"].tolist()
+        meta.thing_dataset_id_to_contiguous_id = {
+            int(v): i for i, v in enumerate(columns["meta_thing_dataset_ids"])
+        }
+    return dataset_dicts
+
+
 def load_sem_seg(gt_root, image_root, gt_ext="png", image_ext="jpg"):
     """
     Load semantic segmentation datasets. All files under "gt_root" with "gt_ext" extension are
@@ -465,7 +542,15 @@ def register_coco_instances(name, metadata, json_file, image_root):
     assert isinstance(json_file, (str, os.PathLike)), json_file
     assert isinstance(image_root, (str, os.PathLike)), image_root
     # 1. register a function which returns dicts
-    DatasetCatalog.register(name, lambda: load_coco_json(json_file, image_root, name))
+
+    def load_dataset_dicts():
+        # Set $DETECTRON2_COCO_CACHE_DIR to load the annotations from a binary cache
+        cache_dir = os.getenv("DETECTRON2_COCO_CACHE_DIR", "")
+        if cache_dir:
+            return load_coco_json_cached(json_file, image_root, name, cache_dir)
+        return load_coco_json(json_file, image_root, name)
+
+    DatasetCatalog.register(name, load_dataset_dicts)
 
     # 2. Optionally, add metadata about this dataset,
     # since they might be useful in evaluation, visualization or logging
@@ -19,6 +19,7 @@ from detectron2.structures import (
     Instances,
     Keypoints,
     PolygonMasks,
+    RLEMasks,
     RotatedBoxes,
     polygons_to_bitmask,
 )
@@ -33,6 +34,7 @@ __all__ = [
     "transform_proposals",
     "transform_instance_annotations",
     "annotations_to_instances",
+    "transform_annotations_to_instances",
     "annotations_to_instances_rotated",
     "build_augmentation",
     "build_transform_gen",
@@ -366,6 +368,8 @@ def annotations_to_instances(annos, image_size, mask_format="polygon"):
         annos (list[dict]): a list of instance annotations in one image, each
             element for one instance.
         image_size (tuple): height, width
+        mask_format (str): the type of "gt_masks": "polygon" for :class:`PolygonMasks`,
+            "bitmask" for :class:`BitMasks`, or "rle" for :class:`RLEMasks`.
 
     Returns:
         Instances:
@@ -383,37 +387,7 @@ def annotations_to_instances(annos, image_size, mask_format="polygon"):
 
     if len(annos) and "segmentation" in annos[0]:
         segms = [obj["segmentation"] for obj in annos]
-        if mask_format == "polygon":
-            # TODO check type and provide better error
-            masks = PolygonMasks(segms)
-        else:
-            assert mask_format == "bitmask", mask_format
-            masks = []
-            for segm in segms:
-                if isinstance(segm, list):
-                    # polygon
-                    masks.append(polygons_to_bitmask(segm, *image_size))
-                elif isinstance(segm, dict):
-                    # COCO RLE
-                    masks.append(mask_util.decode(segm))
-                elif isinstance(segm, np.ndarray):
-                    assert segm.ndim == 2, "Expect segmentation of 2 dimensions, got {}.".format(
-                        segm.ndim
-                    )
-                    # mask array
-                    masks.append(segm)
-                else:
-                    raise ValueError(
-                        "Cannot convert segmentation of type '{}' to BitMasks!"
-                        "Supported types are: polygons as list[list[float] or ndarray],"
-                        " COCO-style RLE as a dict, or a full-image segmentation mask "
-                        "as a 2D ndarray.".format(type(segm))
-                    )
-            # torch.from_numpy does not support array with negative stride.
-            masks = BitMasks(
-                torch.stack([torch.from_numpy(np.ascontiguousarray(x)) for x in masks])
-            )
-        target.gt_masks = masks
+        target.gt_masks = _segmentations_to_masks(segms, image_size, mask_format)
 
     if len(annos) and "keypoints" in annos[0]:
         kpts = [obj.get("keypoints", []) for obj in annos]
@@ -422,6 +396,170 @@ def annotations_to_instances(annos, image_size, mask_format="polygon"):
     return target
 
 
+def _segmentations_to_masks(segms, image_size, mask_format):
+    """
+    Convert the "segmentation" of all instances in an image to :class:`PolygonMasks`,
+    :class:`BitMasks` or :class:`RLEMasks`, depending on `mask_format`.
+    """
+    if mask_format == "polygon":
+        # TODO check type and provide better error
+        return PolygonMasks(segms)
+    assert mask_format in ["bitmask", "rle"], mask_format
+    masks = []
+    for segm in segms:
+        if isinstance(segm, list):
+            # polygon
+            if mask_format == "rle":
+                masks.append(mask_util.merge(mask_util.frPyObjects(segm, *image_size)))
+            else:
+                masks.append(polygons_to_bitmask(segm, *image_size))
+        elif isinstance(segm, dict):
+            # COCO RLE
+            masks.append(segm if mask_format == "rle" else mask_util.decode(segm))
+        elif isinstance(segm, np.ndarray):
+            assert segm.ndim == 2, "Expect segmentation of 2 dimensions, got {}.".format(segm.ndim)
+            # mask array
+            if mask_format == "rle":
+                masks.append(mask_util.encode(np.asfortranarray(segm, dtype=np.uint8)))
+            else:
+                masks.append(segm)
+        else:
+            raise ValueError(
+                "Cannot convert segmentation of type '{}' to {}!"
+                "Supported types are: polygons as list[list[float] or ndarray],"
+                " COCO-style RLE as a dict, or a full-image segmentation mask "
+                "as a 2D ndarray.".format(
+                    type(segm), "RLEMasks" if mask_format == "rle" else "BitMasks"
+                )
+            )
+    if mask_format == "rle":
+        return RLEMasks(masks)
+    # torch.from_numpy does not support array with negative stride.
+    return BitMasks(torch.stack([torch.from_numpy(np.ascontiguousarray(x)) for x in masks]))
+
+
+def transform_annotations_to_instances(
+    annos, transforms, image_size, *, mask_format="polygon", keypoint_hflip_indices=None
+):
+    """
+    Equivalent to applying :func:`transform_instance_annotations` to every annotation
+    and then calling :func:`annotations_to_instances`, but transforms all boxes, all
+    polygon coordinates and all keypoints of the image together, with a few numpy
+    calls. This is much faster for images with many instances.
+
+    Args:
+        annos (list[dict]): a list of instance annotations in one image, each
+            element for one instance. They are not modified.
+        transforms (TransformList or list[Transform]):
+        image_size (tuple): the height, width of the transformed image
+        mask_format (str): "polygon", "bitmask" or "rle", see :func:`annotations_to_instances`.
+        keypoint_hflip_indices (ndarray[int]): see `create_keypoint_hflip_indices`.
+
+    Returns:
+        Instances: same as the output of :func:`annotations_to_instances`.
+    """
+    if isinstance(transforms, (tuple, list)):
+        transforms = T.TransformList(transforms)
+    target = Instances(image_size)
+
+    # boxes
+    boxes = np.zeros((len(annos), 4), dtype=np.float64)
+    if len(annos):
+        box_modes = np.asarray([int(obj["bbox_mode"]) for obj in annos])
+        converted = []
+        for mode in np.unique(box_modes):
+            idxs = np.nonzero(box_modes == mode)[0]
+            mode_boxes = np.asarray([annos[i]["bbox"] for i in idxs])
+            converted.append(
+                (idxs, BoxMode.convert(mode_boxes, BoxMode(int(mode)), BoxMode.XYXY_ABS))
+            )
+        # Keep the dtype of the inputs, as in transform_instance_annotations
+        boxes = np.zeros((len(annos), 4), dtype=np.result_type(*[b for _, b in converted]))
+        for idxs, mode_boxes in converted:
+            boxes[idxs] = mode_boxes
+        # clip transformed bbox to image size
+        boxes = transforms.apply_box(boxes).clip(min=0)
+        boxes = np.minimum(boxes, list(image_size + image_size)[::-1])
+    target.gt_boxes = Boxes(boxes)
+
+    target.gt_classes = torch.tensor([int(obj["category_id"]) for obj in annos], dtype=torch.int64)
+
+    if len(annos) and "segmentation" in annos[0]:
+        segms = [obj["segmentation"] for obj in annos]
+        polygon_idxs = [i for i, segm in enumerate(segms) if isinstance(segm, list)]
+        polygons = _transform_polygons([segms[i] for i in polygon_idxs], transforms)
+        for i, segm in zip(polygon_idxs, polygons):
+            segms[i] = segm
+        for i, segm in enumerate(segms):
+            if isinstance(segm, dict):
+                # RLE
+                mask = transforms.apply_segmentation(mask_util.decode(segm))
+                assert tuple(mask.shape[:2]) == image_size
+                segms[i] = mask
+            elif not isinstance(segm, list):
+                raise ValueError(
+                    "Cannot transform segmentation of type '{}'!"
+                    "Supported types are: polygons as list[list[float] or ndarray],"
+                    " COCO-style RLE as a dict.".format(type(segm))
+                )
+        target.gt_masks = _segmentations_to_masks(segms, image_size, mask_format)
+
+    if len(annos) and "keypoints" in annos[0]:
+        keypoints = np.asarray([obj["keypoints"] for obj in annos], dtype="float64")
+        keypoints = keypoints.reshape(len(annos), -1, 3)
+        keypoints_xy = transforms.apply_coords(keypoints[:, :, :2].reshape(-1, 2))
+        keypoints_xy = keypoints_xy.reshape(keypoints.shape[0], keypoints.shape[1], 2)
+
+        # Set all out-of-boundary points to "unlabeled"
+        inside = (keypoints_xy >= 0) & (keypoints_xy <= np.array(image_size[::-1]))
+        inside = inside.all(axis=2)
+        keypoints[:, :, :2] = keypoints_xy
+        keypoints[:, :, 2][~inside] = 0
+
+        # This assumes that HorizFlipTransform is the only one that does flip
+        do_hflip = sum(isinstance(t, T.HFlipTransform) for t in transforms.transforms) % 2 == 1
+        if do_hflip:
+            assert keypoint_hflip_indices is not None
+            keypoints = keypoints[:, keypoint_hflip_indices, :]
+
+        # Maintain COCO convention that if visibility == 0 (unlabeled), then x, y = 0
+        keypoints[keypoints[:, :, 2] == 0] = 0
+        target.gt_keypoints = Keypoints(keypoints)
+
+    return target
+
+
+def _transform_polygons(segms, transforms):
+    """
+    Args:
+        segms (list[list[list[float] or ndarray]]): polygons of every instance.
+
+    Returns:
+        list[list[ndarray]]: transformed polygons of every instance.
+    """
+    if any(type(t).apply_polygons is not T.Transform.apply_polygons for t in transforms.transforms):
+        # Some transforms (e.g. crop) need to handle each polygon as a whole
+        ret = []
+        for segm in segms:
+            polygons = [np.asarray(p).reshape(-1, 2) for p in segm]
+            ret.append([p.reshape(-1) for p in transforms.apply_polygons(polygons)])
+        return ret
+    polygons = [np.asarray(p).reshape(-1) for segm in segms for p in segm]
+    # Transform the coordinates of all polygons with one call.
+    # Polygons of different dtypes are transformed separately, so that the results are
+    # the same as transforming each polygon.
+    dtypes = [p.dtype for p in polygons]
+    for dtype in set(dtypes):
+        idxs = [i for i, d in enumerate(dtypes) if d == dtype]
+        coords = np.concatenate([polygons[i] for i in idxs]).reshape(-1, 2)
+        coords = transforms.apply_coords(coords).reshape(-1)
+        coords = np.split(coords, np.cumsum([len(polygons[i]) for i in idxs])[:-1])
+        for i, c in zip(idxs, coords):
+            polygons[i] = c
+    num_polygons = np.cumsum([0] + [len(segm) for segm in segms])
+    return [polygons[start:end] for start, end in zip(num_polygons[:-1], num_polygons[1:])]
+
+
 def annotations_to_instances_rotated(annos, image_size):
     """
     Create an :class:`Instances` object used by the models,
@@ -1,9 +1,10 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 from .distributed_sampler import InferenceSampler, RepeatFactorTrainingSampler, TrainingSampler
-from .grouped_batch_sampler import GroupedBatchSampler
+from .grouped_batch_sampler import GroupedBatchSampler, InferenceGroupedBatchSampler
 
 __all__ = [
     "GroupedBatchSampler",
+    "InferenceGroupedBatchSampler",
     "TrainingSampler",
     "InferenceSampler",
     "RepeatFactorTrainingSampler",
@@ -1,7 +1,6 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import itertools
-import math
-from collections import defaultdict
+import numpy as np
 from typing import Optional
 import torch
 from torch.utils.data.sampler import Sampler
@@ -81,6 +80,7 @@ class RepeatFactorTrainingSampler(Sampler):
         # Split into whole number (_int_part) and fractional (_frac_part) parts.
         self._int_part = torch.trunc(repeat_factors)
         self._frac_part = repeat_factors - self._int_part
+        self._dataset_indices = torch.arange(len(repeat_factors), dtype=torch.int64)
 
     @staticmethod
     def repeat_factors_from_category_frequency(dataset_dicts, repeat_thresh):
@@ -93,39 +93,45 @@ class RepeatFactorTrainingSampler(Sampler):
         See :paper:`lvis` (>= v2) Appendix B.2.
 
         Args:
-            dataset_dicts (list[dict]): annotations in Detectron2 dataset format.
+            dataset_dicts (list[dict] or ColumnarDatasetDicts): annotations in Detectron2
+                dataset format.
             repeat_thresh (float): frequency threshold below which data is repeated.
                 If the frequency is half of `repeat_thresh`, the image will be
                 repeated twice.
 
         Returns:
             torch.Tensor: the i-th element is the repeat factor for the dataset image
-                at index i.
+                at index i. It is 1 for images without annotations.
         """
-        # 1. For each category c, compute the fraction of images that contain it: f(c)
-        category_freq = defaultdict(int)
-        for dataset_dict in dataset_dicts:  # For each image (without repeats)
-            cat_ids = {ann["category_id"] for ann in dataset_dict["annotations"]}
-            for cat_id in cat_ids:
-                category_freq[cat_id] += 1
+        if hasattr(dataset_dicts, "annotation_categories"):
+            image_ids, category_ids = dataset_dicts.annotation_categories()
+        else:
+            num_anns = [len(dataset_dict["annotations"]) for dataset_dict in dataset_dicts]
+            image_ids = np.repeat(np.arange(len(dataset_dicts)), num_anns)
+            category_ids = np.asarray(
+                [ann["category_id"] for d in dataset_dicts for ann in d["annotations"]],
+                dtype=np.int64,
+            )
         num_images = len(dataset_dicts)
-        for k, v in category_freq.items():
-            category_freq[k] = v / num_images
+
+        # 1. For each category c, compute the fraction of images that contain it: f(c)
+        # map category ids (which may be sparse or large) to [0, num_categories)
+        categories, category_ids = np.unique(category_ids, return_inverse=True)
+        num_categories = max(len(categories), 1)
+        # unique (image, category) pairs
+        pairs = np.sort(image_ids.astype(np.int64) * num_categories + category_ids.reshape(-1))
+        pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])] if len(pairs) else pairs
+        pair_images, pair_categories = np.divmod(pairs, num_categories)
+        category_freq = np.bincount(pair_categories, minlength=len(categories)) / num_images
 
         # 2. For each category c, compute the category-level repeat factor:
         #    r(c) = max(1, sqrt(t / f(c)))
-        category_rep = {
-            cat_id: max(1.0, math.sqrt(repeat_thresh / cat_freq))
-            for cat_id, cat_freq in category_freq.items()
-        }
+        category_rep = np.maximum(1.0, np.sqrt(repeat_thresh / category_freq))
 
         # 3. For each image I, compute the image-level repeat factor:
         #    r(I) = max_{c in I} r(c)
-        rep_factors = []
-        for dataset_dict in dataset_dicts:
-            cat_ids = {ann["category_id"] for ann in dataset_dict["annotations"]}
-            rep_factor = max({category_rep[cat_id] for cat_id in cat_ids})
-            rep_factors.append(rep_factor)
+        rep_factors = np.ones((num_images,), dtype=np.float64)
+        np.maximum.at(rep_factors, pair_images, category_rep[pair_categories])
 
         return torch.tensor(rep_factors, dtype=torch.float32)
 
@@ -147,27 +153,23 @@ class RepeatFactorTrainingSampler(Sampler):
         rands = torch.rand(len(self._frac_part), generator=generator)
         rep_factors = self._int_part + (rands < self._frac_part).float()
         # Construct a list of indices in which we repeat images as specified
-        indices = []
-        for dataset_index, rep_factor in enumerate(rep_factors):
-            indices.extend([dataset_index] * int(rep_factor.item()))
-        return torch.tensor(indices, dtype=torch.int64)
+        return torch.repeat_interleave(self._dataset_indices, rep_factors.long())
 
     def __iter__(self):
-        start = self._rank
-        yield from itertools.islice(self._infinite_indices(), start, None, self._world_size)
-
-    def _infinite_indices(self):
         g = torch.Generator()
         g.manual_seed(self._seed)
+        # The position of the first index of the current epoch in the stream of all workers
+        position = 0
         while True:
             # Sample indices with repeats determined by stochastic rounding; each
             # "epoch" may have a slightly different size due to the rounding.
             indices = self._get_epoch_indices(g)
             if self._shuffle:
-                randperm = torch.randperm(len(indices), generator=g)
-                yield from indices[randperm]
-            else:
-                yield from indices
+                indices = indices[torch.randperm(len(indices), generator=g)]
+            # This worker takes every world_size-th index of the stream, starting from rank
+            start = (self._rank - position) % self._world_size
+            yield from indices[start :: self._world_size].tolist()
+            position += len(indices)
 
 
 class InferenceSampler(Sampler):
@@ -176,22 +178,39 @@ class InferenceSampler(Sampler):
     Inference needs to run on the __exact__ set of samples,
     therefore when the total number of samples is not divisible by the number of workers,
     this sampler produces different number of samples on different workers.
+
+    Every worker gets a contiguous shard of the indices. By default the shards have
+    equal number of samples. If the estimated cost of each sample is given, the shards
+    have (approximately) equal total cost instead, so that all workers finish at
+    about the same time.
     """
 
-    def __init__(self, size: int):
+    def __init__(self, size: int, costs=None):
         """
         Args:
             size (int): the total number of data of the underlying dataset to sample from
+            costs (list[float] or None): the estimated (relative) cost of inference of
+                each sample, e.g. the number of pixels. Must be the same across all workers.
         """
         self._size = size
         assert size > 0
         self._rank = comm.get_rank()
         self._world_size = comm.get_world_size()
 
-        shard_size = (self._size - 1) // self._world_size + 1
-        begin = shard_size * self._rank
-        end = min(shard_size * (self._rank + 1), self._size)
-        self._local_indices = range(begin, end)
+        if costs is None:
+            shard_size = (self._size - 1) // self._world_size + 1
+            begin = shard_size * self._rank
+            end = min(shard_size * (self._rank + 1), self._size)
+        else:
+            costs = np.asarray(costs, dtype=np.float64)
+            assert costs.shape == (size,) and np.all(costs >= 0), "Invalid costs!"
+            # a sample belongs to the shard that contains the middle of its cost
+            cost_midpoints = np.cumsum(costs) - costs / 2
+            boundaries = np.arange(self._world_size + 1) * (costs.sum() / self._world_size)
+            begin, end = np.searchsorted(cost_midpoints, boundaries[self._rank : self._rank + 2])
+            if self._rank == self._world_size - 1:
+                end = self._size
+        self._local_indices = range(int(begin), int(end))
 
     def __iter__(self):
         yield from self._local_indices
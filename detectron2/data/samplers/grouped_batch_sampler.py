@@ -45,3 +45,71 @@ class GroupedBatchSampler(BatchSampler):
 
     def __len__(self):
         raise NotImplementedError("len() of GroupedBatchSampler is not well-defined.")
+
+
+class InferenceGroupedBatchSampler(BatchSampler):
+    """
+    Wraps an inference sampler (e.g. :class:`InferenceSampler`) to yield mini-batches
+    of indices whose images have similar aspect ratios, to reduce the padding of
+    batched images.
+
+    The indices produced by the sampler are split into windows of `window_size`
+    consecutive indices. Within each window, indices are sorted by aspect ratio and
+    split into batches. Therefore every index is produced exactly once, and the
+    original order can be restored with a buffer of one window, using :meth:`positions`.
+    """
+
+    def __init__(self, sampler, aspect_ratios, batch_size, window_size=None):
+        """
+        Args:
+            sampler (Sampler): Base sampler, which has a fixed length and produces the
+                same indices every time.
+            aspect_ratios (list[float]): If the sampler produces indices in range [0, N),
+                `aspect_ratios` must be a list of `N` floats which contains the
+                aspect ratio (width / height) of each sample.
+            batch_size (int): Size of mini-batch.
+            window_size (int): number of consecutive indices to group.
+                Defaults to 16 batches.
+        """
+        if not isinstance(sampler, Sampler):
+            raise ValueError(
+                "sampler should be an instance of "
+                "torch.utils.data.Sampler, but got sampler={}".format(sampler)
+            )
+        self.sampler = sampler
+        self.aspect_ratios = np.asarray(aspect_ratios, dtype=np.float64)
+        assert self.aspect_ratios.ndim == 1
+        self.batch_size = batch_size
+        if window_size is None:
+            window_size = batch_size * 16
+        assert window_size >= batch_size, (window_size, batch_size)
+        self.window_size = window_size
+
+    def positions(self):
+        """
+        Returns:
+            list[list[int]]: for each mini-batch, the positions of its indices in the
+            output of the base sampler.
+        """
+        indices = np.asarray(list(self.sampler), dtype=np.int64)
+        ret = []
+        for start in range(0, len(indices), self.window_size):
+            window = np.arange(start, min(start + self.window_size, len(indices)))
+            # a stable sort, so that the order is deterministic
+            window = window[np.argsort(self.aspect_ratios[indices[window]], kind="stable")]
+            ret.extend(
+                window[k : k + self.batch_size].tolist()
+                for k in range(0, len(window), self.batch_size)
+            )
+        return ret
+
+    def __iter__(self):
+        indices = list(self.sampler)
+        for positions in self.positions():
+            yield [indices[k] for k in positions]
+
+    def __len__(self):
+        num_indices = len(self.sampler)
+        num_full_windows, remainder = divmod(num_indices, self.window_size)
+        num_batches_per_window = (self.window_size - 1) // self.batch_size + 1
+        return num_full_windows * num_batches_per_window + (remainder - 1) // self.batch_size + 1
@@ -0,0 +1,159 @@
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import logging
+from collections import namedtuple
+import torch
+import torch.utils.data as data
+
+"""
+Transfer of batches from data loader workers to the main process through
+pre-allocated shared memory.
+"""
+
+__all__ = ["SharedMemoryBatchTransfer"]
+
+
+# A tensor stored in a slot of the shared memory
+_SharedTensor = namedtuple("_SharedTensor", ["slot", "generation", "offset", "dtype", "shape"])
+
+_HEADER_BYTES = 64  # the generation of the slot, padded for alignment
+_ALIGNMENT = 64
+
+
+class SharedMemoryBatchTransfer:
+    """
+    By default, a data loader worker sends every tensor in a batch to the main process by
+    allocating new shared memory for it. For large images, the allocation and the
+    page faults of the new memory take a large share of the data loading time.
+
+    This class instead pre-allocates a ring of `slots_per_worker` slots of shared memory
+    for each worker. :meth:`collate` (called in the workers) copies the tensors of
+    a batch into the next slot of the worker and replaces them with small handles.
+    :meth:`unpack` (called in the main process) copies them out of the slot.
+
+    The tensors that are moved are the tensor values of the dicts in the batch (or of
+    the batch itself, if it is a dict), e.g. "image" and "sem_seg". Tensors that do not
+    fit in a slot are sent as usual.
+
+    It requires a map-style dataset, and relies on the DataLoader to assign batches to
+    workers in a round-robin order and to keep at most `prefetch_factor` batches per worker
+    in flight, so that a slot is only reused after its batch is unpacked.
+    :meth:`unpack` verifies that, and raises an error otherwise.
+
+    Examples:
+    ::
+        transfer = SharedMemoryBatchTransfer(num_workers, 64 * 1024 ** 2)
+        data_loader = DataLoader(..., num_workers=num_workers, collate_fn=transfer.collate)
+        for batch in transfer.wrap(data_loader):
+            ...
+    """
+
+    def __init__(self, num_workers, slot_bytes, collate_fn=None, prefetch_factor=2):
+        """
+        Args:
+            num_workers (int): number of workers of the data loader.
+            slot_bytes (int): size of the shared memory used by one batch.
+            collate_fn (callable): the collate function to call before moving tensors
+                to the shared memory. Defaults to returning the batch as is.
+            prefetch_factor (int): the `prefetch_factor` of the data loader.
+        """
+        assert num_workers > 0, num_workers
+        self._slots_per_worker = prefetch_factor + 2
+        self._slot_bytes = (slot_bytes // _ALIGNMENT) * _ALIGNMENT
+        assert self._slot_bytes > _HEADER_BYTES, slot_bytes
+        self._collate_fn = collate_fn
+        num_slots = num_workers * self._slots_per_worker
+        self._buffer = torch.zeros(num_slots * self._slot_bytes, dtype=torch.uint8)
+        self._buffer.share_memory_()
+        self._num_batches = 0  # number of batches collated by this worker
+        logger = logging.getLogger(__name__)
+        logger.info(
+            "Allocated {:.2f} MiB of shared memory for data loader workers.".format(
+                self._buffer.numel() / 1024 ** 2
+            )
+        )
+
+    def _slot_header(self, slot):
+        start = slot * self._slot_bytes
+        return self._buffer[start : start + 8].view(torch.int64)
+
+    def _slot_tensor(self, slot, offset, dtype, shape):
+        start = slot * self._slot_bytes + offset
+        nbytes = torch.Size(shape).numel() * torch.empty((), dtype=dtype).element_size()
+        return self._buffer[start : start + nbytes].view(dtype).view(shape)
+
+    def collate(self, batch):
+        """
+        Collate function to be used by the data loader.
+        """
+        if self._collate_fn is not None:
+            batch = self._collate_fn(batch)
+        worker_info = data.get_worker_info()
+        if worker_info is None:
+            return batch
+        slot = worker_info.id * self._slots_per_worker + (
+            self._num_batches % self._slots_per_worker
+        )
+        self._num_batches += 1
+        generation = self._num_batches
+        # Mark the slot as overwritten before writing to it
+        self._slot_header(slot).fill_(generation)
+
+        offset = _HEADER_BYTES
+
+        def move(d):
+            nonlocal offset
+            if not isinstance(d, dict):
+                return d
+            d = dict(d)
+            for k, v in d.items():
+                if not isinstance(v, torch.Tensor):
+                    continue
+                nbytes = v.numel() * v.element_size()
+                if offset + nbytes > self._slot_bytes:
+                    continue
+                self._slot_tensor(slot, offset, v.dtype, v.shape).copy_(v)
+                d[k] = _SharedTensor(slot, generation, offset, v.dtype, tuple(v.shape))
+                offset += (nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+            return d
+
+        if isinstance(batch, dict):
+            return move(batch)
+        return [move(d) for d in batch]
+
+    def unpack(self, batch):
+        """
+        Replace the handles in a batch produced by :meth:`collate` with tensors.
+        """
+        for d in [batch] if isinstance(batch, dict) else batch:
+            if not isinstance(d, dict):
+                continue
+            for k, v in d.items():
+                if not isinstance(v, _SharedTensor):
+                    continue
+                d[k] = self._slot_tensor(v.slot, v.offset, v.dtype, v.shape).clone()
+                if self._slot_header(v.slot).item() != v.generation:
+                    raise RuntimeError(
+                        "Shared memory of the batch was overwritten by the data loader worker! "
+                        "Make sure the data loader uses the same prefetch_factor."
+                    )
+        return batch
+
+    def wrap(self, data_loader):
+        """
+        Returns:
+            iterable: the batches of `data_loader` after :meth:`unpack`.
+        """
+        return _MapIterable(data_loader, self.unpack)
+
+
+class _MapIterable(data.IterableDataset):
+    def __init__(self, iterable, func):
+        self._iterable = iterable
+        self._func = func
+
+    def __iter__(self):
+        for x in self._iterable:
+            yield self._func(x)
+
+    def __len__(self):
+        return len(self._iterable)
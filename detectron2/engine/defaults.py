@@ -12,8 +12,12 @@ since they are meant to represent the "common default behavior" people need in t
 import argparse
 import logging
 import os
+import queue
 import sys
+import threading
+import time
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import torch
 from fvcore.common.file_io import PathManager
 from fvcore.nn.precise_bn import get_bn_modules
@@ -43,7 +47,13 @@ from detectron2.utils.logger import setup_logger
 from . import hooks
 from .train_loop import SimpleTrainer
 
-__all__ = ["default_argument_parser", "default_setup", "DefaultPredictor", "DefaultTrainer"]
+__all__ = [
+    "default_argument_parser",
+    "default_setup",
+    "DefaultPredictor",
+    "BatchPredictor",
+    "DefaultTrainer",
+]
 
 
 def default_argument_parser(epilog=None):
@@ -211,18 +221,200 @@ class DefaultPredictor:
                 See :doc:`/tutorials/models` for details about the format.
         """
         with torch.no_grad():  # https://github.com/sphinx-doc/sphinx/issues/4258
-            # Apply pre-processing to image.
-            if self.input_format == "RGB":
-                # whether the model expects BGR inputs or RGB
-                original_image = original_image[:, :, ::-1]
-            height, width = original_image.shape[:2]
-            image = self.aug.get_transform(original_image).apply_image(original_image)
-            image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
-
-            inputs = {"image": image, "height": height, "width": width}
+            inputs = self._preprocess(original_image)
             predictions = self.model([inputs])[0]
             return predictions
 
+    def _preprocess(self, original_image):
+        """
+        Returns:
+            dict: the input of the model for one image.
+        """
+        # Apply pre-processing to image.
+        if self.input_format == "RGB":
+            # whether the model expects BGR inputs or RGB
+            original_image = original_image[:, :, ::-1]
+        height, width = original_image.shape[:2]
+        image = self.aug.get_transform(original_image).apply_image(original_image)
+        image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+        return {"image": image, "height": height, "width": width}
+
+
+class BatchPredictor(DefaultPredictor):
+    """
+    A predictor for serving, which runs the model on batches of images submitted
+    from multiple threads.
+
+    Compared to :class:`DefaultPredictor`, it does the following additions:
+
+    1. Images are pre-processed by a pool of worker threads.
+    2. A background thread forms a batch from the queued images once `max_batch_size`
+       images are available, or `max_wait` seconds after the first image of the batch
+       is submitted, and runs the model once on the batch.
+    3. :meth:`submit` returns a future of the output of each image, and :meth:`stats`
+       reports the latency of each stage and the throughput.
+
+    Examples:
+    ::
+        pred = BatchPredictor(cfg, max_batch_size=8)
+        futures = [pred.submit(cv2.imread(f)) for f in files]
+        outputs = [f.result() for f in futures]
+        pred.close()
+    """
+
+    _STAGES = ["queue", "preprocess", "model", "total"]
+
+    def __init__(self, cfg, max_batch_size=8, max_wait=0.005, num_workers=2):
+        """
+        Args:
+            cfg (CfgNode):
+            max_batch_size (int): maximum number of images in one batch.
+            max_wait (float): maximum time in seconds to wait for more images after
+                the first image of a batch is submitted.
+            num_workers (int): number of threads to pre-process images.
+        """
+        super().__init__(cfg)
+        assert max_batch_size >= 1 and num_workers >= 1, (max_batch_size, num_workers)
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._preprocess_pool = ThreadPoolExecutor(num_workers)
+        self._queue = queue.Queue()
+        self._closed = False
+        # Makes the check of `_closed` and the enqueue in `submit` atomic w.r.t. `close`,
+        # so that no image is enqueued after the sentinel that stops the background thread
+        self._close_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._stage_times = {k: 0.0 for k in self._STAGES}
+        self._num_images = 0
+        self._num_batches = 0
+        self._first_submit_time = None
+        self._last_finish_time = None
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, original_image):
+        """
+        Args:
+            original_image (np.ndarray): an image of shape (H, W, C) (in BGR order).
+
+        Returns:
+            concurrent.futures.Future: the future of the output of the model for the image.
+        """
+        submit_time = time.perf_counter()
+        result = Future()
+        with self._close_lock:
+            assert not self._closed, "Cannot submit images to a closed BatchPredictor!"
+            with self._stats_lock:
+                if self._first_submit_time is None:
+                    self._first_submit_time = submit_time
+            preprocessed = self._preprocess_pool.submit(self._timed_preprocess, original_image)
+            self._queue.put((preprocessed, result, submit_time))
+        return result
+
+    def __call__(self, original_image):
+        """
+        Same as :meth:`DefaultPredictor.__call__`, but the image may be batched with
+        images from other threads.
+        """
+        return self.submit(original_image).result()
+
+    def close(self):
+        """
+        Run the model on all submitted images and stop the background threads.
+        """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        self._preprocess_pool.shutdown()
+
+    def stats(self):
+        """
+        Returns:
+            dict: the number of images and batches processed so far, the average batch
+            size, the throughput in images per second, and the average latency in seconds
+            of each stage per image: "queue" (from submission to the start of the batch),
+            "preprocess", "model" (of the batch that contains the image) and "total".
+        """
+        with self._stats_lock:
+            num_images = self._num_images
+            ret = {
+                "num_images": num_images,
+                "num_batches": self._num_batches,
+                "avg_batch_size": num_images / max(self._num_batches, 1),
+            }
+            if self._last_finish_time is not None:
+                duration = self._last_finish_time - self._first_submit_time
+                ret["throughput"] = num_images / max(duration, 1e-9)
+            for k in self._STAGES:
+                ret["latency/" + k] = self._stage_times[k] / max(num_images, 1)
+        return ret
+
+    def _timed_preprocess(self, original_image):
+        start = time.perf_counter()
+        inputs = self._preprocess(original_image)
+        return inputs, time.perf_counter() - start
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = item[2] + self._max_wait
+            while len(batch) < self._max_batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        inputs, results, preprocess_time = [], [], 0.0
+        for preprocessed, result, submit_time in batch:
+            try:
+                x, seconds = preprocessed.result()
+            except Exception as e:
+                result.set_exception(e)
+                continue
+            inputs.append(x)
+            results.append((result, submit_time))
+            preprocess_time += seconds
+        if not inputs:
+            return
+
+        model_start = time.perf_counter()
+        try:
+            with torch.no_grad():
+                outputs = self.model(inputs)
+        except Exception as e:
+            for result, _ in results:
+                result.set_exception(e)
+            return
+        end = time.perf_counter()
+
+        with self._stats_lock:
+            self._num_images += len(results)
+            self._num_batches += 1
+            self._last_finish_time = end
+            self._stage_times["preprocess"] += preprocess_time
+            self._stage_times["model"] += (end - model_start) * len(results)
+            for _, submit_time in results:
+                self._stage_times["queue"] += start - submit_time
+                self._stage_times["total"] += end - submit_time
+        for (result, _), output in zip(results, outputs):
+            result.set_result(output)
+
 
 class DefaultTrainer(SimpleTrainer):
     """
@@ -524,7 +716,18 @@ Alternatively, you can call evaluation functions yourself (see Colab balloon tut
                     )
                     results[dataset_name] = {}
                     continue
-            results_i = inference_on_dataset(model, data_loader, evaluator)
+            timings_file = None
+            if cfg.TEST.DUMP_INFERENCE_TIMINGS:
+                timings_file = os.path.join(
+                    cfg.OUTPUT_DIR, "inference_timings_{}.json".format(dataset_name)
+                )
+            results_i = inference_on_dataset(
+                model,
+                data_loader,
+                evaluator,
+                pipelined=cfg.TEST.PIPELINED_EVAL,
+                timings_file=timings_file,
+            )
             results[dataset_name] = results_i
             if comm.is_main_process():
                 assert isinstance(
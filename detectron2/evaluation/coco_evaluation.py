@@ -20,13 +20,13 @@ import detectron2.utils.comm as comm
 from detectron2.data import MetadataCatalog
 from detectron2.data.datasets.coco import convert_to_coco_json
 from detectron2.evaluation.fast_eval_api import COCOeval_opt
-from detectron2.structures import Boxes, BoxMode, pairwise_iou
+from detectron2.structures import Boxes, BoxMode, Instances, RLEMasks, pairwise_iou
 from detectron2.utils.logger import create_small_table
 
-from .evaluator import DatasetEvaluator
+from .evaluator import BackgroundDatasetEvaluator
 
 
-class COCOEvaluator(DatasetEvaluator):
+class COCOEvaluator(BackgroundDatasetEvaluator):
     """
     Evaluate AR for object proposals, AP for instance detection/segmentation, AP
     for keypoint detection outputs using COCO's metrics.
@@ -37,7 +37,17 @@ class COCOEvaluator(DatasetEvaluator):
     instance segmentation, or keypoint detection dataset.
     """
 
-    def __init__(self, dataset_name, cfg, distributed, output_dir=None, *, use_fast_impl=True):
+    def __init__(
+        self,
+        dataset_name,
+        cfg,
+        distributed,
+        output_dir=None,
+        *,
+        use_fast_impl=True,
+        shard_dir=None,
+        num_workers=0,
+    ):
         """
         Args:
             dataset_name (str): name of the dataset to be evaluated.
@@ -62,11 +72,31 @@ class COCOEvaluator(DatasetEvaluator):
                 Although the results should be very close to the official implementation in COCO
                 API, it is still recommended to compute results with the official API for use in
                 papers.
+            shard_dir (str): if given, every rank writes its predictions to a file in this
+                directory as soon as they arrive, instead of keeping them in memory.
+                The main process then reads the files of all ranks and evaluates them image
+                by image, without gathering the predictions of the whole dataset in memory.
+                The directory must be accessible by the main process (e.g., on a shared file
+                system in multi-machine inference). It requires `use_fast_impl=True`.
+                In this mode "instances_predictions.pth" is not dumped: the files in
+                `shard_dir` contain the raw predictions.
+            num_workers (int): if positive, the predictions of each image are matched to the
+                ground truth by this many background threads as soon as they are processed,
+                overlapping with inference. :meth:`evaluate` then only accumulates the
+                results. It requires `use_fast_impl=True` and cannot be used with `shard_dir`.
         """
+        super().__init__(num_workers=num_workers)
         self._tasks = self._tasks_from_config(cfg)
         self._distributed = distributed
         self._output_dir = output_dir
         self._use_fast_impl = use_fast_impl
+        self._shard_dir = shard_dir
+        self._shard_file = None
+        if shard_dir is not None or num_workers > 0:
+            assert use_fast_impl, "shard_dir and num_workers require the fast implementation!"
+            assert (
+                shard_dir is None or num_workers == 0
+            ), "Cannot use both shard_dir and num_workers!"
 
         self._cpu_device = torch.device("cpu")
         self._logger = logging.getLogger(__name__)
@@ -87,12 +117,40 @@ class COCOEvaluator(DatasetEvaluator):
             self._coco_api = COCO(json_file)
 
         self._kpt_oks_sigmas = cfg.TEST.KEYPOINT_OKS_SIGMAS
+        self._num_threads = cfg.TEST.EVAL_NUM_THREADS
         # Test set json files do not contain annotations (evaluation must be
         # performed using the COCO evaluation server).
         self._do_evaluation = "annotations" in self._coco_api.dataset
+        self._incremental = num_workers > 0 and self._do_evaluation
 
     def reset(self):
+        super().reset()
         self._predictions = []
+        # COCOeval_opt and the results of per image evaluation of each task,
+        # used when matching is done in background threads
+        self._coco_evals = {}
+        self._image_evaluations = {}
+        if self._incremental:
+            for task in self._tasks:
+                coco_eval = _create_coco_eval(
+                    self._coco_api, task, self._kpt_oks_sigmas, self._num_threads
+                )
+                with contextlib.redirect_stdout(io.StringIO()):
+                    coco_eval.begin_image_evaluation()
+                self._coco_evals[task] = coco_eval
+                self._image_evaluations[task] = {}
+        if self._shard_dir is not None:
+            self._close_shard()
+            PathManager.mkdirs(self._shard_dir)
+            self._shard_file = PathManager.open(self._shard_path(comm.get_rank()), "wb")
+
+    def _shard_path(self, rank):
+        return os.path.join(self._shard_dir, "instances_predictions_rank{}.pkl".format(rank))
+
+    def _close_shard(self):
+        if self._shard_file is not None:
+            self._shard_file.close()
+            self._shard_file = None
 
     def _tasks_from_config(self, cfg):
         """
@@ -121,15 +179,51 @@ class COCOEvaluator(DatasetEvaluator):
             if "instances" in output:
                 instances = output["instances"].to(self._cpu_device)
                 prediction["instances"] = instances_to_coco_json(instances, input["image_id"])
+                if self._incremental:
+                    # Copy the results, which are modified by evaluation
+                    coco_results = [dict(result) for result in prediction["instances"]]
+                    self.submit(self._evaluate_image, input["image_id"], coco_results)
             if "proposals" in output:
                 prediction["proposals"] = output["proposals"].to(self._cpu_device)
-            self._predictions.append(prediction)
+            if self._shard_file is not None:
+                pickle.dump(prediction, self._shard_file, protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                self._predictions.append(prediction)
+        self._collect_image_evaluations(wait=False)
+
+    def _evaluate_image(self, img_id, coco_results):
+        """
+        Match the coco results of one image for every task. Runs in background threads.
+        """
+        self._unmap_category_ids(coco_results)
+        return img_id, {
+            task: coco_eval.evaluate_image(
+                img_id, _prepare_image_results(coco_eval, self._coco_api, coco_results)
+            )
+            for task, coco_eval in self._coco_evals.items()
+        }
+
+    def _collect_image_evaluations(self, wait):
+        for img_id, evaluations in self.collect(wait=wait):
+            for task, evaluation in evaluations.items():
+                self._image_evaluations[task][img_id] = evaluation
 
     def evaluate(self):
+        if self._shard_dir is not None:
+            return self._evaluate_shards()
+
+        self._collect_image_evaluations(wait=True)
         if self._distributed:
             comm.synchronize()
             predictions = comm.gather(self._predictions, dst=0)
             predictions = list(itertools.chain(*predictions))
+            if self._incremental:
+                image_evaluations = comm.gather(self._image_evaluations, dst=0)
+                if comm.is_main_process():
+                    self._image_evaluations = {
+                        task: dict(itertools.chain(*[x[task].items() for x in image_evaluations]))
+                        for task in self._image_evaluations
+                    }
 
             if not comm.is_main_process():
                 return {}
@@ -154,15 +248,37 @@ class COCOEvaluator(DatasetEvaluator):
         # Copy so the caller can do whatever with results
         return copy.deepcopy(self._results)
 
-    def _eval_predictions(self, tasks, predictions):
+    def _evaluate_shards(self):
         """
-        Evaluate predictions on the given tasks.
-        Fill self._results with the metrics of the tasks.
+        Same as :meth:`evaluate`, but reads the predictions from the files in `shard_dir`.
         """
-        self._logger.info("Preparing results for COCO format ...")
-        coco_results = list(itertools.chain(*[x["instances"] for x in predictions]))
+        self._close_shard()
+        if self._distributed:
+            comm.synchronize()
+            if not comm.is_main_process():
+                return {}
+            ranks = range(comm.get_world_size())
+        else:
+            ranks = [comm.get_rank()]
+        predictions = _ShardedPredictions([self._shard_path(rank) for rank in ranks])
 
-        # unmap the category ids for COCO
+        first_prediction = next(iter(predictions), None)
+        if first_prediction is None:
+            self._logger.warning("[COCOEvaluator] Did not receive valid predictions.")
+            return {}
+
+        self._results = OrderedDict()
+        if "proposals" in first_prediction:
+            self._eval_box_proposals(predictions)
+        if "instances" in first_prediction:
+            self._eval_sharded_predictions(set(self._tasks), predictions)
+        # Copy so the caller can do whatever with results
+        return copy.deepcopy(self._results)
+
+    def _unmap_category_ids(self, coco_results):
+        """
+        Unmap the category ids of results in place, for COCO.
+        """
         if hasattr(self._metadata, "thing_dataset_id_to_contiguous_id"):
             reverse_id_mapping = {
                 v: k for k, v in self._metadata.thing_dataset_id_to_contiguous_id.items()
@@ -176,6 +292,17 @@ class COCOEvaluator(DatasetEvaluator):
                 )
                 result["category_id"] = reverse_id_mapping[category_id]
 
+    def _eval_predictions(self, tasks, predictions):
+        """
+        Evaluate predictions on the given tasks.
+        Fill self._results with the metrics of the tasks.
+        """
+        self._logger.info("Preparing results for COCO format ...")
+        coco_results = list(itertools.chain(*[x["instances"] for x in predictions]))
+
+        # unmap the category ids for COCO
+        self._unmap_category_ids(coco_results)
+
         if self._output_dir:
             file_path = os.path.join(self._output_dir, "coco_instances_results.json")
             self._logger.info("Saving results to {}".format(file_path))
@@ -193,18 +320,72 @@ class COCOEvaluator(DatasetEvaluator):
             )
         )
         for task in sorted(tasks):
-            coco_eval = (
-                _evaluate_predictions_on_coco(
+            if len(coco_results) == 0:
+                coco_eval = None  # cocoapi does not handle empty results very well
+            elif task in self._coco_evals:
+                # The images are already matched in background threads
+                coco_eval = self._coco_evals[task]
+                with contextlib.redirect_stdout(io.StringIO()):
+                    coco_eval.end_image_evaluation(self._image_evaluations[task])
+                coco_eval.accumulate()
+                coco_eval.summarize()
+            else:
+                coco_eval = _evaluate_predictions_on_coco(
                     self._coco_api,
                     coco_results,
                     task,
                     kpt_oks_sigmas=self._kpt_oks_sigmas,
                     use_fast_impl=self._use_fast_impl,
+                    num_threads=self._num_threads,
                 )
-                if len(coco_results) > 0
-                else None  # cocoapi does not handle empty results very well
+
+            res = self._derive_coco_results(
+                coco_eval, task, class_names=self._metadata.get("thing_classes")
             )
+            self._results[task] = res
+
+    def _eval_sharded_predictions(self, tasks, predictions):
+        """
+        Same as :meth:`_eval_predictions`, but streams the predictions image by image.
+
+        Args:
+            predictions (_ShardedPredictions):
+        """
+
+        def iter_coco_results():
+            for prediction in predictions:
+                coco_results = prediction["instances"]
+                self._unmap_category_ids(coco_results)
+                yield coco_results
 
+        if self._output_dir:
+            PathManager.mkdirs(self._output_dir)
+            file_path = os.path.join(self._output_dir, "coco_instances_results.json")
+            self._logger.info("Saving results to {}".format(file_path))
+            with PathManager.open(file_path, "w") as f:
+                # Produces the same file as json.dumps(list_of_all_results)
+                f.write("[")
+                separator = ""
+                for coco_results in iter_coco_results():
+                    for result in coco_results:
+                        f.write(separator + json.dumps(result))
+                        separator = ", "
+                f.write("]")
+                f.flush()
+
+        if not self._do_evaluation:
+            self._logger.info("Annotations are not available for evaluation.")
+            return
+
+        self._logger.info("Evaluating predictions image by image with unofficial COCO API...")
+        for task in sorted(tasks):
+            coco_eval = _evaluate_predictions_on_coco_stream(
+                self._coco_api,
+                iter_coco_results(),
+                task,
+                kpt_oks_sigmas=self._kpt_oks_sigmas,
+                num_threads=self._num_threads,
+            )
             res = self._derive_coco_results(
                 coco_eval, task, class_names=self._metadata.get("thing_classes")
             )
@@ -215,16 +396,20 @@ class COCOEvaluator(DatasetEvaluator):
         Evaluate the box proposals in predictions.
         Fill self._results with the metrics for "box_proposals" task.
         """
+        # Extract the proposals in one pass, since iterating over sharded predictions
+        # reads all the files again
+        ids, image_sizes, boxes, objectness_logits = [], [], [], []
+        for prediction in predictions:
+            ids.append(prediction["image_id"])
+            image_sizes.append(prediction["proposals"].image_size)
+            boxes.append(prediction["proposals"].proposal_boxes.tensor.numpy())
+            objectness_logits.append(prediction["proposals"].objectness_logits.numpy())
+
         if self._output_dir:
             # Saving generated box proposals to file.
             # Predicted box_proposals are in XYXY_ABS mode.
             bbox_mode = BoxMode.XYXY_ABS.value
-            ids, boxes, objectness_logits = [], [], []
-            for prediction in predictions:
-                ids.append(prediction["image_id"])
-                boxes.append(prediction["proposals"].proposal_boxes.tensor.numpy())
-                objectness_logits.append(prediction["proposals"].objectness_logits.numpy())
-
+            PathManager.mkdirs(self._output_dir)
             proposal_data = {
                 "boxes": boxes,
                 "objectness_logits": objectness_logits,
@@ -239,6 +424,19 @@ class COCOEvaluator(DatasetEvaluator):
             return
 
         self._logger.info("Evaluating bbox proposals ...")
+        predictions = [
+            {
+                "image_id": image_id,
+                "proposals": Instances(
+                    image_size,
+                    proposal_boxes=Boxes(torch.from_numpy(image_boxes)),
+                    objectness_logits=torch.from_numpy(image_logits),
+                ),
+            }
+            for image_id, image_size, image_boxes, image_logits in zip(
+                ids, image_sizes, boxes, objectness_logits
+            )
+        ]
         res = {}
         areas = {"all": "", "small": "s", "medium": "m", "large": "l"}
         for limit in [100, 1000]:
@@ -318,6 +516,25 @@ class COCOEvaluator(DatasetEvaluator):
         return results
 
 
+class _ShardedPredictions:
+    """
+    An iterable over the predictions that ranks have written to files with pickle.
+    Every iteration reads the files again, so only one prediction is in memory at a time.
+    """
+
+    def __init__(self, files):
+        self._files = files
+
+    def __iter__(self):
+        for file in self._files:
+            with PathManager.open(file, "rb") as f:
+                while True:
+                    try:
+                        yield pickle.load(f)
+                    except EOFError:
+                        break
+
+
 def instances_to_coco_json(instances, img_id):
     """
     Dump an "Instances" object to a COCO-format json that's used for evaluation.
@@ -343,10 +560,13 @@ def instances_to_coco_json(instances, img_id):
     if has_mask:
         # use RLE to encode the masks, because they are too large and takes memory
         # since this evaluator stores outputs of the entire dataset
-        rles = [
-            mask_util.encode(np.array(mask[:, :, None], order="F", dtype="uint8"))[0]
-            for mask in instances.pred_masks
-        ]
+        if isinstance(instances.pred_masks, RLEMasks):
+            rles = [dict(rle) for rle in instances.pred_masks]
+        else:
+            rles = [
+                mask_util.encode(np.array(mask[:, :, None], order="F", dtype="uint8"))[0]
+                for mask in instances.pred_masks
+            ]
         for rle in rles:
             # "counts" is an array encoded by mask_util as a byte-stream. Python3's
             # json writer which always produces strings cannot serialize a bytestream
@@ -494,7 +714,7 @@ def _evaluate_box_proposals(dataset_predictions, coco_api, thresholds=None, area
 
 
 def _evaluate_predictions_on_coco(
-    coco_gt, coco_results, iou_type, kpt_oks_sigmas=None, use_fast_impl=True
+    coco_gt, coco_results, iou_type, kpt_oks_sigmas=None, use_fast_impl=True, num_threads=1
 ):
     """
     Evaluate the coco results using COCOEval API.
@@ -511,7 +731,10 @@ def _evaluate_predictions_on_coco(
             c.pop("bbox", None)
 
     coco_dt = coco_gt.loadRes(coco_results)
-    coco_eval = (COCOeval_opt if use_fast_impl else COCOeval)(coco_gt, coco_dt, iou_type)
+    if use_fast_impl:
+        coco_eval = COCOeval_opt(coco_gt, coco_dt, iou_type, num_threads=num_threads)
+    else:
+        coco_eval = COCOeval(coco_gt, coco_dt, iou_type)
 
     if iou_type == "keypoints":
         # Use the COCO default keypoint OKS sigmas unless overrides are specified
@@ -536,3 +759,62 @@ def _evaluate_predictions_on_coco(
     coco_eval.summarize()
 
     return coco_eval
+
+
+def _create_coco_eval(coco_gt, iou_type, kpt_oks_sigmas=None, num_threads=1):
+    """
+    Create a :class:`COCOeval_opt` without detections, to evaluate detections image by image.
+    """
+    coco_eval = COCOeval_opt(coco_gt, iouType=iou_type, num_threads=num_threads)
+    if iou_type == "keypoints" and kpt_oks_sigmas:
+        # Use the COCO default keypoint OKS sigmas unless overrides are specified
+        assert hasattr(coco_eval.params, "kpt_oks_sigmas"), "pycocotools is too old!"
+        coco_eval.params.kpt_oks_sigmas = np.array(kpt_oks_sigmas)
+    return coco_eval
+
+
+def _prepare_image_results(coco_eval, coco_gt, coco_results):
+    """
+    Prepare the coco results of one image for :meth:`COCOeval_opt.evaluate_image`,
+    the same way as :func:`_evaluate_predictions_on_coco`.
+
+    Returns:
+        list[dict]: the results to be evaluated. They may share objects with `coco_results`.
+    """
+    iou_type = coco_eval.params.iouType
+    if iou_type == "segm":
+        # Let mask AP use mask area, see _evaluate_predictions_on_coco
+        return [{k: v for k, v in c.items() if k != "bbox"} for c in coco_results]
+    if iou_type == "keypoints" and len(coco_results):
+        num_keypoints_dt = len(coco_results[0]["keypoints"]) // 3
+        num_keypoints_gt = len(next(iter(coco_gt.anns.values()))["keypoints"]) // 3
+        num_keypoints_oks = len(coco_eval.params.kpt_oks_sigmas)
+        assert num_keypoints_oks == num_keypoints_dt == num_keypoints_gt, (
+            f"[COCOEvaluator] Prediction contain {num_keypoints_dt} keypoints. "
+            f"Ground truth contains {num_keypoints_gt} keypoints. "
+            f"The length of cfg.TEST.KEYPOINT_OKS_SIGMAS is {num_keypoints_oks}. "
+            "They have to agree with each other."
+        )
+    return [dict(c) for c in coco_results]
+
+
+def _evaluate_predictions_on_coco_stream(
+    coco_gt, image_results, iou_type, kpt_oks_sigmas=None, num_threads=1
+):
+    """
+    Evaluate the coco results of each image using :meth:`COCOeval_opt.evaluate_stream`.
+
+    Args:
+        image_results (iterable[list[dict]]): the coco results, grouped by image.
+
+    Returns:
+        COCOeval_opt or None: None if there are no results at all.
+    """
+    coco_eval = _create_coco_eval(coco_gt, iou_type, kpt_oks_sigmas, num_threads)
+    image_results = (_prepare_image_results(coco_eval, coco_gt, x) for x in image_results)
+    if coco_eval.evaluate_stream(image_results) == 0:
+        # cocoapi does not handle empty results very well
+        return None
+    coco_eval.accumulate()
+    coco_eval.summarize()
+    return coco_eval
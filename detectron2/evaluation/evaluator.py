@@ -1,12 +1,17 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import datetime
+import json
 import logging
+import os
 import time
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
 import torch
+from fvcore.common.file_io import PathManager
 
-from detectron2.utils.comm import get_world_size, is_main_process
+from detectron2.data.samplers import InferenceGroupedBatchSampler
+from detectron2.utils.comm import gather, get_world_size, is_main_process
 from detectron2.utils.logger import log_every_n_seconds
 
 
@@ -61,6 +66,73 @@ class DatasetEvaluator:
         pass
 
 
+class BackgroundDatasetEvaluator(DatasetEvaluator):
+    """
+    Base class for evaluators that do the expensive per-image part of their work (e.g.,
+    matching predictions to ground truth) in a pool of background threads, while
+    :func:`inference_on_dataset` keeps running the model on the following inputs.
+    :meth:`evaluate` then only needs to aggregate the per-image results.
+
+    Subclasses call :meth:`submit` in :meth:`process` to schedule the work, and obtain
+    its results with :meth:`collect`. Python code in the work competes with the model
+    for the GIL, so the work should spend most of its time in numpy or C++ code.
+    """
+
+    def __init__(self, num_workers=1):
+        """
+        Args:
+            num_workers (int): number of background threads. If 0, the work is done
+                immediately in :meth:`submit`.
+        """
+        self._num_workers = num_workers
+        self._executor = None
+        self._pending = []
+
+    def reset(self):
+        if self._num_workers > 0 and self._executor is None:
+            self._executor = ThreadPoolExecutor(self._num_workers)
+        # Wait for the work of a previous round, if any
+        for future in self._pending:
+            future.exception()
+        self._pending = []
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedule `func(*args, **kwargs)` to run in a background thread.
+        It blocks if too much work has not finished yet, so that the inputs and outputs
+        held by the pending work do not take unbounded memory.
+        """
+        if self._executor is None:
+            future = Future()
+            future.set_result(func(*args, **kwargs))
+        else:
+            max_pending = 4 * self._num_workers
+            if len(self._pending) >= max_pending:
+                self._pending[-max_pending].exception()
+            future = self._executor.submit(func, *args, **kwargs)
+        self._pending.append(future)
+
+    def collect(self, wait=True):
+        """
+        Args:
+            wait (bool): whether to wait for all the submitted work to finish.
+                If False, only returns the results that are already available.
+
+        Returns:
+            list: results of the submitted work, in the order of submission. Each result
+            is only returned once. Subclasses should call it with `wait=False` in
+            :meth:`process` to release the memory held by finished work.
+        """
+        num_done = len(self._pending)
+        if not wait:
+            num_done = next(
+                (k for k, future in enumerate(self._pending) if not future.done()), num_done
+            )
+        results = [future.result() for future in self._pending[:num_done]]
+        self._pending = self._pending[num_done:]
+        return results
+
+
 class DatasetEvaluators(DatasetEvaluator):
     """
     Wrapper class to combine multiple :class:`DatasetEvaluator` instances.
@@ -98,7 +170,7 @@ class DatasetEvaluators(DatasetEvaluator):
         return results
 
 
-def inference_on_dataset(model, data_loader, evaluator):
+def inference_on_dataset(model, data_loader, evaluator, *, pipelined=False, timings_file=None):
     """
     Run model on the data_loader and evaluate the metrics with evaluator.
     Also benchmark the inference speed of `model.forward` accurately.
@@ -114,13 +186,20 @@ def inference_on_dataset(model, data_loader, evaluator):
             The elements it generates will be the inputs to the model.
         evaluator (DatasetEvaluator): the evaluator to run. Use `None` if you only want
             to benchmark, but don't want to do any evaluation.
+        pipelined (bool): if True, `evaluator.process` of each batch runs in a background
+            thread while the model runs on the next batch. `evaluator.process` is still
+            called in order, and never concurrently.
+        timings_file (str): if given, the main process saves the inference time of every
+            image (after warmup) to this json file, as a dict that maps ``str(image_id)``
+            to seconds. The time of a batch is divided equally among its images.
+            It can be used as `cfg.DATALOADER.INFERENCE_TIMINGS_FILE` in later runs.
 
     Returns:
         The return value of `evaluator.evaluate()`
     """
     num_devices = get_world_size()
     logger = logging.getLogger(__name__)
-    logger.info("Start inference on {} images".format(len(data_loader)))
+    logger.info("Start inference on {} batches".format(len(data_loader)))
 
     total = len(data_loader)  # inference data loader must have a fixed length
     if evaluator is None:
@@ -128,34 +207,107 @@ def inference_on_dataset(model, data_loader, evaluator):
         evaluator = DatasetEvaluators([])
     evaluator.reset()
 
+    batch_sampler = getattr(data_loader, "batch_sampler", None)
+    if isinstance(batch_sampler, InferenceGroupedBatchSampler):
+        # Batches are not in the order of the dataset. Buffer the outputs to give them
+        # to the evaluator in the order of the dataset.
+        batch_positions = iter(batch_sampler.positions())
+    else:
+        batch_positions = None
+    reorder_buffer = {}
+    next_position = 0
+
+    def restore_order(inputs, outputs):
+        nonlocal next_position
+        if batch_positions is None:
+            return inputs, outputs
+        for position, input, output in zip(next(batch_positions), inputs, outputs):
+            reorder_buffer[position] = (input, output)
+        ready = []
+        while next_position in reorder_buffer:
+            ready.append(reorder_buffer.pop(next_position))
+            next_position += 1
+        return [x[0] for x in ready], [x[1] for x in ready]
+
     num_warmup = min(5, total - 1)
     start_time = time.perf_counter()
     total_compute_time = 0
-    with inference_context(model), torch.no_grad():
-        for idx, inputs in enumerate(data_loader):
-            if idx == num_warmup:
-                start_time = time.perf_counter()
-                total_compute_time = 0
-
-            start_compute_time = time.perf_counter()
-            outputs = model(inputs)
-            if torch.cuda.is_available():
-                torch.cuda.synchronize()
-            total_compute_time += time.perf_counter() - start_compute_time
+    num_images = 0  # number of images after warmup
+    # The time spent in evaluator.process, and the part of it that is not overlapped
+    # with the model, i.e. when the main loop waits for evaluator.process
+    total_process_time = 0
+    total_process_wait_time = 0
+    pending_process = None
+    image_timings = {}  # str(image_id) -> seconds
+
+    def timed_process(inputs, outputs):
+        start_process_time = time.perf_counter()
+        if len(inputs):
             evaluator.process(inputs, outputs)
-
-            iters_after_start = idx + 1 - num_warmup * int(idx >= num_warmup)
-            seconds_per_img = total_compute_time / iters_after_start
-            if idx >= num_warmup * 2 or seconds_per_img > 5:
-                total_seconds_per_img = (time.perf_counter() - start_time) / iters_after_start
-                eta = datetime.timedelta(seconds=int(total_seconds_per_img * (total - idx - 1)))
-                log_every_n_seconds(
-                    logging.INFO,
-                    "Inference done {}/{}. {:.4f} s / img. ETA={}".format(
-                        idx + 1, total, seconds_per_img, str(eta)
-                    ),
-                    n=5,
-                )
+        return time.perf_counter() - start_process_time
+
+    def wait_process():
+        nonlocal total_process_time, total_process_wait_time
+        if pending_process is None:
+            return
+        idx, future = pending_process
+        start_wait_time = time.perf_counter()
+        process_time = future.result()
+        if idx >= num_warmup:
+            total_process_time += process_time
+            total_process_wait_time += time.perf_counter() - start_wait_time
+
+    pool = ThreadPoolExecutor(max_workers=1) if pipelined else None
+    try:
+        with inference_context(model), torch.no_grad():
+            for idx, inputs in enumerate(data_loader):
+                if idx == num_warmup:
+                    start_time = time.perf_counter()
+                    total_compute_time = 0
+                    num_images = 0
+                num_images += len(inputs)
+
+                start_compute_time = time.perf_counter()
+                outputs = model(inputs)
+                if torch.cuda.is_available():
+                    torch.cuda.synchronize()
+                compute_time = time.perf_counter() - start_compute_time
+                total_compute_time += compute_time
+                if timings_file and idx >= num_warmup:
+                    for input in inputs:
+                        if "image_id" in input:
+                            image_timings[str(input["image_id"])] = compute_time / len(inputs)
+                inputs, outputs = restore_order(inputs, outputs)
+
+                if pipelined:
+                    # The previous batch was processed while the model ran on this batch
+                    wait_process()
+                    pending_process = (idx, pool.submit(timed_process, inputs, outputs))
+                else:
+                    process_time = timed_process(inputs, outputs)
+                    if idx >= num_warmup:
+                        total_process_time += process_time
+                        total_process_wait_time += process_time
+
+                iters_after_start = idx + 1 - num_warmup * int(idx >= num_warmup)
+                seconds_per_img = total_compute_time / num_images
+                if idx >= num_warmup * 2 or seconds_per_img > 5:
+                    total_seconds_per_iter = (time.perf_counter() - start_time) / iters_after_start
+                    eta = datetime.timedelta(
+                        seconds=int(total_seconds_per_iter * (total - idx - 1))
+                    )
+                    log_every_n_seconds(
+                        logging.INFO,
+                        "Inference done {}/{}. {:.4f} s / img. ETA={}".format(
+                            idx + 1, total, seconds_per_img, str(eta)
+                        ),
+                        n=5,
+                    )
+            wait_process()
+            assert not reorder_buffer, "Some outputs were not given to the evaluator!"
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
     # Measure the time only for this worker (before the synchronization barrier)
     total_time = time.perf_counter() - start_time
@@ -163,16 +315,36 @@ def inference_on_dataset(model, data_loader, evaluator):
     # NOTE this format is parsed by grep
     logger.info(
         "Total inference time: {} ({:.6f} s / img per device, on {} devices)".format(
-            total_time_str, total_time / (total - num_warmup), num_devices
+            total_time_str, total_time / max(num_images, 1), num_devices
         )
     )
     total_compute_time_str = str(datetime.timedelta(seconds=int(total_compute_time)))
     logger.info(
         "Total inference pure compute time: {} ({:.6f} s / img per device, on {} devices)".format(
-            total_compute_time_str, total_compute_time / (total - num_warmup), num_devices
+            total_compute_time_str, total_compute_time / max(num_images, 1), num_devices
+        )
+    )
+    total_process_time_str = str(datetime.timedelta(seconds=int(total_process_time)))
+    logger.info(
+        "Total evaluator process time: {} ({:.6f} s / img per device, of which {:.6f} s / img "
+        "is not overlapped with inference)".format(
+            total_process_time_str,
+            total_process_time / max(num_images, 1),
+            total_process_wait_time / max(num_images, 1),
         )
     )
 
+    if timings_file:
+        all_timings = gather(image_timings)
+        if is_main_process():
+            image_timings = {k: v for timings in all_timings for k, v in timings.items()}
+            PathManager.mkdirs(os.path.dirname(timings_file) or ".")
+            with PathManager.open(timings_file, "w") as f:
+                json.dump(image_timings, f)
+            logger.info(
+                "Saved inference time of {} images to {}".format(len(image_timings), timings_file)
+            )
+
     results = evaluator.evaluate()
     # An evaluator may return None when not in main process.
     # Replace it by an empty dict instead to make it easier for downstream code to handle
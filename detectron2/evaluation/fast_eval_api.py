@@ -1,18 +1,46 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import copy
+import itertools
 import numpy as np
 import time
+from collections import defaultdict
+import pycocotools.mask as mask_util
 from pycocotools.cocoeval import COCOeval
 
 from detectron2 import _C
 
 
+def _convert_instances_to_cpp(instances, is_det=False):
+    # Convert annotations for a list of instances in an image to a format that's fast
+    # to access in C++
+    instances_cpp = []
+    for instance in instances:
+        instance_cpp = _C.InstanceAnnotation(
+            int(instance["id"]),
+            instance["score"] if is_det else instance.get("score", 0.0),
+            instance["area"],
+            bool(instance.get("iscrowd", 0)),
+            bool(instance.get("ignore", 0)),
+        )
+        instances_cpp.append(instance_cpp)
+    return instances_cpp
+
+
 class COCOeval_opt(COCOeval):
     """
     This is a slightly modified version of the original COCO API, where the functions evaluateImg()
     and accumulate() are implemented in C++ to speedup evaluation
     """
 
+    def __init__(self, cocoGt=None, cocoDt=None, iouType="segm", num_threads=1):
+        """
+        Args:
+            num_threads (int): number of threads used by the C++ implementation.
+                0 means the number of CPU cores. The results do not depend on it.
+        """
+        super().__init__(cocoGt, cocoDt, iouType)
+        self.num_threads = num_threads
+
     def evaluate(self):
         """
         Run per image evaluation on given images and store results in self.evalImgs_cpp, a
@@ -52,20 +80,7 @@ class COCOeval_opt(COCOeval):
         maxDet = p.maxDets[-1]
 
         # <<<< Beginning of code differences with original COCO API
-        def convert_instances_to_cpp(instances, is_det=False):
-            # Convert annotations for a list of instances in an image to a format that's fast
-            # to access in C++
-            instances_cpp = []
-            for instance in instances:
-                instance_cpp = _C.InstanceAnnotation(
-                    int(instance["id"]),
-                    instance["score"] if is_det else instance.get("score", 0.0),
-                    instance["area"],
-                    bool(instance.get("iscrowd", 0)),
-                    bool(instance.get("ignore", 0)),
-                )
-                instances_cpp.append(instance_cpp)
-            return instances_cpp
+        convert_instances_to_cpp = _convert_instances_to_cpp
 
         # Convert GT annotations, detections, and IOUs to a format that's fast to access in C++
         ground_truth_instances = [
@@ -85,7 +100,13 @@ class COCOeval_opt(COCOeval):
 
         # Call C++ implementation of self.evaluateImgs()
         self._evalImgs_cpp = _C.COCOevalEvaluateImages(
-            p.areaRng, maxDet, p.iouThrs, ious, ground_truth_instances, detected_instances
+            p.areaRng,
+            maxDet,
+            p.iouThrs,
+            ious,
+            ground_truth_instances,
+            detected_instances,
+            num_threads=self.num_threads,
         )
         self._evalImgs = None
 
@@ -104,7 +125,9 @@ class COCOeval_opt(COCOeval):
         if not hasattr(self, "_evalImgs_cpp"):
             print("Please run evaluate() first")
 
-        self.eval = _C.COCOevalAccumulate(self._paramsEval, self._evalImgs_cpp)
+        self.eval = _C.COCOevalAccumulate(
+            self._paramsEval, self._evalImgs_cpp, num_threads=self.num_threads
+        )
 
         # recall is num_iou_thresholds X num_categories X num_area_ranges X num_max_detections
         self.eval["recall"] = np.array(self.eval["recall"]).reshape(
@@ -117,3 +140,212 @@ class COCOeval_opt(COCOeval):
         self.eval["scores"] = np.array(self.eval["scores"]).reshape(self.eval["counts"])
         toc = time.time()
         print("COCOeval_opt.accumulate() finished in {:0.2f} seconds.".format(toc - tic))
+
+    def evaluate_stream(self, image_results):
+        """
+        Same as :meth:`evaluate`, but reads detections from an iterable of per-image results
+        instead of `self.cocoDt`, and evaluates them image by image. Detections of the whole
+        dataset therefore never need to be in memory at the same time.
+
+        Args:
+            image_results (iterable[list[dict]]): detections in COCO's result format,
+                grouped by image, i.e. each list only contains detections of one image.
+                An image must not appear in more than one list. Images that do not appear
+                are evaluated as having no detections. The dicts are modified in place.
+
+        Returns:
+            int: the number of detections read from `image_results`.
+        """
+        self.begin_image_evaluation()
+        evaluations = {}
+        num_detections = 0
+        for anns in image_results:
+            if len(anns) == 0:
+                continue
+            img_id = anns[0]["image_id"]
+            assert img_id not in evaluations, "Detections of image {} are given twice!".format(
+                img_id
+            )
+            evaluations[img_id] = self.evaluate_image(img_id, anns)
+            num_detections += len(anns)
+        self.end_image_evaluation(evaluations)
+        return num_detections
+
+    def begin_image_evaluation(self):
+        """
+        Start to evaluate images one by one with :meth:`evaluate_image`, as an alternative
+        to :meth:`evaluate`. The parameters must not change until
+        :meth:`end_image_evaluation` is called.
+        """
+        self._tic = time.time()
+
+        print("Running per image evaluation...")
+        p = self.params
+        # add backward compatibility if useSegm is specified in params
+        if p.useSegm is not None:
+            p.iouType = "segm" if p.useSegm == 1 else "bbox"
+            print("useSegm (deprecated) is not None. Running {} evaluation".format(p.iouType))
+        print("Evaluate annotation type *{}*".format(p.iouType))
+        p.imgIds = list(np.unique(p.imgIds))
+        if p.useCats:
+            p.catIds = list(np.unique(p.catIds))
+        p.maxDets = sorted(p.maxDets)
+        self.params = p
+
+    def evaluate_image(self, img_id, anns):
+        """
+        Match the detections of one image to its ground truth. This method is thread-safe,
+        as long as the images evaluated at the same time are different.
+
+        Args:
+            img_id (int):
+            anns (list[dict]): all detections of the image in COCO's result format.
+                The dicts are modified in place.
+
+        Returns:
+            dict[int, ImageEvaluation]: the results of the image, indexed by
+            `category_index * num_area_ranges + area_range_index`. Empty results of
+            categories without ground truth or detections are omitted.
+        """
+        p = self.params
+        assert all(
+            ann["image_id"] == img_id for ann in anns
+        ), "Detections of different images are given together!"
+        assert img_id in self.cocoGt.imgs, "Results do not correspond to current coco set"
+        if len(anns):
+            self._load_image_results(anns, first_id=1)
+
+        if p.useCats:
+            gts = self.cocoGt.loadAnns(self.cocoGt.getAnnIds(imgIds=[img_id], catIds=p.catIds))
+            if len(p.catIds):
+                cat_ids = set(p.catIds)
+                anns = [ann for ann in anns if ann["category_id"] in cat_ids]
+        else:
+            gts = self.cocoGt.loadAnns(self.cocoGt.getAnnIds(imgIds=[img_id]))
+
+        # convert ground truth to mask if iouType == 'segm'
+        if p.iouType == "segm":
+            for ann in itertools.chain(gts, anns):
+                ann["segmentation"] = self.cocoGt.annToRLE(ann)
+        # set ignore flag
+        for gt in gts:
+            gt["ignore"] = "iscrowd" in gt and gt["iscrowd"]
+            if p.iouType == "keypoints":
+                gt["ignore"] = (gt["num_keypoints"] == 0) or gt["ignore"]
+
+        # Use a shallow copy to compute IoUs, so that other threads are not affected
+        image_eval = copy.copy(self)
+        image_eval._gts = defaultdict(list)
+        image_eval._dts = defaultdict(list)
+        for gt in gts:
+            image_eval._gts[img_id, gt["category_id"]].append(gt)
+        for dt in anns:
+            image_eval._dts[img_id, dt["category_id"]].append(dt)
+
+        # Only categories that appear in the image need to be evaluated
+        if p.useCats:
+            cat_indices = [
+                c
+                for c, catId in enumerate(p.catIds)
+                if (img_id, catId) in image_eval._gts or (img_id, catId) in image_eval._dts
+            ]
+        else:
+            # Like evaluate(), instances of all categories are flattened in the order of catIds
+            gts = [o for catId in p.catIds for o in image_eval._gts[img_id, catId]]
+            anns = [o for catId in p.catIds for o in image_eval._dts[img_id, catId]]
+            cat_indices = [0] if len(gts) or len(anns) else []
+        if len(cat_indices) == 0:
+            return {}
+
+        computeIoU = image_eval.computeOks if p.iouType == "keypoints" else image_eval.computeIoU
+        if p.useCats:
+            ious = [[computeIoU(img_id, p.catIds[c]) for c in cat_indices]]
+            ground_truth_instances = [
+                [
+                    _convert_instances_to_cpp(image_eval._gts[img_id, p.catIds[c]])
+                    for c in cat_indices
+                ]
+            ]
+            detected_instances = [
+                [
+                    _convert_instances_to_cpp(image_eval._dts[img_id, p.catIds[c]], is_det=True)
+                    for c in cat_indices
+                ]
+            ]
+        else:
+            ious = [[computeIoU(img_id, -1)]]
+            ground_truth_instances = [[_convert_instances_to_cpp(gts)]]
+            detected_instances = [[_convert_instances_to_cpp(anns, is_det=True)]]
+        evaluations = _C.COCOevalEvaluateImages(
+            p.areaRng, p.maxDets[-1], p.iouThrs, ious, ground_truth_instances, detected_instances
+        )
+
+        # The results are ordered by (category, area range)
+        num_area_ranges = len(p.areaRng)
+        return {
+            c * num_area_ranges + a: evaluations[k * num_area_ranges + a]
+            for k, c in enumerate(cat_indices)
+            for a in range(num_area_ranges)
+        }
+
+    def end_image_evaluation(self, evaluations):
+        """
+        Finish the evaluation started by :meth:`begin_image_evaluation`, after which
+        :meth:`accumulate` can be called.
+
+        Args:
+            evaluations (dict[int, dict]): the results of :meth:`evaluate_image`
+                indexed by image id. Images that are not in it are evaluated as having
+                no detections, and images that are not in `params.imgIds` are ignored.
+        """
+        p = self.params
+        num_images = len(p.imgIds)
+        empty = _C.ImageEvaluation()
+        # accumulate() expects a list ordered by (category, area range, image)
+        self._evalImgs_cpp = [empty] * (
+            len(p.catIds if p.useCats else [-1]) * len(p.areaRng) * num_images
+        )
+        for i, img_id in enumerate(p.imgIds):
+            per_image = evaluations.get(img_id)
+            if per_image is None:
+                per_image = self.evaluate_image(img_id, [])
+            for k, evaluation in per_image.items():
+                self._evalImgs_cpp[k * num_images + i] = evaluation
+        self._evalImgs = None
+
+        self._paramsEval = copy.deepcopy(self.params)
+        toc = time.time()
+        print(
+            "COCOeval_opt per image evaluation finished in {:0.2f} seconds.".format(toc - self._tic)
+        )
+
+    def _load_image_results(self, anns, first_id):
+        """
+        Fill the fields of detections the same way as `COCO.loadRes()`.
+        """
+        if "bbox" in anns[0] and not anns[0]["bbox"] == []:
+            for k, ann in enumerate(anns):
+                bb = ann["bbox"]
+                x1, x2, y1, y2 = [bb[0], bb[0] + bb[2], bb[1], bb[1] + bb[3]]
+                if "segmentation" not in ann:
+                    ann["segmentation"] = [[x1, y1, x1, y2, x2, y2, x2, y1]]
+                ann["area"] = bb[2] * bb[3]
+                ann["id"] = first_id + k
+                ann["iscrowd"] = 0
+        elif "segmentation" in anns[0]:
+            for k, ann in enumerate(anns):
+                # now only support compressed RLE format as segmentation results
+                ann["area"] = mask_util.area(ann["segmentation"])
+                if "bbox" not in ann:
+                    ann["bbox"] = mask_util.toBbox(ann["segmentation"])
+                ann["id"] = first_id + k
+                ann["iscrowd"] = 0
+        elif "keypoints" in anns[0]:
+            for k, ann in enumerate(anns):
+                s = ann["keypoints"]
+                x = s[0::3]
+                y = s[1::3]
+                x0, x1, y0, y1 = np.min(x), np.max(x), np.min(y), np.max(y)
+                ann["area"] = (x1 - x0) * (y1 - y0)
+                ann["id"] = first_id + k
+                ann["bbox"] = [x0, y0, x1 - x0, y1 - y0]
@@ -15,25 +15,41 @@ from tabulate import tabulate
 from detectron2.data import MetadataCatalog
 from detectron2.utils import comm
 
-from .evaluator import DatasetEvaluator
+from .evaluator import BackgroundDatasetEvaluator
 
 logger = logging.getLogger(__name__)
 
+# Same constants as panopticapi
+_OFFSET = 256 * 256 * 256
+_VOID = 0
 
-class COCOPanopticEvaluator(DatasetEvaluator):
+
+class COCOPanopticEvaluator(BackgroundDatasetEvaluator):
     """
-    Evaluate Panoptic Quality metrics on COCO using PanopticAPI.
-    It saves panoptic segmentation prediction in `output_dir`
+    Evaluate Panoptic Quality metrics on COCO.
+
+    By default, each rank matches the segments of its predictions to the ground truth in
+    :meth:`process`, and only the per-category statistics are summed over ranks in
+    :meth:`evaluate`. With `use_fast_impl=False`, it saves panoptic segmentation
+    predictions in `output_dir` and evaluates them using PanopticAPI instead.
 
     It contains a synchronize call and has to be called from all workers.
     """
 
-    def __init__(self, dataset_name, output_dir):
+    def __init__(self, dataset_name, output_dir, *, use_fast_impl=True, num_workers=0):
         """
         Args:
             dataset_name (str): name of the dataset
             output_dir (str): output directory to save results for evaluation
+            use_fast_impl (bool): use a native implementation of PanopticAPI's `pq_compute`,
+                which does not need to save and gather the predictions.
+                Otherwise, use PanopticAPI.
+            num_workers (int): number of background threads that load the ground truth and
+                match segments, overlapping with inference. Only used by the fast
+                implementation. If 0, it is done in :meth:`process`.
         """
+        super().__init__(num_workers=num_workers if use_fast_impl else 0)
+        self._use_fast_impl = use_fast_impl
         self._metadata = MetadataCatalog.get(dataset_name)
         self._thing_contiguous_id_to_dataset_id = {
             v: k for k, v in self._metadata.thing_dataset_id_to_contiguous_id.items()
@@ -45,8 +61,20 @@ class COCOPanopticEvaluator(DatasetEvaluator):
         PathManager.mkdirs(output_dir)
         self._predictions_json = os.path.join(output_dir, "predictions.json")
 
+        if use_fast_impl:
+            with PathManager.open(self._metadata.panoptic_json, "r") as f:
+                gt_json = json.load(f)
+            self._categories = {el["id"]: el for el in gt_json["categories"]}
+            self._gt_annotations = {ann["image_id"]: ann for ann in gt_json["annotations"]}
+            self._category_indices = {k: i for i, k in enumerate(sorted(self._categories))}
+
     def reset(self):
+        super().reset()
         self._predictions = []
+        if self._use_fast_impl:
+            # Sum of IoU, TP, FP, FN of each category, indexed by self._category_indices
+            self._pq_stats = np.zeros((len(self._categories), 4), dtype=np.float64)
+            self._num_images = 0
 
     def _convert_category_id(self, segment_info):
         isthing = segment_info.pop("isthing", None)
@@ -64,8 +92,6 @@ class COCOPanopticEvaluator(DatasetEvaluator):
         return segment_info
 
     def process(self, inputs, outputs):
-        from panopticapi.utils import id2rgb
-
         for input, output in zip(inputs, outputs):
             panoptic_img, segments_info = output["panoptic_seg"]
             panoptic_img = panoptic_img.cpu().numpy()
@@ -95,11 +121,17 @@ class COCOPanopticEvaluator(DatasetEvaluator):
                 # Official evaluation script uses 0 for VOID label.
                 panoptic_img += 1
 
+            segments_info = [self._convert_category_id(x) for x in segments_info]
+            if self._use_fast_impl:
+                self.submit(self._pq_compute_single, input["image_id"], panoptic_img, segments_info)
+                continue
+
+            from panopticapi.utils import id2rgb
+
             file_name = os.path.basename(input["file_name"])
             file_name_png = os.path.splitext(file_name)[0] + ".png"
             with io.BytesIO() as out:
                 Image.fromarray(id2rgb(panoptic_img)).save(out, format="PNG")
-                segments_info = [self._convert_category_id(x) for x in segments_info]
                 self._predictions.append(
                     {
                         "image_id": input["image_id"],
@@ -108,8 +140,42 @@ class COCOPanopticEvaluator(DatasetEvaluator):
                         "segments_info": segments_info,
                     }
                 )
+        self._collect_pq_stats(wait=False)
+
+    def _pq_compute_single(self, image_id, pan_pred, pred_segments_info):
+        """
+        Returns:
+            ndarray: the statistics of the image, in the format of `self._pq_stats`.
+        """
+        gt_ann = self._gt_annotations[image_id]
+        gt_file = os.path.join(self._metadata.panoptic_root, gt_ann["file_name"])
+        with PathManager.open(gt_file, "rb") as f:
+            pan_gt = _rgb2id(np.asarray(Image.open(f), dtype=np.uint32))
+        # The official evaluation reads the ids of predictions from an RGB png
+        pan_pred = pan_pred.astype(np.int64) % _OFFSET
+
+        stats = np.zeros_like(self._pq_stats)
+        for category_id, iou, tp, fp, fn in _pq_compute_single_image(
+            image_id,
+            pan_gt,
+            gt_ann["segments_info"],
+            pan_pred,
+            pred_segments_info,
+            self._categories,
+        ):
+            stats[self._category_indices[category_id]] += (iou, tp, fp, fn)
+        return stats
+
+    def _collect_pq_stats(self, wait):
+        if self._use_fast_impl:
+            for stats in self.collect(wait=wait):
+                self._pq_stats += stats
+                self._num_images += 1
 
     def evaluate(self):
+        if self._use_fast_impl:
+            return self._evaluate_fast()
+
         comm.synchronize()
 
         self._predictions = comm.gather(self._predictions)
@@ -159,6 +225,193 @@ class COCOPanopticEvaluator(DatasetEvaluator):
 
         return results
 
+    def _evaluate_fast(self):
+        self._collect_pq_stats(wait=True)
+        comm.synchronize()
+        pq_stats = comm.all_reduce_sum(self._pq_stats)
+        num_images = comm.all_reduce_sum(np.asarray([self._num_images], dtype=np.int64))[0]
+        if not comm.is_main_process():
+            return
+        if num_images != len(self._gt_annotations):
+            logger.warning(
+                "Evaluated {} images, but the dataset has {} images.".format(
+                    num_images, len(self._gt_annotations)
+                )
+            )
+
+        pq_res = {}
+        for name, isthing in [("All", None), ("Things", True), ("Stuff", False)]:
+            pq_res[name], per_class = _pq_average(
+                pq_stats, self._categories, self._category_indices, isthing
+            )
+            if name == "All":
+                pq_res["per_class"] = per_class
+
+        res = {}
+        res["PQ"] = 100 * pq_res["All"]["pq"]
+        res["SQ"] = 100 * pq_res["All"]["sq"]
+        res["RQ"] = 100 * pq_res["All"]["rq"]
+        res["PQ_th"] = 100 * pq_res["Things"]["pq"]
+        res["SQ_th"] = 100 * pq_res["Things"]["sq"]
+        res["RQ_th"] = 100 * pq_res["Things"]["rq"]
+        res["PQ_st"] = 100 * pq_res["Stuff"]["pq"]
+        res["SQ_st"] = 100 * pq_res["Stuff"]["sq"]
+        res["RQ_st"] = 100 * pq_res["Stuff"]["rq"]
+
+        results = OrderedDict({"panoptic_seg": res})
+        _print_panoptic_results(pq_res)
+
+        return results
+
+
+def _rgb2id(color):
+    """
+    Same as `panopticapi.utils.rgb2id`.
+    """
+    if color.dtype == np.uint8:
+        color = color.astype(np.int32)
+    return color[:, :, 0] + 256 * color[:, :, 1] + 256 * 256 * color[:, :, 2]
+
+
+def _pq_compute_single_image(
+    image_id, pan_gt, gt_segments_info, pan_pred, pred_segments_info, categories
+):
+    """
+    Match the segments of a panoptic segmentation prediction to the ground truth, the same way
+    as `pq_compute_single_core` of PanopticAPI, but for one image in memory.
+
+    Args:
+        image_id: the id of the image, only used in error messages.
+        pan_gt (ndarray): HxW segment ids of the ground truth. 0 means VOID.
+        gt_segments_info (list[dict]): "segments_info" of the ground truth in COCO panoptic
+            format, with keys "id", "category_id", "iscrowd" and "area".
+        pan_pred (ndarray): HxW segment ids of the prediction. 0 means VOID.
+        pred_segments_info (list[dict]): "segments_info" of the prediction, with keys "id"
+            and "category_id".
+        categories (dict): the categories of the dataset, indexed by category id.
+
+    Returns:
+        list[tuple]: (category_id, iou, tp, fp, fn) to be added to the statistics of
+        each category. Categories may appear more than once.
+    """
+    gt_segms = {el["id"]: el for el in gt_segments_info}
+    pred_segms = {el["id"]: dict(el) for el in pred_segments_info}
+
+    # predicted segments area calculation + prediction sanity checks
+    pred_labels_set = set(el["id"] for el in pred_segments_info)
+    labels, labels_cnt = np.unique(pan_pred, return_counts=True)
+    for label, label_cnt in zip(labels.tolist(), labels_cnt.tolist()):
+        if label not in pred_segms:
+            if label == _VOID:
+                continue
+            raise KeyError(
+                "In the image with ID {} segment with ID {} is presented in PNG and not "
+                "presented in JSON.".format(image_id, label)
+            )
+        pred_segms[label]["area"] = label_cnt
+        pred_labels_set.remove(label)
+        if pred_segms[label]["category_id"] not in categories:
+            raise KeyError(
+                "In the image with ID {} segment with ID {} has unknown category_id {}.".format(
+                    image_id, label, pred_segms[label]["category_id"]
+                )
+            )
+    if len(pred_labels_set) != 0:
+        raise KeyError(
+            "In the image with ID {} the following segment IDs {} are presented in JSON and "
+            "not presented in PNG.".format(image_id, list(pred_labels_set))
+        )
+
+    # confusion matrix calculation
+    pan_gt_pred = pan_gt.astype(np.int64) * _OFFSET + pan_pred.astype(np.int64)
+    labels, labels_cnt = np.unique(pan_gt_pred, return_counts=True)
+    gt_pred_map = {
+        (label // _OFFSET, label % _OFFSET): intersection
+        for label, intersection in zip(labels.tolist(), labels_cnt.tolist())
+    }
+
+    ret = []
+    # count all matched pairs
+    gt_matched = set()
+    pred_matched = set()
+    for (gt_label, pred_label), intersection in gt_pred_map.items():
+        if gt_label not in gt_segms or pred_label not in pred_segms:
+            continue
+        gt_info, pred_info = gt_segms[gt_label], pred_segms[pred_label]
+        if gt_info["iscrowd"] == 1 or gt_info["category_id"] != pred_info["category_id"]:
+            continue
+
+        union = (
+            pred_info["area"]
+            + gt_info["area"]
+            - intersection
+            - gt_pred_map.get((_VOID, pred_label), 0)
+        )
+        iou = intersection / union
+        if iou > 0.5:
+            ret.append((gt_info["category_id"], iou, 1, 0, 0))
+            gt_matched.add(gt_label)
+            pred_matched.add(pred_label)
+
+    # count false negatives
+    crowd_labels_dict = {}
+    for gt_label, gt_info in gt_segms.items():
+        if gt_label in gt_matched:
+            continue
+        # crowd segments are ignored
+        if gt_info["iscrowd"] == 1:
+            crowd_labels_dict[gt_info["category_id"]] = gt_label
+            continue
+        ret.append((gt_info["category_id"], 0.0, 0, 0, 1))
+
+    # count false positives
+    for pred_label, pred_info in pred_segms.items():
+        if pred_label in pred_matched:
+            continue
+        # intersection of the segment with VOID
+        intersection = gt_pred_map.get((_VOID, pred_label), 0)
+        # plus intersection with corresponding CROWD region if it exists
+        if pred_info["category_id"] in crowd_labels_dict:
+            intersection += gt_pred_map.get(
+                (crowd_labels_dict[pred_info["category_id"]], pred_label), 0
+            )
+        # predicted segment is ignored if more than half of the segment correspond to VOID
+        # and CROWD regions
+        if intersection / pred_info["area"] > 0.5:
+            continue
+        ret.append((pred_info["category_id"], 0.0, 0, 1, 0))
+    return ret
+
+
+def _pq_average(pq_stats, categories, category_indices, isthing):
+    """
+    Same as `PQStat.pq_average` of PanopticAPI.
+
+    Args:
+        pq_stats (ndarray): Kx4 array of the sum of IoU, TP, FP, FN of each category.
+    """
+    pq, sq, rq, n = 0, 0, 0, 0
+    per_class_results = {}
+    for label, label_info in categories.items():
+        if isthing is not None:
+            cat_isthing = label_info["isthing"] == 1
+            if isthing != cat_isthing:
+                continue
+        iou, tp, fp, fn = pq_stats[category_indices[label]].tolist()
+        if tp + fp + fn == 0:
+            per_class_results[label] = {"pq": 0.0, "sq": 0.0, "rq": 0.0}
+            continue
+        n += 1
+        pq_class = iou / (tp + 0.5 * fp + 0.5 * fn)
+        sq_class = iou / tp if tp != 0 else 0
+        rq_class = tp / (tp + 0.5 * fp + 0.5 * fn)
+        per_class_results[label] = {"pq": pq_class, "sq": sq_class, "rq": rq_class}
+        pq += pq_class
+        sq += sq_class
+        rq += rq_class
+
+    return {"pq": pq / n, "sq": sq / n, "rq": rq / n, "n": n}, per_class_results
+
 
 def _print_panoptic_results(pq_res):
     headers = ["", "PQ", "SQ", "RQ", "#categories"]
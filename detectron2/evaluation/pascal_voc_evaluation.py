@@ -1,13 +1,14 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 
+import itertools
 import logging
 import numpy as np
 import os
-import tempfile
 import xml.etree.ElementTree as ET
 from collections import OrderedDict, defaultdict
 from functools import lru_cache
+from types import MappingProxyType
 import torch
 from fvcore.common.file_io import PathManager
 
@@ -44,23 +45,18 @@ class PascalVOCDetectionEvaluator(DatasetEvaluator):
         self._logger = logging.getLogger(__name__)
 
     def reset(self):
-        self._predictions = defaultdict(list)  # class name -> list of prediction strings
+        self._predictions = []  # list of (image_id, boxes, scores, classes) of each image
 
     def process(self, inputs, outputs):
         for input, output in zip(inputs, outputs):
             image_id = input["image_id"]
             instances = output["instances"].to(self._cpu_device)
-            boxes = instances.pred_boxes.tensor.numpy()
-            scores = instances.scores.tolist()
-            classes = instances.pred_classes.tolist()
-            for box, score, cls in zip(boxes, scores, classes):
-                xmin, ymin, xmax, ymax = box
-                # The inverse of data loading logic in `datasets/pascal_voc.py`
-                xmin += 1
-                ymin += 1
-                self._predictions[cls].append(
-                    f"{image_id} {score:.3f} {xmin:.1f} {ymin:.1f} {xmax:.1f} {ymax:.1f}"
-                )
+            boxes = instances.pred_boxes.tensor.numpy().copy()
+            # The inverse of data loading logic in `datasets/pascal_voc.py`
+            boxes[:, :2] += 1
+            scores = instances.scores.numpy()
+            classes = instances.pred_classes.numpy()
+            self._predictions.append((image_id, boxes, scores, classes))
 
     def evaluate(self):
         """
@@ -70,10 +66,7 @@ class PascalVOCDetectionEvaluator(DatasetEvaluator):
         all_predictions = comm.gather(self._predictions, dst=0)
         if not comm.is_main_process():
             return
-        predictions = defaultdict(list)
-        for predictions_per_rank in all_predictions:
-            for clsid, lines in predictions_per_rank.items():
-                predictions[clsid].extend(lines)
+        predictions = list(itertools.chain(*all_predictions))
         del all_predictions
 
         self._logger.info(
@@ -83,26 +76,40 @@ class PascalVOCDetectionEvaluator(DatasetEvaluator):
             )
         )
 
-        with tempfile.TemporaryDirectory(prefix="pascal_voc_eval_") as dirname:
-            res_file_template = os.path.join(dirname, "{}.txt")
-
-            aps = defaultdict(list)  # iou -> ap per class
-            for cls_id, cls_name in enumerate(self._class_names):
-                lines = predictions.get(cls_id, [""])
-
-                with open(res_file_template.format(cls_name), "w") as f:
-                    f.write("\n".join(lines))
-
-                for thresh in range(50, 100, 5):
-                    rec, prec, ap = voc_eval(
-                        res_file_template,
-                        self._anno_file_template,
-                        self._image_set_path,
-                        cls_name,
-                        ovthresh=thresh / 100.0,
-                        use_07_metric=self._is_2007,
-                    )
-                    aps[thresh].append(ap * 100)
+        annotations = load_voc_annotations(
+            self._anno_file_template, self._image_set_path, tuple(self._class_names)
+        )
+        image_indices = {name: k for k, name in enumerate(annotations["image_names"])}
+        det_images = np.concatenate(
+            [
+                np.full((len(scores),), image_indices[image_id], dtype=np.int64)
+                for image_id, _, scores, _ in predictions
+            ]
+            + [np.zeros((0,), dtype=np.int64)]
+        )
+        det_boxes = np.concatenate([x[1] for x in predictions] + [np.zeros((0, 4))])
+        det_scores = np.concatenate([x[2] for x in predictions] + [np.zeros((0,))])
+        det_classes = np.concatenate([x[3] for x in predictions] + [np.zeros((0,), dtype=np.int64)])
+        del predictions
+        # Use the same precision as the detection files of the official API
+        det_boxes = np.round(det_boxes.astype(np.float64), 1)
+        det_scores = np.round(det_scores.astype(np.float64), 3)
+
+        thresholds = list(range(50, 100, 5))
+        aps = defaultdict(list)  # iou -> ap per class
+        for cls_id in range(len(self._class_names)):
+            mask = det_classes == cls_id
+            results = voc_eval_class(
+                det_images[mask],
+                det_scores[mask],
+                det_boxes[mask],
+                annotations,
+                cls_id,
+                ovthresholds=[thresh / 100.0 for thresh in thresholds],
+                use_07_metric=self._is_2007,
+            )
+            for thresh, (rec, prec, ap) in zip(thresholds, results):
+                aps[thresh].append(ap * 100)
 
         ret = OrderedDict()
         mAP = {iou: np.mean(x) for iou, x in aps.items()}
@@ -123,7 +130,6 @@ class PascalVOCDetectionEvaluator(DatasetEvaluator):
 """Python implementation of the PASCAL VOC devkit's AP evaluation code."""
 
 
-@lru_cache(maxsize=None)
 def parse_rec(filename):
     """Parse a PASCAL VOC xml file."""
     with PathManager.open(filename) as f:
@@ -147,6 +153,53 @@ def parse_rec(filename):
     return objects
 
 
+@lru_cache(maxsize=4)
+def load_voc_annotations(annopath, imagesetfile, classnames):
+    """
+    Load the annotations of all images in the image set into compact arrays.
+    The result of the last few calls is cached and shared, so it is read-only.
+
+    Args:
+        annopath (str): annopath.format(imagename) should be the xml annotations file.
+        imagesetfile (str): text file containing the list of images, one image per line.
+        classnames (tuple[str]): the class names. Objects of other classes are ignored.
+
+    Returns:
+        dict: a read-only dict with the following keys:
+
+        * "image_names": tuple[str], names of all images in the image set.
+        * "image": int64 array of shape (G,), index of the image of each object,
+          in ascending order.
+        * "class": int64 array of shape (G,), index of the class of each object.
+        * "bbox": float64 array of shape (G, 4), the box of each object.
+        * "difficult": bool array of shape (G,).
+    """
+    with PathManager.open(imagesetfile, "r") as f:
+        lines = f.readlines()
+    imagenames = [x.strip() for x in lines]
+    class_indices = {name: k for k, name in enumerate(classnames)}
+
+    image, cls, bbox, difficult = [], [], [], []
+    for image_idx, imagename in enumerate(imagenames):
+        for obj in parse_rec(annopath.format(imagename)):
+            if obj["name"] not in class_indices:
+                continue
+            image.append(image_idx)
+            cls.append(class_indices[obj["name"]])
+            bbox.append(obj["bbox"])
+            difficult.append(obj["difficult"])
+    ret = {
+        "image": np.asarray(image, dtype=np.int64),
+        "class": np.asarray(cls, dtype=np.int64),
+        "bbox": np.asarray(bbox, dtype=np.float64).reshape(-1, 4),
+        "difficult": np.asarray(difficult, dtype=bool),
+    }
+    for v in ret.values():
+        v.setflags(write=False)
+    ret["image_names"] = tuple(imagenames)
+    return MappingProxyType(ret)
+
+
 def voc_ap(rec, prec, use_07_metric=False):
     """Compute VOC AP given precision and recall. If use_07_metric is true, uses
     the VOC 07 11-point method (default:False).
@@ -202,29 +255,8 @@ def voc_eval(detpath, annopath, imagesetfile, classname, ovthresh=0.5, use_07_me
     # assumes detections are in detpath.format(classname)
     # assumes annotations are in annopath.format(imagename)
     # assumes imagesetfile is a text file with each line an image name
-
-    # first load gt
-    # read list of images
-    with PathManager.open(imagesetfile, "r") as f:
-        lines = f.readlines()
-    imagenames = [x.strip() for x in lines]
-
-    # load annots
-    recs = {}
-    for imagename in imagenames:
-        recs[imagename] = parse_rec(annopath.format(imagename))
-
-    # extract gt objects for this class
-    class_recs = {}
-    npos = 0
-    for imagename in imagenames:
-        R = [obj for obj in recs[imagename] if obj["name"] == classname]
-        bbox = np.array([x["bbox"] for x in R])
-        difficult = np.array([x["difficult"] for x in R]).astype(np.bool)
-        # difficult = np.array([False for x in R]).astype(np.bool)  # treat all "difficult" as GT
-        det = [False] * len(R)
-        npos = npos + sum(~difficult)
-        class_recs[imagename] = {"bbox": bbox, "difficult": difficult, "det": det}
+    annotations = load_voc_annotations(annopath, imagesetfile, (classname,))
+    image_indices = {name: k for k, name in enumerate(annotations["image_names"])}
 
     # read dets
     detfile = detpath.format(classname)
@@ -232,64 +264,109 @@ def voc_eval(detpath, annopath, imagesetfile, classname, ovthresh=0.5, use_07_me
         lines = f.readlines()
 
     splitlines = [x.strip().split(" ") for x in lines]
-    image_ids = [x[0] for x in splitlines]
+    det_images = np.array([image_indices[x[0]] for x in splitlines], dtype=np.int64)
     confidence = np.array([float(x[1]) for x in splitlines])
     BB = np.array([[float(z) for z in x[2:]] for x in splitlines]).reshape(-1, 4)
 
-    # sort by confidence
-    sorted_ind = np.argsort(-confidence)
-    BB = BB[sorted_ind, :]
-    image_ids = [image_ids[x] for x in sorted_ind]
-
-    # go down dets and mark TPs and FPs
-    nd = len(image_ids)
-    tp = np.zeros(nd)
-    fp = np.zeros(nd)
-    for d in range(nd):
-        R = class_recs[image_ids[d]]
-        bb = BB[d, :].astype(float)
-        ovmax = -np.inf
-        BBGT = R["bbox"].astype(float)
-
-        if BBGT.size > 0:
-            # compute overlaps
-            # intersection
-            ixmin = np.maximum(BBGT[:, 0], bb[0])
-            iymin = np.maximum(BBGT[:, 1], bb[1])
-            ixmax = np.minimum(BBGT[:, 2], bb[2])
-            iymax = np.minimum(BBGT[:, 3], bb[3])
-            iw = np.maximum(ixmax - ixmin + 1.0, 0.0)
-            ih = np.maximum(iymax - iymin + 1.0, 0.0)
-            inters = iw * ih
-
-            # union
-            uni = (
-                (bb[2] - bb[0] + 1.0) * (bb[3] - bb[1] + 1.0)
-                + (BBGT[:, 2] - BBGT[:, 0] + 1.0) * (BBGT[:, 3] - BBGT[:, 1] + 1.0)
-                - inters
-            )
+    return voc_eval_class(
+        det_images, confidence, BB, annotations, 0, [ovthresh], use_07_metric=use_07_metric
+    )[0]
 
-            overlaps = inters / uni
-            ovmax = np.max(overlaps)
-            jmax = np.argmax(overlaps)
-
-        if ovmax > ovthresh:
-            if not R["difficult"][jmax]:
-                if not R["det"][jmax]:
-                    tp[d] = 1.0
-                    R["det"][jmax] = 1
-                else:
-                    fp[d] = 1.0
+
+def voc_eval_class(
+    det_images, det_scores, det_boxes, annotations, class_id, ovthresholds, use_07_metric=False
+):
+    """
+    Vectorized PASCAL VOC evaluation of one class at multiple overlap thresholds.
+
+    Args:
+        det_images (ndarray): int64 array of shape (D,), the index of the image (in
+            annotations["image_names"]) of each detection.
+        det_scores (ndarray): float array of shape (D,), the confidence of each detection.
+        det_boxes (ndarray): float array of shape (D, 4), the box of each detection.
+        annotations (dict): the output of :func:`load_voc_annotations`.
+        class_id (int): index of the class to evaluate.
+        ovthresholds (list[float]): overlap thresholds.
+        use_07_metric (bool): whether to use VOC07's 11 point AP computation.
+
+    Returns:
+        list[tuple]: (rec, prec, ap) for each threshold.
+    """
+    # extract gt objects for this class
+    mask = annotations["class"] == class_id
+    gt_images = annotations["image"][mask]
+    BBGT = annotations["bbox"][mask]
+    difficult = annotations["difficult"][mask]
+    npos = np.count_nonzero(~difficult)
+
+    # sort by confidence
+    sorted_ind = np.argsort(-det_scores)
+    det_boxes = det_boxes[sorted_ind, :].astype(float)
+    det_images = det_images[sorted_ind]
+    nd = len(det_images)
+
+    # Pad the gt objects of each image to the same length, so that the overlaps of
+    # each detection with all gt objects in its image can be computed at once
+    num_images = len(annotations["image_names"])
+    num_gts = np.bincount(gt_images, minlength=num_images)
+    gt_offsets = np.concatenate([[0], np.cumsum(num_gts)[:-1]]).astype(np.int64)
+    max_gts = int(num_gts.max()) if num_images > 0 else 0
+    padded_gt = np.zeros((num_images, max_gts, 4))
+    padded_gt[gt_images, np.arange(len(gt_images)) - gt_offsets[gt_images]] = BBGT
+    padded_valid = np.arange(max_gts)[None, :] < num_gts[:, None]
+
+    # compute overlaps
+    bb = det_boxes[:, None, :]
+    gt = padded_gt[det_images]
+    # intersection
+    ixmin = np.maximum(gt[:, :, 0], bb[:, :, 0])
+    iymin = np.maximum(gt[:, :, 1], bb[:, :, 1])
+    ixmax = np.minimum(gt[:, :, 2], bb[:, :, 2])
+    iymax = np.minimum(gt[:, :, 3], bb[:, :, 3])
+    iw = np.maximum(ixmax - ixmin + 1.0, 0.0)
+    ih = np.maximum(iymax - iymin + 1.0, 0.0)
+    inters = iw * ih
+
+    # union
+    uni = (
+        (bb[:, :, 2] - bb[:, :, 0] + 1.0) * (bb[:, :, 3] - bb[:, :, 1] + 1.0)
+        + (gt[:, :, 2] - gt[:, :, 0] + 1.0) * (gt[:, :, 3] - gt[:, :, 1] + 1.0)
+        - inters
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        overlaps = np.where(padded_valid[det_images], inters / uni, -np.inf)
+    if max_gts > 0:
+        ovmax = np.max(overlaps, axis=1)
+        # index of the best gt object in this class
+        jmax = np.minimum(gt_offsets[det_images] + np.argmax(overlaps, axis=1), len(BBGT) - 1)
+    else:
+        ovmax = np.full((nd,), -np.inf)
+        jmax = np.zeros((nd,), dtype=np.int64)
+
+    ret = []
+    for ovthresh in ovthresholds:
+        # go down dets and mark TPs and FPs: the first detection that matches a
+        # non-difficult gt object is a TP, the following ones are FPs.
+        matched = ovmax > ovthresh
+        if len(BBGT) > 0:
+            candidates = np.nonzero(matched & ~difficult[jmax])[0]
         else:
-            fp[d] = 1.0
-
-    # compute precision recall
-    fp = np.cumsum(fp)
-    tp = np.cumsum(tp)
-    rec = tp / float(npos)
-    # avoid divide by zero in case the first detection matches a difficult
-    # ground truth
-    prec = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
-    ap = voc_ap(rec, prec, use_07_metric)
-
-    return rec, prec, ap
+            candidates = np.zeros((0,), dtype=np.int64)
+        tp = np.zeros(nd)
+        fp = (~matched).astype(np.float64)
+        fp[candidates] = 1.0
+        _, first = np.unique(jmax[candidates], return_index=True)
+        tp[candidates[first]] = 1.0
+        fp[candidates[first]] = 0.0
+
+        # compute precision recall
+        fp = np.cumsum(fp)
+        tp = np.cumsum(tp)
+        rec = tp / float(npos)
+        # avoid divide by zero in case the first detection matches a difficult
+        # ground truth
+        prec = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
+        ap = voc_ap(rec, prec, use_07_metric)
+        ret.append((rec, prec, ap))
+    return ret
@@ -11,17 +11,27 @@ import torch
 from fvcore.common.file_io import PathManager
 
 from detectron2.data import DatasetCatalog, MetadataCatalog
-from detectron2.utils.comm import all_gather, is_main_process, synchronize
+from detectron2.utils.comm import all_reduce_sum, gather, is_main_process, synchronize
 
-from .evaluator import DatasetEvaluator
+from .evaluator import BackgroundDatasetEvaluator
 
 
-class SemSegEvaluator(DatasetEvaluator):
+class SemSegEvaluator(BackgroundDatasetEvaluator):
     """
     Evaluate semantic segmentation metrics.
     """
 
-    def __init__(self, dataset_name, distributed, num_classes, ignore_label=255, output_dir=None):
+    def __init__(
+        self,
+        dataset_name,
+        distributed,
+        num_classes,
+        ignore_label=255,
+        output_dir=None,
+        *,
+        num_workers=0,
+        dump_predictions=True,
+    ):
         """
         Args:
             dataset_name (str): name of the dataset to be evaluated.
@@ -31,13 +41,25 @@ class SemSegEvaluator(DatasetEvaluator):
             ignore_label (int): value in semantic segmentation ground truth. Predictions for the
                 corresponding pixels should be ignored.
             output_dir (str): an output directory to dump results.
+            num_workers (int): number of background threads that load the ground truth and
+                update the confusion matrix, overlapping with inference.
+                If 0, it is done in :meth:`process`.
+            dump_predictions (bool): whether to dump the predictions in COCO stuff format
+                to "sem_seg_predictions.json" in `output_dir`. The predictions of all images
+                are kept in memory until :meth:`evaluate` to do so. If False, only the
+                confusion matrix is kept.
         """
+        super().__init__(num_workers=num_workers)
         self._dataset_name = dataset_name
         self._distributed = distributed
         self._output_dir = output_dir
         self._num_classes = num_classes
         self._ignore_label = ignore_label
         self._N = num_classes + 1
+        self._dump_predictions = bool(output_dir) and dump_predictions
+        # Use compact dtypes for the predictions and for the indices into the confusion matrix
+        self._pred_dtype = torch.uint8 if num_classes <= 256 else torch.int32
+        self._index_dtype = np.int32 if self._N ** 2 < 2 ** 31 else np.int64
 
         self._cpu_device = torch.device("cpu")
         self._logger = logging.getLogger(__name__)
@@ -57,6 +79,7 @@ class SemSegEvaluator(DatasetEvaluator):
         self._class_names = meta.stuff_classes
 
     def reset(self):
+        super().reset()
         self._conf_matrix = np.zeros((self._N, self._N), dtype=np.int64)
         self._predictions = []
 
@@ -71,18 +94,44 @@ class SemSegEvaluator(DatasetEvaluator):
                 segmentation prediction in the same format.
         """
         for input, output in zip(inputs, outputs):
-            output = output["sem_seg"].argmax(dim=0).to(self._cpu_device)
-            pred = np.array(output, dtype=np.int)
-            with PathManager.open(self.input_file_to_gt_file[input["file_name"]], "rb") as f:
-                gt = np.array(Image.open(f), dtype=np.int)
+            output = output["sem_seg"].argmax(dim=0).to(self._pred_dtype)
+            self.submit(self._process_single, output.to(self._cpu_device), input["file_name"])
+        self._collect_results(wait=False)
 
-            gt[gt == self._ignore_label] = self._num_classes
-
-            self._conf_matrix += np.bincount(
-                self._N * pred.reshape(-1) + gt.reshape(-1), minlength=self._N ** 2
-            ).reshape(self._N, self._N)
-
-            self._predictions.extend(self.encode_json_sem_seg(pred, input["file_name"]))
+    def _process_single(self, output, file_name):
+        """
+        Returns:
+            ndarray: flattened indices of the non-zero entries of the confusion matrix
+                of the image.
+            ndarray: the values of these entries.
+            list[dict]: the prediction of the image in COCO stuff format, or an empty
+                list if the predictions are not dumped.
+        """
+        pred = output.numpy()
+        with PathManager.open(self.input_file_to_gt_file[file_name], "rb") as f:
+            gt = np.asarray(Image.open(f)).astype(self._index_dtype)
+
+        gt[gt == self._ignore_label] = self._num_classes
+
+        indices = pred.astype(self._index_dtype).reshape(-1)
+        indices *= self._N
+        indices += gt.reshape(-1)
+        if self._N ** 2 <= indices.size:
+            counts = np.bincount(indices, minlength=self._N ** 2)
+            indices = np.flatnonzero(counts)
+            counts = counts[indices]
+        else:
+            # With many classes, a dense confusion matrix of the image is more expensive
+            # to create than the sorted pixels
+            indices, counts = np.unique(indices, return_counts=True)
+        predictions = self.encode_json_sem_seg(pred, file_name) if self._dump_predictions else []
+        return indices, counts, predictions
+
+    def _collect_results(self, wait):
+        for indices, counts, predictions in self.collect(wait=wait):
+            # indices are unique
+            self._conf_matrix.reshape(-1)[indices] += counts
+            self._predictions.extend(predictions)
 
     def evaluate(self):
         """
@@ -93,30 +142,28 @@ class SemSegEvaluator(DatasetEvaluator):
         * Mean pixel accuracy averaged across classes (mACC)
         * Pixel Accuracy (pACC)
         """
+        self._collect_results(wait=True)
         if self._distributed:
             synchronize()
-            conf_matrix_list = all_gather(self._conf_matrix)
-            self._predictions = all_gather(self._predictions)
-            self._predictions = list(itertools.chain(*self._predictions))
+            self._conf_matrix = all_reduce_sum(self._conf_matrix)
+            if self._dump_predictions:
+                self._predictions = gather(self._predictions)
+                self._predictions = list(itertools.chain(*self._predictions))
             if not is_main_process():
                 return
 
-            self._conf_matrix = np.zeros_like(self._conf_matrix)
-            for conf_matrix in conf_matrix_list:
-                self._conf_matrix += conf_matrix
-
-        if self._output_dir:
+        if self._dump_predictions:
             PathManager.mkdirs(self._output_dir)
             file_path = os.path.join(self._output_dir, "sem_seg_predictions.json")
             with PathManager.open(file_path, "w") as f:
                 f.write(json.dumps(self._predictions))
 
-        acc = np.full(self._num_classes, np.nan, dtype=np.float)
-        iou = np.full(self._num_classes, np.nan, dtype=np.float)
-        tp = self._conf_matrix.diagonal()[:-1].astype(np.float)
-        pos_gt = np.sum(self._conf_matrix[:-1, :-1], axis=0).astype(np.float)
+        acc = np.full(self._num_classes, np.nan, dtype=np.float64)
+        iou = np.full(self._num_classes, np.nan, dtype=np.float64)
+        tp = self._conf_matrix.diagonal()[:-1].astype(np.float64)
+        pos_gt = np.sum(self._conf_matrix[:-1, :-1], axis=0).astype(np.float64)
         class_weights = pos_gt / np.sum(pos_gt)
-        pos_pred = np.sum(self._conf_matrix[:-1, :-1], axis=1).astype(np.float)
+        pos_pred = np.sum(self._conf_matrix[:-1, :-1], axis=1).astype(np.float64)
         acc_valid = pos_gt > 0
         acc[acc_valid] = tp[acc_valid] / pos_gt[acc_valid]
         iou_valid = (pos_gt + pos_pred) > 0
@@ -2,8 +2,10 @@
 #include "cocoeval.h"
 #include <time.h>
 #include <algorithm>
+#include <atomic>
 #include <cstdint>
 #include <numeric>
+#include <thread>
 
 using namespace pybind11::literals;
 
@@ -11,6 +13,43 @@ namespace detectron2 {
 
 namespace COCOeval {
 
+// Call func(begin, end) on chunks of [0, n) using num_threads threads, which
+// take chunks dynamically because the cost of work items varies a lot.
+// num_threads <= 0 means the number of CPU cores. Work items must write to
+// disjoint outputs, so that the results do not depend on the number of threads
+template <typename Func>
+void ParallelFor(int64_t n, int num_threads, const Func& func) {
+  if (num_threads <= 0) {
+    num_threads = std::max(1u, std::thread::hardware_concurrency());
+  }
+  num_threads = std::min<int64_t>(num_threads, n);
+  if (num_threads <= 1) {
+    if (n > 0) {
+      func(0, n);
+    }
+    return;
+  }
+  const int64_t grain_size = std::max<int64_t>(1, n / (num_threads * 16));
+  std::atomic<int64_t> next_begin(0);
+  auto worker = [&]() {
+    for (;;) {
+      const int64_t begin = next_begin.fetch_add(grain_size);
+      if (begin >= n) {
+        break;
+      }
+      func(begin, std::min(n, begin + grain_size));
+    }
+  };
+  std::vector<std::thread> threads;
+  for (int k = 1; k < num_threads; ++k) {
+    threads.emplace_back(worker);
+  }
+  worker();
+  for (auto& thread : threads) {
+    thread.join();
+  }
+}
+
 // Sort detections from highest score to lowest, such that
 // detection_instances[detection_sorted_indices[t]] >=
 // detection_instances[detection_sorted_indices[t+1]].  Use stable_sort to match
@@ -147,53 +186,61 @@ std::vector<ImageEvaluation> EvaluateImages(
     const ImageCategoryInstances<InstanceAnnotation>&
         image_category_ground_truth_instances,
     const ImageCategoryInstances<InstanceAnnotation>&
-        image_category_detection_instances) {
+        image_category_detection_instances,
+    int num_threads) {
   const int num_area_ranges = area_ranges.size();
   const int num_images = image_category_ground_truth_instances.size();
   const int num_categories =
       image_category_ious.size() > 0 ? image_category_ious[0].size() : 0;
-  std::vector<uint64_t> detection_sorted_indices;
-  std::vector<uint64_t> ground_truth_sorted_indices;
-  std::vector<bool> ignores;
   std::vector<ImageEvaluation> results_all(
       num_images * num_area_ranges * num_categories);
 
+  py::gil_scoped_release release;
   // Store results for each image, category, and area range combination. Results
-  // for each IOU threshold are packed into the same ImageEvaluation object
-  for (auto i = 0; i < num_images; ++i) {
-    for (auto c = 0; c < num_categories; ++c) {
-      const std::vector<InstanceAnnotation>& ground_truth_instances =
-          image_category_ground_truth_instances[i][c];
-      const std::vector<InstanceAnnotation>& detection_instances =
-          image_category_detection_instances[i][c];
-
-      SortInstancesByDetectionScore(
-          detection_instances, &detection_sorted_indices);
-      if ((int)detection_sorted_indices.size() > max_detections) {
-        detection_sorted_indices.resize(max_detections);
-      }
-
-      for (size_t a = 0; a < area_ranges.size(); ++a) {
-        SortInstancesByIgnore(
-            area_ranges[a],
-            ground_truth_instances,
-            &ground_truth_sorted_indices,
-            &ignores);
-
-        MatchDetectionsToGroundTruth(
-            detection_instances,
-            detection_sorted_indices,
-            ground_truth_instances,
-            ground_truth_sorted_indices,
-            ignores,
-            image_category_ious[i][c],
-            iou_thresholds,
-            area_ranges[a],
-            &results_all
-                [c * num_area_ranges * num_images + a * num_images + i]);
-      }
-    }
-  }
+  // for each IOU threshold are packed into the same ImageEvaluation object.
+  // Each (image, category) pair is an independent work item
+  ParallelFor(
+      int64_t(num_images) * num_categories,
+      num_threads,
+      [&](int64_t begin, int64_t end) {
+        std::vector<uint64_t> detection_sorted_indices;
+        std::vector<uint64_t> ground_truth_sorted_indices;
+        std::vector<bool> ignores;
+        for (int64_t k = begin; k < end; ++k) {
+          const int64_t i = k / num_categories;
+          const int64_t c = k % num_categories;
+          const std::vector<InstanceAnnotation>& ground_truth_instances =
+              image_category_ground_truth_instances[i][c];
+          const std::vector<InstanceAnnotation>& detection_instances =
+              image_category_detection_instances[i][c];
+
+          SortInstancesByDetectionScore(
+              detection_instances, &detection_sorted_indices);
+          if ((int)detection_sorted_indices.size() > max_detections) {
+            detection_sorted_indices.resize(max_detections);
+          }
+
+          for (size_t a = 0; a < area_ranges.size(); ++a) {
+            SortInstancesByIgnore(
+                area_ranges[a],
+                ground_truth_instances,
+                &ground_truth_sorted_indices,
+                &ignores);
+
+            MatchDetectionsToGroundTruth(
+                detection_instances,
+                detection_sorted_indices,
+                ground_truth_instances,
+                ground_truth_sorted_indices,
+                ignores,
+                image_category_ious[i][c],
+                iou_thresholds,
+                area_ranges[a],
+                &results_all
+                    [c * num_area_ranges * num_images + a * num_images + i]);
+          }
+        }
+      });
 
   return results_all;
 }
@@ -371,7 +418,8 @@ void ComputePrecisionRecallCurve(
 }
 py::dict Accumulate(
     const py::object& params,
-    const std::vector<ImageEvaluation>& evaluations) {
+    const std::vector<ImageEvaluation>& evaluations,
+    int num_threads) {
   const std::vector<double> recall_thresholds =
       list_to_vec<double>(params.attr("recThrs"));
   const std::vector<int> max_detections =
@@ -398,83 +446,96 @@ py::dict Accumulate(
           num_area_ranges * num_max_detections,
       -1);
 
-  // Consider the list of all detected instances in the entire dataset in one
-  // large list.  evaluation_indices, detection_scores,
-  // image_detection_indices, and detection_sorted_indices all have the same
-  // length as this list, such that each entry corresponds to one detected
-  // instance
-  std::vector<uint64_t> evaluation_indices; // indices into evaluations[]
-  std::vector<double> detection_scores; // detection scores of each instance
-  std::vector<uint64_t> detection_sorted_indices; // sorted indices of all
-                                                  // instances in the dataset
-  std::vector<uint64_t>
-      image_detection_indices; // indices into the list of detected instances in
-                               // the same image as each instance
-  std::vector<double> precisions, recalls;
-
-  for (auto c = 0; c < num_categories; ++c) {
-    for (auto a = 0; a < num_area_ranges; ++a) {
-      for (auto m = 0; m < num_max_detections; ++m) {
-        // The COCO PythonAPI assumes evaluations[] (the return value of
-        // COCOeval::EvaluateImages() is one long list storing results for each
-        // combination of category, area range, and image id, with categories in
-        // the outermost loop and images in the innermost loop.
-        const int64_t evaluations_index =
-            c * num_area_ranges * num_images + a * num_images;
-        int num_valid_ground_truth = BuildSortedDetectionList(
-            evaluations,
-            evaluations_index,
-            num_images,
-            max_detections[m],
-            &evaluation_indices,
-            &detection_scores,
-            &detection_sorted_indices,
-            &image_detection_indices);
-
-        if (num_valid_ground_truth == 0) {
-          continue;
-        }
-
-        for (auto t = 0; t < num_iou_thresholds; ++t) {
-          // recalls_out is a flattened vectors representing a
-          // num_iou_thresholds X num_categories X num_area_ranges X
-          // num_max_detections matrix
-          const int64_t recalls_out_index =
-              t * num_categories * num_area_ranges * num_max_detections +
-              c * num_area_ranges * num_max_detections +
-              a * num_max_detections + m;
-
-          // precisions_out and scores_out are flattened vectors
-          // representing a num_iou_thresholds X num_recall_thresholds X
-          // num_categories X num_area_ranges X num_max_detections matrix
-          const int64_t precisions_out_stride =
-              num_categories * num_area_ranges * num_max_detections;
-          const int64_t precisions_out_index = t * num_recall_thresholds *
-                  num_categories * num_area_ranges * num_max_detections +
-              c * num_area_ranges * num_max_detections +
-              a * num_max_detections + m;
-
-          ComputePrecisionRecallCurve(
-              precisions_out_index,
-              precisions_out_stride,
-              recalls_out_index,
-              recall_thresholds,
-              t,
-              num_iou_thresholds,
-              num_valid_ground_truth,
-              evaluations,
-              evaluation_indices,
-              detection_scores,
-              detection_sorted_indices,
-              image_detection_indices,
-              &precisions,
-              &recalls,
-              &precisions_out,
-              &scores_out,
-              &recalls_out);
-        }
-      }
-    }
+  {
+    py::gil_scoped_release release;
+    // Each (category, area range, max detections) setting is an independent
+    // work item, which writes to its own entries of the outputs
+    ParallelFor(
+        int64_t(num_categories) * num_area_ranges * num_max_detections,
+        num_threads,
+        [&](int64_t begin, int64_t end) {
+          // Consider the list of all detected instances in the entire dataset
+          // in one large list.  evaluation_indices, detection_scores,
+          // image_detection_indices, and detection_sorted_indices all have the
+          // same length as this list, such that each entry corresponds to one
+          // detected instance
+          // evaluation_indices: indices into evaluations[]
+          // detection_scores: detection scores of each instance
+          // detection_sorted_indices: sorted indices of all instances in the
+          //   dataset
+          // image_detection_indices: indices into the list of detected
+          //   instances in the same image as each instance
+          std::vector<uint64_t> evaluation_indices;
+          std::vector<double> detection_scores;
+          std::vector<uint64_t> detection_sorted_indices;
+          std::vector<uint64_t> image_detection_indices;
+          std::vector<double> precisions, recalls;
+
+          for (int64_t k = begin; k < end; ++k) {
+            const int64_t c = k / (num_area_ranges * num_max_detections);
+            const int64_t a = k / num_max_detections % num_area_ranges;
+            const int64_t m = k % num_max_detections;
+            // The COCO PythonAPI assumes evaluations[] (the return value of
+            // COCOeval::EvaluateImages() is one long list storing results for
+            // each combination of category, area range, and image id, with
+            // categories in the outermost loop and images in the innermost
+            // loop.
+            const int64_t evaluations_index =
+                c * num_area_ranges * num_images + a * num_images;
+            int num_valid_ground_truth = BuildSortedDetectionList(
+                evaluations,
+                evaluations_index,
+                num_images,
+                max_detections[m],
+                &evaluation_indices,
+                &detection_scores,
+                &detection_sorted_indices,
+                &image_detection_indices);
+
+            if (num_valid_ground_truth == 0) {
+              continue;
+            }
+
+            for (auto t = 0; t < num_iou_thresholds; ++t) {
+              // recalls_out is a flattened vectors representing a
+              // num_iou_thresholds X num_categories X num_area_ranges X
+              // num_max_detections matrix
+              const int64_t recalls_out_index =
+                  t * num_categories * num_area_ranges * num_max_detections +
+                  c * num_area_ranges * num_max_detections +
+                  a * num_max_detections + m;
+
+              // precisions_out and scores_out are flattened vectors
+              // representing a num_iou_thresholds X num_recall_thresholds X
+              // num_categories X num_area_ranges X num_max_detections matrix
+              const int64_t precisions_out_stride =
+                  num_categories * num_area_ranges * num_max_detections;
+              const int64_t precisions_out_index = t * num_recall_thresholds *
+                      num_categories * num_area_ranges * num_max_detections +
+                  c * num_area_ranges * num_max_detections +
+                  a * num_max_detections + m;
+
+              ComputePrecisionRecallCurve(
+                  precisions_out_index,
+                  precisions_out_stride,
+                  recalls_out_index,
+                  recall_thresholds,
+                  t,
+                  num_iou_thresholds,
+                  num_valid_ground_truth,
+                  evaluations,
+                  evaluation_indices,
+                  detection_scores,
+                  detection_sorted_indices,
+                  image_detection_indices,
+                  &precisions,
+                  &recalls,
+                  &precisions_out,
+                  &scores_out,
+                  &recalls_out);
+            }
+          }
+        });
   }
 
   time_t rawtime;
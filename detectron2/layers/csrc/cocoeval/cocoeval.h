@@ -65,6 +65,8 @@ using ImageCategoryInstances = std::vector<std::vector<std::vector<T>>>;
 //     instances in image image_ids[i] of category category_ids[c]
 //   image_category_detection_instances[i][c] is a vector of detected
 //     instances in image image_ids[i] of category category_ids[c]
+// The (image, category) pairs are evaluated by num_threads threads (<= 0 means
+// the number of CPU cores). The results do not depend on num_threads.
 std::vector<ImageEvaluation> EvaluateImages(
     const std::vector<std::array<double, 2>>& area_ranges, // vector of 2-tuples
     int max_detections,
@@ -73,16 +75,19 @@ std::vector<ImageEvaluation> EvaluateImages(
     const ImageCategoryInstances<InstanceAnnotation>&
         image_category_ground_truth_instances,
     const ImageCategoryInstances<InstanceAnnotation>&
-        image_category_detection_instances);
+        image_category_detection_instances,
+    int num_threads = 1);
 
 // C++ implementation of COCOeval.accumulate(), which generates precision
 // recall curves for each set of category, IOU threshold, detection area range,
 // and max number of detections parameters.  It is assumed that the parameter
 // evaluations is the return value of the functon COCOeval::EvaluateImages(),
-// which was called with the same parameter settings params
+// which was called with the same parameter settings params. Like
+// EvaluateImages(), the work is split among num_threads threads.
 py::dict Accumulate(
     const py::object& params,
-    const std::vector<ImageEvaluation>& evalutations);
+    const std::vector<ImageEvaluation>& evalutations,
+    int num_threads = 1);
 
 } // namespace COCOeval
 } // namespace detectron2
@@ -0,0 +1,27 @@
+// Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#pragma once
+#include <torch/types.h>
+
+namespace detectron2 {
+
+std::tuple<at::Tensor, at::Tensor> paste_masks_cpu(
+    const at::Tensor& masks,
+    const at::Tensor& boxes,
+    const int64_t img_h,
+    const int64_t img_w,
+    const double threshold,
+    const bool packed);
+
+// Interface for Python
+inline std::tuple<at::Tensor, at::Tensor> paste_masks(
+    const at::Tensor& masks,
+    const at::Tensor& boxes,
+    const int64_t img_h,
+    const int64_t img_w,
+    const double threshold,
+    const bool packed) {
+  return paste_masks_cpu(
+      masks.contiguous(), boxes.contiguous(), img_h, img_w, threshold, packed);
+}
+
+} // namespace detectron2
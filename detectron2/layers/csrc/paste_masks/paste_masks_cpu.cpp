@@ -0,0 +1,167 @@
+// Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#include <ATen/Parallel.h>
+#include <algorithm>
+#include <array>
+#include <cmath>
+#include <vector>
+#include "paste_masks.h"
+
+namespace detectron2 {
+
+namespace {
+
+// Bilinear sampling location of one pixel along one axis.
+struct SampleLocation {
+  int64_t low; // index of the lower neighbor in the mask
+  float weight_low;
+  float weight_high;
+};
+
+// Compute where the pixels [start, end) of the image sample the mask along one
+// axis, for a box spanning [box_start, box_end). It follows the computation
+// of `_do_paste_mask` in mask_ops.py followed by F.grid_sample(bilinear,
+// align_corners=False) on CPU, operation by operation in float precision, so
+// that the results are identical to the python implementation.
+std::vector<SampleLocation> sample_locations(
+    int64_t start,
+    int64_t end,
+    float box_start,
+    float box_end,
+    int64_t mask_size) {
+  std::vector<SampleLocation> ret;
+  ret.reserve(std::max<int64_t>(end - start, 0));
+  const float box_size = box_end - box_start;
+  const float scaling_factor = static_cast<float>(mask_size) / 2;
+  for (int64_t i = start; i < end; i++) {
+    float coord = static_cast<float>(i) + 0.5f;
+    // normalize to [-1, 1] w.r.t. the box
+    coord = (coord - box_start) / box_size * 2.f - 1.f;
+    // unnormalize to the mask coordinates
+    coord = (coord + 1.f) * scaling_factor - 0.5f;
+    float low = std::floor(coord);
+    float weight_high = coord - low;
+    float weight_low = 1.f - weight_high;
+    ret.push_back({static_cast<int64_t>(low), weight_low, weight_high});
+  }
+  return ret;
+}
+
+// The region of the image that a box is pasted into, same as `_do_paste_mask`
+// with skip_empty=True. Returns x0, y0, x1, y1.
+std::array<int64_t, 4>
+paste_region(const float* box, int64_t img_h, int64_t img_w) {
+  int64_t x0 = static_cast<int64_t>(std::floor(box[0]) - 1);
+  int64_t y0 = static_cast<int64_t>(std::floor(box[1]) - 1);
+  int64_t x1 = static_cast<int64_t>(std::ceil(box[2]) + 1);
+  int64_t y1 = static_cast<int64_t>(std::ceil(box[3]) + 1);
+  x0 = std::min(std::max(x0, int64_t(0)), img_w);
+  y0 = std::min(std::max(y0, int64_t(0)), img_h);
+  x1 = std::max(std::min(x1, img_w), x0);
+  y1 = std::max(std::min(y1, img_h), y0);
+  return {x0, y0, x1, y1};
+}
+
+// Paste one mask of size mask_h x mask_w into the region, and write the
+// thresholded result to `out`, whose rows are `out_stride` apart.
+void paste_mask(
+    const float* mask,
+    int64_t mask_h,
+    int64_t mask_w,
+    const float* box,
+    const std::array<int64_t, 4>& region,
+    float threshold,
+    bool* out,
+    int64_t out_stride) {
+  auto xs = sample_locations(region[0], region[2], box[0], box[2], mask_w);
+  auto ys = sample_locations(region[1], region[3], box[1], box[3], mask_h);
+  auto value = [&](int64_t y, int64_t x) {
+    // zero padding
+    if (y < 0 || y >= mask_h || x < 0 || x >= mask_w) {
+      return 0.f;
+    }
+    return mask[y * mask_w + x];
+  };
+  for (size_t i = 0; i < ys.size(); i++) {
+    const auto& y = ys[i];
+    bool* out_row = out + i * out_stride;
+    for (size_t j = 0; j < xs.size(); j++) {
+      const auto& x = xs[j];
+      float nw = y.weight_low * x.weight_low;
+      float ne = y.weight_low * x.weight_high;
+      float sw = y.weight_high * x.weight_low;
+      float se = y.weight_high * x.weight_high;
+      float interpolated = value(y.low, x.low) * nw +
+          value(y.low, x.low + 1) * ne + value(y.low + 1, x.low) * sw +
+          value(y.low + 1, x.low + 1) * se;
+      out_row[j] = interpolated >= threshold;
+    }
+  }
+}
+
+} // namespace
+
+std::tuple<at::Tensor, at::Tensor> paste_masks_cpu(
+    const at::Tensor& masks,
+    const at::Tensor& boxes,
+    const int64_t img_h,
+    const int64_t img_w,
+    const double threshold,
+    const bool packed) {
+  AT_ASSERTM(masks.device().is_cpu(), "masks must be a CPU tensor");
+  AT_ASSERTM(boxes.device().is_cpu(), "boxes must be a CPU tensor");
+  AT_ASSERTM(
+      masks.scalar_type() == at::kFloat && boxes.scalar_type() == at::kFloat,
+      "masks and boxes must be float tensors");
+  AT_ASSERTM(masks.dim() == 3, "masks must have shape (N, M, M)");
+
+  const int64_t num_masks = masks.size(0);
+  const int64_t mask_h = masks.size(1), mask_w = masks.size(2);
+  const float* masks_ptr = masks.data_ptr<float>();
+  const float* boxes_ptr = boxes.data_ptr<float>();
+  const float thresh = static_cast<float>(threshold);
+
+  at::Tensor regions =
+      at::empty({num_masks, 4}, boxes.options().dtype(at::kLong));
+  int64_t* regions_ptr = regions.data_ptr<int64_t>();
+  // offsets of every region in the packed output
+  std::vector<int64_t> offsets(num_masks + 1, 0);
+  for (int64_t i = 0; i < num_masks; i++) {
+    auto region = paste_region(boxes_ptr + i * 4, img_h, img_w);
+    std::copy(region.begin(), region.end(), regions_ptr + i * 4);
+    offsets[i + 1] =
+        offsets[i] + (region[2] - region[0]) * (region[3] - region[1]);
+  }
+
+  at::Tensor output = packed
+      ? at::empty({offsets[num_masks]}, masks.options().dtype(at::kBool))
+      : at::zeros({num_masks, img_h, img_w}, masks.options().dtype(at::kBool));
+  bool* output_ptr = output.data_ptr<bool>();
+
+  at::parallel_for(0, num_masks, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t i = begin; i < end; i++) {
+      std::array<int64_t, 4> region;
+      std::copy(regions_ptr + i * 4, regions_ptr + i * 4 + 4, region.begin());
+      bool* out;
+      int64_t out_stride;
+      if (packed) {
+        out = output_ptr + offsets[i];
+        out_stride = region[2] - region[0];
+      } else {
+        out = output_ptr + (i * img_h + region[1]) * img_w + region[0];
+        out_stride = img_w;
+      }
+      paste_mask(
+          masks_ptr + i * mask_h * mask_w,
+          mask_h,
+          mask_w,
+          boxes_ptr + i * 4,
+          region,
+          thresh,
+          out,
+          out_stride);
+    }
+  });
+  return std::make_tuple(output, regions);
+}
+
+} // namespace detectron2
@@ -0,0 +1,29 @@
+// Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#pragma once
+#include <torch/types.h>
+
+namespace detectron2 {
+
+at::Tensor rasterize_polygons_cpu(
+    const at::Tensor& coords,
+    const at::Tensor& polygon_offsets,
+    const at::Tensor& instance_offsets,
+    const int64_t height,
+    const int64_t width);
+
+// Interface for Python
+inline at::Tensor rasterize_polygons(
+    const at::Tensor& coords,
+    const at::Tensor& polygon_offsets,
+    const at::Tensor& instance_offsets,
+    const int64_t height,
+    const int64_t width) {
+  return rasterize_polygons_cpu(
+      coords.contiguous(),
+      polygon_offsets.contiguous(),
+      instance_offsets.contiguous(),
+      height,
+      width);
+}
+
+} // namespace detectron2
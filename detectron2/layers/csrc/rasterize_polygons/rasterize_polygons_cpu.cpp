@@ -0,0 +1,159 @@
+// Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#include <ATen/Parallel.h>
+#include <algorithm>
+#include <climits>
+#include <cmath>
+#include <cstdlib>
+#include <vector>
+#include "rasterize_polygons.h"
+
+namespace detectron2 {
+
+namespace {
+
+// Same as the integer conversion done by the COCO API on x86, where
+// out-of-range values and NaN become INT_MIN.
+inline int to_int(double x) {
+  if (!(x > static_cast<double>(INT_MIN) - 1 &&
+        x < static_cast<double>(INT_MAX) + 1)) {
+    return INT_MIN;
+  }
+  return static_cast<int>(x);
+}
+
+// Record the position of a point along the y-boundary, where the mask toggles
+// its value. (u0, v0) and (u1, v1) are consecutive upsampled boundary points.
+inline void add_flip(
+    int u0,
+    int v0,
+    int u1,
+    int v1,
+    double scale,
+    int64_t h,
+    int64_t w,
+    std::vector<int64_t>& flips) {
+  if (u1 == u0) {
+    return;
+  }
+  double xd = static_cast<double>(u1 < u0 ? u1 : u1 - 1);
+  xd = (xd + .5) / scale - .5;
+  if (std::floor(xd) != xd || xd < 0 || xd > w - 1) {
+    return;
+  }
+  double yd = static_cast<double>(v1 < v0 ? v1 : v0);
+  yd = (yd + .5) / scale - .5;
+  if (yd < 0) {
+    yd = 0;
+  } else if (yd > h) {
+    yd = h;
+  }
+  yd = std::ceil(yd);
+  flips.push_back(static_cast<int64_t>(xd) * h + static_cast<int64_t>(yd));
+}
+
+// Find the positions in a h x w mask in column-major order (i.e. the order
+// used by RLE) where the mask of one polygon toggles its value. It follows
+// `rleFrPoly` in the COCO API step by step, so the result is identical to
+// pycocotools.mask.frPyObjects + decode.
+void polygon_to_flips(
+    const double* xy,
+    int64_t k,
+    int64_t h,
+    int64_t w,
+    std::vector<int64_t>& flips) {
+  const double scale = 5;
+  // upsample and get discrete points densely along entire boundary,
+  // then get points along y-boundary and downsample
+  bool first = true;
+  int u0 = 0, v0 = 0;
+  auto add_point = [&](int u, int v) {
+    if (!first) {
+      add_flip(u0, v0, u, v, scale, h, w, flips);
+    }
+    first = false;
+    u0 = u;
+    v0 = v;
+  };
+  for (int64_t j = 0; j < k; j++) {
+    int64_t j1 = j + 1 == k ? 0 : j + 1;
+    int xs = to_int(scale * xy[j * 2 + 0] + .5);
+    int ys = to_int(scale * xy[j * 2 + 1] + .5);
+    int xe = to_int(scale * xy[j1 * 2 + 0] + .5);
+    int ye = to_int(scale * xy[j1 * 2 + 1] + .5);
+    int dx = std::abs(xe - xs), dy = std::abs(ys - ye);
+    bool flip = (dx >= dy && xs > xe) || (dx < dy && ys > ye);
+    if (flip) {
+      std::swap(xs, xe);
+      std::swap(ys, ye);
+    }
+    double s = dx >= dy ? static_cast<double>(ye - ys) / dx
+                        : static_cast<double>(xe - xs) / dy;
+    if (dx >= dy) {
+      for (int d = 0; d <= dx; d++) {
+        int t = flip ? dx - d : d;
+        add_point(t + xs, to_int(ys + s * t + .5));
+      }
+    } else {
+      for (int d = 0; d <= dy; d++) {
+        int t = flip ? dy - d : d;
+        add_point(to_int(xs + s * t + .5), t + ys);
+      }
+    }
+  }
+}
+
+} // namespace
+
+at::Tensor rasterize_polygons_cpu(
+    const at::Tensor& coords,
+    const at::Tensor& polygon_offsets,
+    const at::Tensor& instance_offsets,
+    const int64_t height,
+    const int64_t width) {
+  AT_ASSERTM(coords.device().is_cpu(), "coords must be a CPU tensor");
+  AT_ASSERTM(
+      coords.scalar_type() == at::kDouble, "coords must be a double tensor");
+  AT_ASSERTM(
+      polygon_offsets.scalar_type() == at::kLong &&
+          instance_offsets.scalar_type() == at::kLong,
+      "offsets must be int64 tensors");
+
+  const int64_t num_instances = instance_offsets.numel() - 1;
+  at::Tensor masks = at::zeros(
+      {num_instances, height, width}, coords.options().dtype(at::kBool));
+  if (num_instances <= 0) {
+    return masks;
+  }
+  const double* xy = coords.data_ptr<double>();
+  const int64_t* poly_offsets = polygon_offsets.data_ptr<int64_t>();
+  const int64_t* inst_offsets = instance_offsets.data_ptr<int64_t>();
+  bool* out = masks.data_ptr<bool>();
+  const int64_t area = height * width;
+
+  at::parallel_for(0, num_instances, 1, [&](int64_t begin, int64_t end) {
+    std::vector<int64_t> flips;
+    for (int64_t i = begin; i < end; i++) {
+      bool* mask = out + i * area;
+      // union of the polygons of the instance
+      for (int64_t p = inst_offsets[i]; p < inst_offsets[i + 1]; p++) {
+        flips.clear();
+        int64_t start = poly_offsets[p];
+        int64_t num_points = (poly_offsets[p + 1] - start) / 2;
+        polygon_to_flips(xy + start, num_points, height, width, flips);
+        std::sort(flips.begin(), flips.end());
+        flips.push_back(area);
+        // the polygon covers [flips[0], flips[1]), [flips[2], flips[3]), ...
+        for (size_t j = 0; j + 1 < flips.size(); j += 2) {
+          int64_t range_end = std::min(flips[j + 1], area);
+          for (int64_t pos = flips[j]; pos < range_end; pos++) {
+            // column-major to row-major
+            mask[(pos % height) * width + pos / height] = true;
+          }
+        }
+      }
+    }
+  });
+  return masks;
+}
+
+} // namespace detectron2
@@ -7,6 +7,8 @@
 #include "cocoeval/cocoeval.h"
 #include "deformable/deform_conv.h"
 #include "nms_rotated/nms_rotated.h"
+#include "paste_masks/paste_masks.h"
+#include "rasterize_polygons/rasterize_polygons.h"
 
 namespace detectron2 {
 
@@ -93,6 +95,13 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
 
   m.def("nms_rotated", &nms_rotated, "NMS for rotated boxes");
 
+  m.def("paste_masks", &paste_masks, "Paste masks into their boxes on CPU");
+
+  m.def(
+      "rasterize_polygons",
+      &rasterize_polygons,
+      "Rasterize the polygons of many instances into bitmasks");
+
   m.def("roi_align_forward", &ROIAlign_forward, "ROIAlign_forward");
   m.def("roi_align_backward", &ROIAlign_backward, "ROIAlign_backward");
 
@@ -105,14 +114,43 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
       &ROIAlignRotated_backward,
       "Backward pass for Rotated ROI-Align Operator");
 
-  m.def("COCOevalAccumulate", &COCOeval::Accumulate, "COCOeval::Accumulate");
+  m.def(
+      "COCOevalAccumulate",
+      &COCOeval::Accumulate,
+      "COCOeval::Accumulate",
+      pybind11::arg("params"),
+      pybind11::arg("evaluations"),
+      pybind11::arg("num_threads") = 1);
   m.def(
       "COCOevalEvaluateImages",
       &COCOeval::EvaluateImages,
-      "COCOeval::EvaluateImages");
+      "COCOeval::EvaluateImages",
+      pybind11::arg("area_ranges"),
+      pybind11::arg("max_detections"),
+      pybind11::arg("iou_thresholds"),
+      pybind11::arg("image_category_ious"),
+      pybind11::arg("image_category_ground_truth_instances"),
+      pybind11::arg("image_category_detection_instances"),
+      pybind11::arg("num_threads") = 1);
   pybind11::class_<COCOeval::InstanceAnnotation>(m, "InstanceAnnotation")
       .def(pybind11::init<uint64_t, double, double, bool, bool>());
   pybind11::class_<COCOeval::ImageEvaluation>(m, "ImageEvaluation")
-      .def(pybind11::init<>());
+      .def(pybind11::init<>())
+      .def(pybind11::pickle(
+          [](const COCOeval::ImageEvaluation& e) {
+            return pybind11::make_tuple(
+                e.detection_matches,
+                e.detection_scores,
+                e.ground_truth_ignores,
+                e.detection_ignores);
+          },
+          [](pybind11::tuple t) {
+            COCOeval::ImageEvaluation e;
+            e.detection_matches = t[0].cast<std::vector<uint64_t>>();
+            e.detection_scores = t[1].cast<std::vector<double>>();
+            e.ground_truth_ignores = t[2].cast<std::vector<bool>>();
+            e.detection_ignores = t[3].cast<std::vector<bool>>();
+            return e;
+          }));
 }
 } // namespace detectron2
@@ -64,6 +64,43 @@ def _do_paste_mask(masks, boxes, img_h, img_w, skip_empty=True):
         return img_masks[:, 0], ()
 
 
+def _paste_masks_cpu(masks, boxes, image_shape, threshold=0.5, packed=False):
+    """
+    A CPU implementation of :func:`paste_masks_in_image` that produces identical results.
+    Each mask is resampled only inside the region of its box, and the masks are pasted
+    in parallel with multiple threads.
+
+    Args:
+        masks, boxes, image_shape: see :func:`paste_masks_in_image`.
+        threshold (float): must be >= 0.
+        packed (bool): whether to return only the content of the regions.
+
+    Returns:
+        if packed == False, a bool tensor of shape (N, img_h, img_w).
+        if packed == True, a tuple (values, regions). regions is an int64 tensor of
+            shape (N, 4), the (x0, y0, x1, y1) region of the image that each mask
+            is pasted into. All pixels outside the regions are zero. values is a 1D
+            bool tensor, the concatenation of the content of all regions in row-major order.
+    """
+    from detectron2 import _C
+
+    assert threshold >= 0, "Only binary masks are supported on CPU!"
+    if not isinstance(boxes, torch.Tensor):
+        boxes = boxes.tensor
+    img_h, img_w = image_shape
+    values, regions = _C.paste_masks(
+        masks.to(device="cpu", dtype=torch.float32),
+        boxes.to(device="cpu", dtype=torch.float32),
+        int(img_h),
+        int(img_w),
+        threshold,
+        packed,
+    )
+    if packed:
+        return values, regions
+    return values
+
+
 def paste_masks_in_image(masks, boxes, image_shape, threshold=0.5):
     """
     Paste a set of masks that are of a fixed resolution (e.g., 28 x 28) into an image.
@@ -102,6 +139,10 @@ def paste_masks_in_image(masks, boxes, image_shape, threshold=0.5):
 
     img_h, img_w = image_shape
 
+    if device.type == "cpu" and threshold >= 0 and not torch._C._get_tracing_state():
+        # Use the faster C++ implementation when possible
+        return _paste_masks_cpu(masks, boxes, image_shape, threshold)
+
     # The actual implementation split the input into chunks,
     # and paste them chunk by chunk.
     if device.type == "cpu":
@@ -16,12 +16,16 @@ def batched_nms(
     assert boxes.shape[-1] == 4
     # TODO may need better strategy.
     # Investigate after having a fully-cuda NMS op.
-    if len(boxes) < 40000:
+    # On CPU, torchvision also runs NMS for each category separately when there are more
+    # than 1000 boxes, but it compares all `idxs` with each category, which is slow for
+    # many categories (e.g. (image, class) pairs). Below, the boxes are grouped by sorting.
+    if len(boxes) < (1000 if boxes.device.type == "cpu" else 40000):
         return box_ops.batched_nms(boxes, scores, idxs, iou_threshold)
 
     result_mask = scores.new_zeros(scores.size(), dtype=torch.bool)
-    for id in torch.jit.annotate(List[int], torch.unique(idxs).cpu().tolist()):
-        mask = (idxs == id).nonzero().view(-1)
+    sorted_idxs, order = idxs.sort()
+    counts = torch.unique_consecutive(sorted_idxs, return_counts=True)[1]
+    for mask in order.split(torch.jit.annotate(List[int], counts.cpu().tolist())):
         keep = nms(boxes[mask], scores[mask], iou_threshold)
         result_mask[mask[keep]] = True
     keep = result_mask.nonzero().view(-1)
@@ -1,5 +1,6 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import math
+from collections import OrderedDict
 from typing import List
 import torch
 from torch import nn
@@ -49,6 +50,53 @@ def _create_grid_offsets(size: List[int], stride: int, offset: float, device: to
     return shift_x, shift_y
 
 
+class _AnchorCache:
+    """
+    A bounded LRU cache of the anchors generated for the feature maps of each input shape.
+    The anchors are returned as is, so callers must not modify them in-place.
+    """
+
+    def __init__(self, max_size):
+        """
+        Args:
+            max_size (int): the maximum number of input shapes to keep anchors for.
+                0 disables the cache.
+        """
+        self._max_size = max_size
+        self._cache = OrderedDict()
+
+    def get(self, grid_sizes, cell_anchors, generate):
+        """
+        Args:
+            grid_sizes (list[tuple[int]]): the size (H, W) of each feature map.
+            cell_anchors (BufferList): the cell anchors, whose device and dtype
+                are used in the key.
+            generate (callable): called with `grid_sizes` to generate the anchors
+                when they are not in the cache.
+        """
+        # The anchors have to be computed from the (symbolic) shapes while tracing
+        if self._max_size <= 0 or torch.jit.is_tracing():
+            return generate(grid_sizes)
+        base_anchors = next(iter(cell_anchors))
+        key = (
+            tuple(tuple(int(x) for x in size) for size in grid_sizes),
+            base_anchors.device,
+            base_anchors.dtype,
+        )
+        anchors = self._cache.get(key)
+        if anchors is None:
+            anchors = generate(grid_sizes)
+            self._cache[key] = anchors
+            if len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return anchors
+
+    def clear(self):
+        self._cache.clear()
+
+
 def _broadcast_params(params, num_features, name):
     """
     If one size (or aspect ratio) is specified and there are multiple feature
@@ -89,7 +137,7 @@ class DefaultAnchorGenerator(nn.Module):
     """
 
     @configurable
-    def __init__(self, *, sizes, aspect_ratios, strides, offset=0.5):
+    def __init__(self, *, sizes, aspect_ratios, strides, offset=0.5, cache_size=8):
         """
         This interface is experimental.
 
@@ -106,6 +154,9 @@ class DefaultAnchorGenerator(nn.Module):
             offset (float): Relative offset between the center of the first anchor and the top-left
                 corner of the image. Value has to be in [0, 1).
                 Recommend to use 0.5, which means half stride.
+            cache_size (int): number of input shapes to cache the generated anchors for.
+                For inputs of a fixed size (e.g. videos), generating anchors then
+                becomes a lookup. Set to 0 to disable the cache.
         """
         super().__init__()
 
@@ -117,6 +168,7 @@ class DefaultAnchorGenerator(nn.Module):
 
         self.offset = offset
         assert 0.0 <= self.offset < 1.0, self.offset
+        self._anchor_cache = _AnchorCache(cache_size)
 
     @classmethod
     def from_config(cls, cfg, input_shape: List[ShapeSpec]):
@@ -156,6 +208,11 @@ class DefaultAnchorGenerator(nn.Module):
         """
         return [len(cell_anchors) for cell_anchors in self.cell_anchors]
 
+    def _load_from_state_dict(self, *args, **kwargs):
+        # the cell anchors may change
+        self._anchor_cache.clear()
+        super()._load_from_state_dict(*args, **kwargs)
+
     def _grid_anchors(self, grid_sizes: List[List[int]]):
         """
         Returns:
@@ -221,9 +278,19 @@ class DefaultAnchorGenerator(nn.Module):
                 where Hi, Wi are resolution of the feature map divided by anchor stride.
         """
         grid_sizes = [feature_map.shape[-2:] for feature_map in features]
+        if not torch.jit.is_scripting():
+            return self._cached_anchors(grid_sizes)
         anchors_over_all_feature_maps = self._grid_anchors(grid_sizes)
         return [Boxes(x) for x in anchors_over_all_feature_maps]
 
+    @torch.jit.unused
+    def _cached_anchors(self, grid_sizes: List[List[int]]) -> List[Boxes]:
+        return self._anchor_cache.get(
+            grid_sizes,
+            self.cell_anchors,
+            lambda grid_sizes: [Boxes(x) for x in self._grid_anchors(grid_sizes)],
+        )
+
 
 @ANCHOR_GENERATOR_REGISTRY.register()
 class RotatedAnchorGenerator(nn.Module):
@@ -238,7 +305,7 @@ class RotatedAnchorGenerator(nn.Module):
     """
 
     @configurable
-    def __init__(self, *, sizes, aspect_ratios, strides, angles, offset=0.5):
+    def __init__(self, *, sizes, aspect_ratios, strides, angles, offset=0.5, cache_size=8):
         """
         This interface is experimental.
 
@@ -257,6 +324,9 @@ class RotatedAnchorGenerator(nn.Module):
             offset (float): Relative offset between the center of the first anchor and the top-left
                 corner of the image. Value has to be in [0, 1).
                 Recommend to use 0.5, which means half stride.
+            cache_size (int): number of input shapes to cache the generated anchors for.
+                For inputs of a fixed size (e.g. videos), generating anchors then
+                becomes a lookup. Set to 0 to disable the cache.
         """
         super().__init__()
 
@@ -269,6 +339,7 @@ class RotatedAnchorGenerator(nn.Module):
 
         self.offset = offset
         assert 0.0 <= self.offset < 1.0, self.offset
+        self._anchor_cache = _AnchorCache(cache_size)
 
     @classmethod
     def from_config(cls, cfg, input_shape: List[ShapeSpec]):
@@ -309,6 +380,11 @@ class RotatedAnchorGenerator(nn.Module):
         """
         return [len(cell_anchors) for cell_anchors in self.cell_anchors]
 
+    def _load_from_state_dict(self, *args, **kwargs):
+        # the cell anchors may change
+        self._anchor_cache.clear()
+        super()._load_from_state_dict(*args, **kwargs)
+
     def _grid_anchors(self, grid_sizes):
         anchors = []
         for size, stride, base_anchors in zip(grid_sizes, self.strides, self.cell_anchors):
@@ -368,8 +444,11 @@ class RotatedAnchorGenerator(nn.Module):
                 where Hi, Wi are resolution of the feature map divided by anchor stride.
         """
         grid_sizes = [feature_map.shape[-2:] for feature_map in features]
-        anchors_over_all_feature_maps = self._grid_anchors(grid_sizes)
-        return [RotatedBoxes(x) for x in anchors_over_all_feature_maps]
+        return self._anchor_cache.get(
+            grid_sizes,
+            self.cell_anchors,
+            lambda grid_sizes: [RotatedBoxes(x) for x in self._grid_anchors(grid_sizes)],
+        )
 
 
 def build_anchor_generator(cfg, input_shape):
@@ -22,7 +22,11 @@ class Matcher(object):
     """
 
     def __init__(
-        self, thresholds: List[float], labels: List[int], allow_low_quality_matches: bool = False
+        self,
+        thresholds: List[float],
+        labels: List[int],
+        allow_low_quality_matches: bool = False,
+        chunk_size: int = 0,
     ):
         """
         Args:
@@ -34,6 +38,8 @@ class Matcher(object):
             allow_low_quality_matches (bool): if True, produce additional matches
                 for predictions with maximum match quality lower than high_threshold.
                 See set_low_quality_matches_ for more details.
+            chunk_size (int): if positive, :meth:`match_pairwise` computes the match quality
+                of at most `chunk_size` predictions at a time. See :meth:`match_pairwise`.
 
             For example,
                 thresholds = [0.3, 0.5]
@@ -57,6 +63,7 @@ class Matcher(object):
         self.thresholds = thresholds
         self.labels = labels
         self.allow_low_quality_matches = allow_low_quality_matches
+        self.chunk_size = chunk_size
 
     def __call__(self, match_quality_matrix):
         """
@@ -91,15 +98,129 @@ class Matcher(object):
         # Max over gt elements (dim 0) to find best gt candidate for each prediction
         matched_vals, matches = match_quality_matrix.max(dim=0)
 
-        match_labels = matches.new_full(matches.size(), 1, dtype=torch.int8)
+        match_labels = self._label_matches(matched_vals)
+
+        if self.allow_low_quality_matches:
+            self.set_low_quality_matches_(match_labels, match_quality_matrix)
+
+        return matches, match_labels
+
+    def _label_matches(self, matched_vals):
+        match_labels = matched_vals.new_full(matched_vals.size(), 1, dtype=torch.int8)
 
         for (l, low, high) in zip(self.labels, self.thresholds[:-1], self.thresholds[1:]):
             low_high = (matched_vals >= low) & (matched_vals < high)
             match_labels[low_high] = l
+        return match_labels
+
+    @torch.jit.unused
+    def match_pairwise(self, pairwise_quality, gt, preds):
+        """
+        Match predicted elements to ground-truth elements. Same as
+        ``self(pairwise_quality(gt, preds))``, but when `chunk_size` is positive and there
+        are more predictions, the MxN match_quality_matrix is never materialized:
+        the quality is computed for `chunk_size` predictions at a time, keeping the best
+        match of each prediction and the highest quality of each ground-truth element.
+        This bounds the memory for images with many ground-truth elements.
+
+        Args:
+            pairwise_quality (callable): computes the MxN match_quality_matrix of
+                M ground-truth elements and N predicted elements, e.g. :func:`pairwise_iou`.
+            gt: the M ground-truth elements, e.g. a :class:`Boxes`.
+            preds: the N predicted elements. Must support slicing, e.g. a :class:`Boxes`.
+
+        Returns:
+            Same as :meth:`__call__`.
+        """
+        num_preds = len(preds)
+        if self.chunk_size <= 0 or num_preds <= self.chunk_size or len(gt) == 0:
+            return self(pairwise_quality(gt, preds))
+
+        matched_vals, matches = [], []
+        highest_quality_per_chunk = []  # #chunks vectors of length M
+        for start in range(0, num_preds, self.chunk_size):
+            match_quality_matrix = pairwise_quality(gt, preds[start : start + self.chunk_size])
+            assert torch.all(match_quality_matrix >= 0)
+            matched_vals_i, matches_i = match_quality_matrix.max(dim=0)
+            matched_vals.append(matched_vals_i)
+            matches.append(matches_i)
+            if self.allow_low_quality_matches:
+                highest_quality_per_chunk.append(match_quality_matrix.max(dim=1)[0])
+            del match_quality_matrix
+        matches = torch.cat(matches)
+        match_labels = self._label_matches(torch.cat(matched_vals))
 
         if self.allow_low_quality_matches:
-            self.set_low_quality_matches_(match_labels, match_quality_matrix)
+            # Same as `set_low_quality_matches_`. Only the chunks where a ground-truth
+            # element reaches its highest quality are computed again, for those elements.
+            highest_quality_per_chunk = torch.stack(highest_quality_per_chunk, dim=1)  # M x C
+            highest_quality_foreach_gt = highest_quality_per_chunk.max(dim=1)[0]
+            gt_inds, chunk_inds = nonzero_tuple(
+                highest_quality_per_chunk == highest_quality_foreach_gt[:, None]
+            )
+            for chunk_idx in torch.unique(chunk_inds).tolist():
+                gt_inds_i = gt_inds[chunk_inds == chunk_idx]
+                start = chunk_idx * self.chunk_size
+                match_quality_matrix = pairwise_quality(
+                    gt[gt_inds_i], preds[start : start + self.chunk_size]
+                )
+                _, pred_inds_with_highest_quality = nonzero_tuple(
+                    match_quality_matrix == highest_quality_foreach_gt[gt_inds_i, None]
+                )
+                match_labels[pred_inds_with_highest_quality + start] = 1
+        return matches, match_labels
 
+    def match_batched(self, match_quality_matrix, gt_mask, pred_mask):
+        """
+        Same as :meth:`__call__`, but for a batch of padded match quality matrices,
+        e.g. of the boxes in multiple images.
+
+        Args:
+            match_quality_matrix (Tensor[float]): a BxMxN tensor, containing the pairwise
+                quality between M ground-truth elements and N predicted elements of each
+                item in the batch, padded to the largest M and N.
+            gt_mask (Tensor[bool]): a BxM tensor, whether a ground-truth element is not padding.
+            pred_mask (Tensor[bool]): a BxN tensor, whether a prediction is not padding.
+
+        Returns:
+            matches (Tensor[int64]): a BxN tensor, the matched ground-truth indices.
+            match_labels (Tensor[int8]): a BxN tensor, the labels of predictions.
+                The values for padded predictions are undefined.
+        """
+        assert match_quality_matrix.dim() == 3
+        batch_size, num_gt, num_preds = match_quality_matrix.shape
+        if num_gt == 0:
+            # Same as in __call__ for each item
+            default_matches = match_quality_matrix.new_full(
+                (batch_size, num_preds), 0, dtype=torch.int64
+            )
+            default_match_labels = match_quality_matrix.new_full(
+                (batch_size, num_preds), self.labels[0], dtype=torch.int8
+            )
+            return default_matches, default_match_labels
+
+        assert torch.all(match_quality_matrix >= 0)
+
+        # Padded ground-truth elements never match
+        match_quality_matrix = match_quality_matrix.masked_fill(~gt_mask[:, :, None], -1)
+        matched_vals, matches = match_quality_matrix.max(dim=1)
+        # Items without ground-truth elements get the default matches and labels,
+        # as if the quality was 0
+        has_gt = gt_mask.any(dim=1)
+        matches[~has_gt] = 0
+        match_labels = self._label_matches(matched_vals.clamp(min=0))
+
+        if self.allow_low_quality_matches and num_preds > 0:
+            # Same as `set_low_quality_matches_` for each item
+            highest_quality_foreach_gt, _ = match_quality_matrix.masked_fill(
+                ~pred_mask[:, None, :], -1
+            ).max(dim=2)
+            is_highest_quality = (
+                (match_quality_matrix == highest_quality_foreach_gt[:, :, None])
+                & gt_mask[:, :, None]
+                & pred_mask[:, None, :]
+            )
+            match_labels[is_highest_quality.any(dim=1)] = 1
         return matches, match_labels
 
     def set_low_quality_matches_(self, match_labels, match_quality_matrix):
@@ -34,6 +34,8 @@ class PanopticFPN(nn.Module):
         self.combine_instances_confidence_threshold = (
             cfg.MODEL.PANOPTIC_FPN.COMBINE.INSTANCES_CONFIDENCE_THRESH
         )
+        # The panoptic segmentation is combined from full-image masks
+        self.mask_format = "bitmask" if self.combine_on else cfg.TEST.MASK_FORMAT
 
         self.backbone = build_backbone(cfg)
         self.proposal_generator = build_proposal_generator(cfg, self.backbone.output_shape())
@@ -114,7 +116,9 @@ class PanopticFPN(nn.Module):
             height = input_per_image.get("height", image_size[0])
             width = input_per_image.get("width", image_size[1])
             sem_seg_r = sem_seg_postprocess(sem_seg_result, image_size, height, width)
-            detector_r = detector_postprocess(detector_result, height, width)
+            detector_r = detector_postprocess(
+                detector_result, height, width, mask_format=self.mask_format
+            )
 
             processed_results.append({"sem_seg": sem_seg_r, "instances": detector_r})
 
@@ -40,6 +40,7 @@ class GeneralizedRCNN(nn.Module):
         pixel_std: Tuple[float],
         input_format: Optional[str] = None,
         vis_period: int = 0,
+        mask_format: str = "bitmask",
     ):
         """
         NOTE: this interface is experimental.
@@ -53,6 +54,8 @@ class GeneralizedRCNN(nn.Module):
                 the input image
             input_format: describe the meaning of channels of input. Needed by visualization
             vis_period: the period to run visualization. Set to 0 to disable.
+            mask_format: the format of the output masks in inference, "bitmask" or "rle".
+                See :func:`detector_postprocess`.
         """
         super().__init__()
         self.backbone = backbone
@@ -61,6 +64,7 @@ class GeneralizedRCNN(nn.Module):
 
         self.input_format = input_format
         self.vis_period = vis_period
+        self.mask_format = mask_format
         if vis_period > 0:
             assert input_format is not None, "input_format is required for visualization!"
 
@@ -81,6 +85,7 @@ class GeneralizedRCNN(nn.Module):
             "vis_period": cfg.VIS_PERIOD,
             "pixel_mean": cfg.MODEL.PIXEL_MEAN,
             "pixel_std": cfg.MODEL.PIXEL_STD,
+            "mask_format": cfg.TEST.MASK_FORMAT,
         }
 
     @property
@@ -209,7 +214,9 @@ class GeneralizedRCNN(nn.Module):
             results = self.roi_heads.forward_with_given_boxes(features, detected_instances)
 
         if do_postprocess:
-            return GeneralizedRCNN._postprocess(results, batched_inputs, images.image_sizes)
+            return GeneralizedRCNN._postprocess(
+                results, batched_inputs, images.image_sizes, self.mask_format
+            )
         else:
             return results
 
@@ -223,7 +230,7 @@ class GeneralizedRCNN(nn.Module):
         return images
 
     @staticmethod
-    def _postprocess(instances, batched_inputs, image_sizes):
+    def _postprocess(instances, batched_inputs, image_sizes, mask_format="bitmask"):
         """
         Rescale the output instances to the target size.
         """
@@ -234,7 +241,7 @@ class GeneralizedRCNN(nn.Module):
         ):
             height = input_per_image.get("height", image_size[0])
             width = input_per_image.get("width", image_size[1])
-            r = detector_postprocess(results_per_image, height, width)
+            r = detector_postprocess(results_per_image, height, width, mask_format=mask_format)
             processed_results.append({"instances": r})
         return processed_results
 
@@ -75,6 +75,7 @@ class RetinaNet(nn.Module):
             cfg.MODEL.RETINANET.IOU_THRESHOLDS,
             cfg.MODEL.RETINANET.IOU_LABELS,
             allow_low_quality_matches=True,
+            chunk_size=cfg.MODEL.MATCHER_CHUNK_SIZE,
         )
 
         self.register_buffer("pixel_mean", torch.Tensor(cfg.MODEL.PIXEL_MEAN).view(-1, 1, 1))
@@ -275,9 +276,9 @@ class RetinaNet(nn.Module):
         gt_labels = []
         matched_gt_boxes = []
         for gt_per_image in gt_instances:
-            match_quality_matrix = pairwise_iou(gt_per_image.gt_boxes, anchors)
-            matched_idxs, anchor_labels = self.anchor_matcher(match_quality_matrix)
-            del match_quality_matrix
+            matched_idxs, anchor_labels = self.anchor_matcher.match_pairwise(
+                pairwise_iou, gt_per_image.gt_boxes, anchors
+            )
 
             if len(gt_per_image) > 0:
                 matched_gt_boxes_i = gt_per_image.gt_boxes.tensor[matched_idxs]
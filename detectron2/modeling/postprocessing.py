@@ -3,12 +3,16 @@ import torch
 from torch.nn import functional as F
 
 from detectron2.layers import paste_masks_in_image
-from detectron2.structures import Instances
+from detectron2.layers.mask_ops import _paste_masks_cpu
+from detectron2.structures import Instances, RLEMasks
+from detectron2.structures.masks import encode_rle_in_region
 from detectron2.utils.memory import retry_if_cuda_oom
 
 
 # perhaps should rename to "resize_instance"
-def detector_postprocess(results, output_height, output_width, mask_threshold=0.5):
+def detector_postprocess(
+    results, output_height, output_width, mask_threshold=0.5, mask_format="bitmask"
+):
     """
     Resize the output instances.
     The input images are often resized when entering an object detector.
@@ -23,6 +27,9 @@ def detector_postprocess(results, output_height, output_width, mask_threshold=0.
             `results.image_size` contains the input image resolution the detector sees.
             This object might be modified in-place.
         output_height, output_width: the desired output resolution.
+        mask_format (str): "bitmask" to produce "pred_masks" as a full-image bool Tensor,
+            or "rle" to produce them as :class:`RLEMasks`. The latter pastes every mask
+            only inside its box on CPU, and never creates full-image masks.
 
     Returns:
         Instances: the resized output from the model, based on the output resolution
@@ -58,12 +65,21 @@ def detector_postprocess(results, output_height, output_width, mask_threshold=0.
     results = results[output_boxes.nonempty()]
 
     if results.has("pred_masks"):
-        results.pred_masks = retry_if_cuda_oom(paste_masks_in_image)(
-            results.pred_masks[:, 0, :, :],  # N, 1, M, M
-            results.pred_boxes,
-            results.image_size,
-            threshold=mask_threshold,
-        )
+        if mask_format == "rle":
+            results.pred_masks = _paste_masks_as_rle(
+                results.pred_masks[:, 0, :, :],  # N, 1, M, M
+                results.pred_boxes.tensor,
+                results.image_size,
+                threshold=mask_threshold,
+            )
+        else:
+            assert mask_format == "bitmask", mask_format
+            results.pred_masks = retry_if_cuda_oom(paste_masks_in_image)(
+                results.pred_masks[:, 0, :, :],  # N, 1, M, M
+                results.pred_boxes,
+                results.image_size,
+                threshold=mask_threshold,
+            )
 
     if results.has("pred_keypoints"):
         results.pred_keypoints[:, :, 0] *= scale_x
@@ -72,6 +88,23 @@ def detector_postprocess(results, output_height, output_width, mask_threshold=0.
     return results
 
 
+def _paste_masks_as_rle(masks, boxes, image_shape, threshold):
+    """
+    Same as :func:`paste_masks_in_image`, but returns :class:`RLEMasks`.
+    Each mask is pasted into the region of its box, and encoded from there.
+    """
+    img_h, img_w = image_shape
+    values, regions = _paste_masks_cpu(masks, boxes, image_shape, threshold, packed=True)
+    values = values.numpy()
+    rles = []
+    offset = 0
+    for x0, y0, x1, y1 in regions.tolist():
+        region = values[offset : offset + (y1 - y0) * (x1 - x0)].reshape(y1 - y0, x1 - x0)
+        offset += region.size
+        rles.append(encode_rle_in_region(region, y0, x0, img_h, img_w))
+    return RLEMasks(rles)
+
+
 def sem_seg_postprocess(result, img_size, output_height, output_width):
     """
     Return semantic segmentation predictions in the original resolution.
@@ -79,6 +79,18 @@ def find_top_rpn_proposals(
     level_ids = cat(level_ids, dim=0)
 
     # 3. For each image, run a per-level NMS, and choose topk results.
+    if num_images > 1:
+        return _find_top_proposals_batched(
+            topk_proposals,
+            topk_scores,
+            level_ids,
+            len(proposals),
+            image_sizes,
+            nms_thresh,
+            post_nms_topk,
+            min_box_size,
+            training,
+        )
     results: List[Instances] = []
     for n, image_size in enumerate(image_sizes):
         boxes = Boxes(topk_proposals[n])
@@ -118,6 +130,86 @@ def find_top_rpn_proposals(
     return results
 
 
+def _find_top_proposals_batched(
+    topk_proposals: torch.Tensor,
+    topk_scores: torch.Tensor,
+    level_ids: torch.Tensor,
+    num_levels: int,
+    image_sizes: List[Tuple[int, int]],
+    nms_thresh: float,
+    post_nms_topk: int,
+    min_box_size: float,
+    training: bool,
+):
+    """
+    Step 3 of `find_top_rpn_proposals` for all images at once: the proposals of all images
+    are clipped and filtered together, and go through a single NMS which uses
+    (image, level) as the category of a proposal. The results are then split by image.
+
+    Args:
+        topk_proposals (Tensor): shape (N, topk, 4), the top-k proposals of all levels.
+        topk_scores (Tensor): shape (N, topk), their objectness logits.
+        level_ids (Tensor): shape (topk,), their levels.
+        num_levels (int): the number of levels.
+        others: same as `find_top_rpn_proposals`.
+
+    Returns:
+        Same as `find_top_rpn_proposals`.
+    """
+    num_images, num_proposals = topk_scores.shape
+    device = topk_scores.device
+    boxes = topk_proposals.reshape(-1, 4)
+    scores = topk_scores.reshape(-1)
+    image_inds = torch.arange(num_images, device=device).repeat_interleave(num_proposals)
+    lvl = level_ids.repeat(num_images)
+
+    valid_mask = torch.isfinite(boxes).all(dim=1) & torch.isfinite(scores)
+    if not valid_mask.all():
+        if training:
+            raise FloatingPointError(
+                "Predicted boxes or scores contain Inf/NaN. Training has diverged."
+            )
+        boxes, scores, image_inds, lvl = (
+            boxes[valid_mask],
+            scores[valid_mask],
+            image_inds[valid_mask],
+            lvl[valid_mask],
+        )
+    # Same as `Boxes.clip`, but with the size of the image of each box
+    max_xy = torch.tensor(
+        [[size[1], size[0]] for size in image_sizes], dtype=boxes.dtype, device=device
+    )
+    boxes = torch.min(boxes.view(-1, 2, 2).clamp(min=0), max_xy[image_inds][:, None])
+    boxes = boxes.view(-1, 4)
+
+    # filter empty boxes, same as `Boxes.nonempty`
+    widths = boxes[:, 2] - boxes[:, 0]
+    heights = boxes[:, 3] - boxes[:, 1]
+    keep = (widths > min_box_size) & (heights > min_box_size)
+    boxes, scores, image_inds, lvl = boxes[keep], scores[keep], image_inds[keep], lvl[keep]
+
+    keep = batched_nms(boxes, scores, image_inds * num_levels + lvl, nms_thresh)
+    # Group the kept proposals by image, in the order of decreasing scores within each image,
+    # and keep the post_nms_topk first ones of each image.
+    group_keys = image_inds[keep] * len(keep) + torch.arange(len(keep), device=device)
+    keep = keep[group_keys.argsort()]
+    num_kept_per_image = torch.bincount(image_inds[keep], minlength=num_images)
+    image_starts = num_kept_per_image.cumsum(0) - num_kept_per_image
+    ranks = torch.arange(len(keep), device=device) - image_starts[image_inds[keep]]
+    keep = keep[ranks < post_nms_topk]
+    num_kept: List[int] = num_kept_per_image.clamp(max=post_nms_topk).tolist()
+
+    results: List[Instances] = []
+    for image_size, boxes_per_img, scores_per_img in zip(
+        image_sizes, boxes[keep].split(num_kept), scores[keep].split(num_kept)
+    ):
+        res = Instances(image_size)
+        res.proposal_boxes = Boxes(boxes_per_img)
+        res.objectness_logits = scores_per_img
+        results.append(res)
+    return results
+
+
 def add_ground_truth_to_proposals(gt_boxes, proposals):
     """
     Call `add_ground_truth_to_proposals_single_image` for all images.
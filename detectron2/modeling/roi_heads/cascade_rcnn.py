@@ -14,7 +14,7 @@ from ..matcher import Matcher
 from ..poolers import ROIPooler
 from .box_head import build_box_head
 from .fast_rcnn import FastRCNNOutputLayers, fast_rcnn_inference
-from .roi_heads import ROI_HEADS_REGISTRY, StandardROIHeads
+from .roi_heads import ROI_HEADS_REGISTRY, StandardROIHeads, _pad_tensors
 
 
 class _ScaleGradient(Function):
@@ -125,7 +125,14 @@ class CascadeROIHeads(StandardROIHeads):
                     box2box_transform=Box2BoxTransform(weights=bbox_reg_weights),
                 )
             )
-            proposal_matchers.append(Matcher([match_iou], [0, 1], allow_low_quality_matches=False))
+            proposal_matchers.append(
+                Matcher(
+                    [match_iou],
+                    [0, 1],
+                    allow_low_quality_matches=False,
+                    chunk_size=cfg.MODEL.MATCHER_CHUNK_SIZE,
+                )
+            )
         return {
             "box_in_features": in_features,
             "box_pooler": box_pooler,
@@ -220,13 +227,14 @@ class CascadeROIHeads(StandardROIHeads):
         Returns:
             list[Instances]: the same proposals, but with fields "gt_classes" and "gt_boxes"
         """
+        if self.batched_label_and_sample and self.proposal_matchers[stage].chunk_size <= 0:
+            return self._match_and_label_boxes_batched(proposals, stage, targets)
         num_fg_samples, num_bg_samples = [], []
         for proposals_per_image, targets_per_image in zip(proposals, targets):
-            match_quality_matrix = pairwise_iou(
-                targets_per_image.gt_boxes, proposals_per_image.proposal_boxes
-            )
             # proposal_labels are 0 or 1
-            matched_idxs, proposal_labels = self.proposal_matchers[stage](match_quality_matrix)
+            matched_idxs, proposal_labels = self.proposal_matchers[stage].match_pairwise(
+                pairwise_iou, targets_per_image.gt_boxes, proposals_per_image.proposal_boxes
+            )
             if len(targets_per_image) > 0:
                 gt_classes = targets_per_image.gt_classes[matched_idxs]
                 # Label unmatched proposals (0 label from matcher) as background (label=num_classes)
@@ -255,6 +263,43 @@ class CascadeROIHeads(StandardROIHeads):
         )
         return proposals
 
+    def _match_and_label_boxes_batched(self, proposals, stage, targets):
+        """
+        Same as :meth:`_match_and_label_boxes`, but matches the proposals of all images at once.
+        """
+        # proposal_labels are 0 or 1
+        matched_idxs, proposal_labels, proposal_mask, gt_mask = self._match_proposals_batched(
+            self.proposal_matchers[stage], proposals, targets
+        )
+        gt_classes, _ = _pad_tensors([x.gt_classes for x in targets])
+        gt_boxes, _ = _pad_tensors([x.gt_boxes.tensor for x in targets])
+        if gt_classes.shape[1] > 0:
+            gt_classes = gt_classes.gather(1, matched_idxs)
+            # The gt boxes of images without gt are the zero padding
+            gt_boxes = gt_boxes.gather(1, matched_idxs[:, :, None].expand(-1, -1, 4))
+        else:
+            gt_classes = torch.zeros_like(matched_idxs)
+            gt_boxes = gt_boxes.new_zeros(matched_idxs.shape + (4,))
+        # Label unmatched proposals (0 label from matcher) as background (label=num_classes)
+        gt_classes[proposal_labels == 0] = self.num_classes
+        gt_classes[~gt_mask.any(dim=1)] = self.num_classes
+        for k, proposals_per_image in enumerate(proposals):
+            num_proposals = len(proposals_per_image)
+            proposals_per_image.gt_classes = gt_classes[k, :num_proposals]
+            proposals_per_image.gt_boxes = Boxes(gt_boxes[k, :num_proposals])
+
+        # Log the number of fg/bg samples in each stage
+        num_fg_samples = ((proposal_labels == 1) & proposal_mask).sum().item()
+        num_bg_samples = proposal_mask.sum().item() - num_fg_samples
+        storage = get_event_storage()
+        storage.put_scalar(
+            "stage{}/roi_head/num_fg_samples".format(stage), num_fg_samples / len(proposals)
+        )
+        storage.put_scalar(
+            "stage{}/roi_head/num_bg_samples".format(stage), num_bg_samples / len(proposals)
+        )
+        return proposals
+
     def _run_stage(self, features, proposals, stage):
         """
         Args:
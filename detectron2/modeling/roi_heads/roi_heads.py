@@ -16,7 +16,7 @@ from ..backbone.resnet import BottleneckBlock, ResNet
 from ..matcher import Matcher
 from ..poolers import ROIPooler
 from ..proposal_generator.proposal_utils import add_ground_truth_to_proposals
-from ..sampling import subsample_labels
+from ..sampling import subsample_labels, subsample_labels_batched
 from .box_head import build_box_head
 from .fast_rcnn import FastRCNNOutputLayers
 from .keypoint_head import build_keypoint_head
@@ -120,6 +120,48 @@ def select_proposals_with_visible_keypoints(proposals: List[Instances]) -> List[
     return ret
 
 
+def _pad_tensors(tensors: List[torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Pad tensors of shape (Li, ...) with zeros to a tensor of shape (N, max(Li), ...).
+
+    Returns:
+        Tensor: the padded tensor.
+        Tensor: a (N, max(Li)) mask of the elements that are not padding.
+    """
+    lengths = torch.as_tensor([len(x) for x in tensors], device=tensors[0].device)
+    padded = torch.nn.utils.rnn.pad_sequence(tensors, batch_first=True)
+    mask = torch.arange(padded.shape[1], device=lengths.device)[None, :] < lengths[:, None]
+    return padded, mask
+
+
+def _padded_pairwise_iou(boxes1: torch.Tensor, boxes2: torch.Tensor) -> torch.Tensor:
+    """
+    Same as :func:`pairwise_iou`, but for (N, M, 4) and (N, P, 4) tensors of boxes.
+
+    Returns:
+        Tensor: IoU, sized [N, M, P].
+    """
+    area1 = (boxes1[..., 2] - boxes1[..., 0]) * (boxes1[..., 3] - boxes1[..., 1])  # [N,M]
+    area2 = (boxes2[..., 2] - boxes2[..., 0]) * (boxes2[..., 3] - boxes2[..., 1])  # [N,P]
+    width_height = torch.min(boxes1[:, :, None, 2:], boxes2[:, None, :, 2:]) - torch.max(
+        boxes1[:, :, None, :2], boxes2[:, None, :, :2]
+    )  # [N,M,P,2]
+    width_height.clamp_(min=0)
+    inter = width_height.prod(dim=3)  # [N,M,P]
+    return torch.where(
+        inter > 0,
+        inter / (area1[:, :, None] + area2[:, None, :] - inter),
+        torch.zeros(1, dtype=inter.dtype, device=inter.device),
+    )
+
+
+def _cat_fields(instances: List[Instances], names) -> Instances:
+    """
+    Concatenate the fields `names` of Instances of possibly different image sizes.
+    """
+    return Instances.cat([Instances((0, 0), **{k: x.get(k) for k in names}) for x in instances])
+
+
 class ROIHeads(torch.nn.Module):
     """
     ROIHeads perform all per-region computation in an R-CNN.
@@ -143,7 +185,8 @@ class ROIHeads(torch.nn.Module):
         batch_size_per_image,
         positive_fraction,
         proposal_matcher,
-        proposal_append_gt=True
+        proposal_append_gt=True,
+        batched_label_and_sample=False
     ):
         """
         NOTE: this interface is experimental.
@@ -155,6 +198,8 @@ class ROIHeads(torch.nn.Module):
                 to sample for training.
             proposal_matcher (Matcher): matcher that matches proposals and ground truth
             proposal_append_gt (bool): whether to include ground truth as proposals as well
+            batched_label_and_sample (bool): whether to match and sample the proposals of all
+                images at once. See :meth:`label_and_sample_proposals`.
         """
         super().__init__()
         self.batch_size_per_image = batch_size_per_image
@@ -162,6 +207,7 @@ class ROIHeads(torch.nn.Module):
         self.num_classes = num_classes
         self.proposal_matcher = proposal_matcher
         self.proposal_append_gt = proposal_append_gt
+        self.batched_label_and_sample = batched_label_and_sample
 
     @classmethod
     def from_config(cls, cfg):
@@ -170,11 +216,13 @@ class ROIHeads(torch.nn.Module):
             "positive_fraction": cfg.MODEL.ROI_HEADS.POSITIVE_FRACTION,
             "num_classes": cfg.MODEL.ROI_HEADS.NUM_CLASSES,
             "proposal_append_gt": cfg.MODEL.ROI_HEADS.PROPOSAL_APPEND_GT,
+            "batched_label_and_sample": cfg.MODEL.ROI_HEADS.BATCHED_LABEL_AND_SAMPLE,
             # Matcher to assign box proposals to gt boxes
             "proposal_matcher": Matcher(
                 cfg.MODEL.ROI_HEADS.IOU_THRESHOLDS,
                 cfg.MODEL.ROI_HEADS.IOU_LABELS,
                 allow_low_quality_matches=False,
+                chunk_size=cfg.MODEL.MATCHER_CHUNK_SIZE,
             ),
         }
 
@@ -242,6 +290,9 @@ class ROIHeads(torch.nn.Module):
                   then the ground-truth box is random)
 
                 Other fields such as "gt_classes", "gt_masks", that's included in `targets`.
+
+            When `batched_label_and_sample` is True, the proposals of all images are matched
+            and sampled at once by :meth:`_label_and_sample_proposals_batched`.
         """
         gt_boxes = [x.gt_boxes for x in targets]
         # Augment proposals with ground-truth boxes.
@@ -257,6 +308,8 @@ class ROIHeads(torch.nn.Module):
         # points (under one tested configuration).
         if self.proposal_append_gt:
             proposals = add_ground_truth_to_proposals(gt_boxes, proposals)
+        if self.batched_label_and_sample and self.proposal_matcher.chunk_size <= 0:
+            return self._label_and_sample_proposals_batched(proposals, targets)
 
         proposals_with_gt = []
 
@@ -264,10 +317,9 @@ class ROIHeads(torch.nn.Module):
         num_bg_samples = []
         for proposals_per_image, targets_per_image in zip(proposals, targets):
             has_gt = len(targets_per_image) > 0
-            match_quality_matrix = pairwise_iou(
-                targets_per_image.gt_boxes, proposals_per_image.proposal_boxes
+            matched_idxs, matched_labels = self.proposal_matcher.match_pairwise(
+                pairwise_iou, targets_per_image.gt_boxes, proposals_per_image.proposal_boxes
             )
-            matched_idxs, matched_labels = self.proposal_matcher(match_quality_matrix)
             sampled_idxs, gt_classes = self._sample_proposals(
                 matched_idxs, matched_labels, targets_per_image.gt_classes
             )
@@ -304,6 +356,123 @@ class ROIHeads(torch.nn.Module):
 
         return proposals_with_gt
 
+    def _match_proposals_batched(
+        self, matcher: Matcher, proposals: List[Instances], targets: List[Instances]
+    ):
+        """
+        Match the proposals of all images with their ground truth at once,
+        using padded (N x P) proposal boxes and (N x M) ground-truth boxes.
+
+        Returns:
+            matched_idxs (Tensor): N x P, the best-matched gt index of each proposal.
+            matched_labels (Tensor): N x P, the matcher's label of each proposal.
+            proposal_mask (Tensor): N x P, whether a proposal is not padding.
+            gt_mask (Tensor): N x M, whether a gt is not padding.
+        """
+        proposal_boxes, proposal_mask = _pad_tensors([x.proposal_boxes.tensor for x in proposals])
+        gt_boxes, gt_mask = _pad_tensors([x.gt_boxes.tensor for x in targets])
+        match_quality_matrix = _padded_pairwise_iou(gt_boxes, proposal_boxes)
+        matched_idxs, matched_labels = matcher.match_batched(
+            match_quality_matrix, gt_mask, proposal_mask
+        )
+        return matched_idxs, matched_labels, proposal_mask, gt_mask
+
+    def _label_and_sample_proposals_batched(
+        self, proposals: List[Instances], targets: List[Instances]
+    ) -> List[Instances]:
+        """
+        Same as the loop over images in :meth:`label_and_sample_proposals`, but matches and
+        samples the proposals of all images at once, and indexes the fields of proposals
+        and targets of all images at once.
+        """
+        num_images = len(proposals)
+        device = proposals[0].proposal_boxes.device
+        matched_idxs, matched_labels, proposal_mask, gt_mask = self._match_proposals_batched(
+            self.proposal_matcher, proposals, targets
+        )
+        has_gt = gt_mask.any(dim=1)
+
+        # Same as `_sample_proposals` for each image
+        gt_classes, _ = _pad_tensors([x.gt_classes for x in targets])
+        if gt_classes.shape[1] > 0:
+            gt_classes = gt_classes.gather(1, matched_idxs)
+        else:
+            gt_classes = torch.zeros_like(matched_idxs)
+        gt_classes[matched_labels == 0] = self.num_classes
+        gt_classes[matched_labels == -1] = -1
+        gt_classes[~has_gt] = self.num_classes
+        gt_classes[~proposal_mask] = -1
+        sampled_idxs, num_sampled = subsample_labels_batched(
+            gt_classes, self.batch_size_per_image, self.positive_fraction, self.num_classes
+        )
+        image_inds = torch.repeat_interleave(torch.arange(num_images, device=device), num_sampled)
+        sampled_gt_classes = gt_classes[image_inds, sampled_idxs]
+
+        # Index the proposals of all images at once
+        num_proposals = proposal_mask.sum(dim=1)
+        proposal_starts = num_proposals.cumsum(0) - num_proposals
+        sampled_proposals = _cat_fields(proposals, proposals[0].get_fields().keys())[
+            sampled_idxs + proposal_starts[image_inds]
+        ]
+        # We index all the attributes of targets that start with "gt_"
+        # and have not been added to proposals yet (="gt_classes"), for images with gt.
+        # Fields that may differ in size across images (e.g. BitMasks) or cannot be
+        # concatenated (e.g. Keypoints) are indexed per image.
+        target_names = [
+            name
+            for name in targets[0].get_fields().keys()
+            if name.startswith("gt_") and name != "gt_classes" and not proposals[0].has(name)
+        ]
+        cat_names = [
+            name for name in target_names if isinstance(targets[0].get(name), (torch.Tensor, Boxes))
+        ]
+        per_image_names = [name for name in target_names if name not in cat_names]
+        sampled_gt_idxs = matched_idxs[image_inds, sampled_idxs]
+        sampled_has_gt = has_gt[image_inds]
+        if sampled_has_gt.any():
+            num_gt = gt_mask.sum(dim=1)
+            gt_starts = num_gt.cumsum(0) - num_gt
+            targets_with_gt = [x for x in targets if len(x) > 0]
+            sampled_targets = _cat_fields(targets_with_gt, cat_names)[
+                (sampled_gt_idxs + gt_starts[image_inds])[sampled_has_gt]
+            ]
+
+        proposals_with_gt = []
+        start = target_start = 0
+        for proposals_per_image, targets_per_image, num_sampled_i, has_gt_i in zip(
+            proposals, targets, num_sampled.tolist(), has_gt.tolist()
+        ):
+            end = start + num_sampled_i
+            proposals_per_image = Instances(
+                proposals_per_image.image_size, **sampled_proposals[start:end].get_fields()
+            )
+            proposals_per_image.gt_classes = sampled_gt_classes[start:end]
+            if has_gt_i:
+                target_end = target_start + num_sampled_i
+                for (trg_name, trg_value) in (
+                    sampled_targets[target_start:target_end].get_fields().items()
+                ):
+                    proposals_per_image.set(trg_name, trg_value)
+                for trg_name in per_image_names:
+                    trg_value = targets_per_image.get(trg_name)[sampled_gt_idxs[start:end]]
+                    proposals_per_image.set(trg_name, trg_value)
+                target_start = target_end
+            else:
+                proposals_per_image.gt_boxes = Boxes(
+                    targets_per_image.gt_boxes.tensor.new_zeros((num_sampled_i, 4))
+                )
+            proposals_with_gt.append(proposals_per_image)
+            start = end
+
+        # Log the number of fg/bg samples that are selected for training ROI heads
+        num_bg_samples = (sampled_gt_classes == self.num_classes).sum().item()
+        num_fg_samples = sampled_gt_classes.numel() - num_bg_samples
+        storage = get_event_storage()
+        storage.put_scalar("roi_head/num_fg_samples", num_fg_samples / num_images)
+        storage.put_scalar("roi_head/num_bg_samples", num_bg_samples / num_images)
+
+        return proposals_with_gt
+
     def forward(
         self,
         images: ImageList,
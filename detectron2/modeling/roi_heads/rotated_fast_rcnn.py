@@ -244,10 +244,9 @@ class RROIHeads(StandardROIHeads):
         num_bg_samples = []
         for proposals_per_image, targets_per_image in zip(proposals, targets):
             has_gt = len(targets_per_image) > 0
-            match_quality_matrix = pairwise_iou_rotated(
-                targets_per_image.gt_boxes, proposals_per_image.proposal_boxes
+            matched_idxs, matched_labels = self.proposal_matcher.match_pairwise(
+                pairwise_iou_rotated, targets_per_image.gt_boxes, proposals_per_image.proposal_boxes
             )
-            matched_idxs, matched_labels = self.proposal_matcher(match_quality_matrix)
             sampled_idxs, gt_classes = self._sample_proposals(
                 matched_idxs, matched_labels, targets_per_image.gt_classes
             )
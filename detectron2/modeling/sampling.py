@@ -3,7 +3,7 @@ import torch
 
 from detectron2.layers import nonzero_tuple
 
-__all__ = ["subsample_labels"]
+__all__ = ["subsample_labels", "subsample_labels_batched"]
 
 
 def subsample_labels(
@@ -52,3 +52,41 @@ def subsample_labels(
     pos_idx = positive[perm1]
     neg_idx = negative[perm2]
     return pos_idx, neg_idx
+
+
+def subsample_labels_batched(
+    labels: torch.Tensor, num_samples: int, positive_fraction: float, bg_label: int
+):
+    """
+    Same as :func:`subsample_labels`, but samples from each row of a batch of label vectors
+    at once.
+
+    Args:
+        labels (Tensor): (B, N) label vectors. Each row is sampled independently.
+        num_samples, positive_fraction, bg_label: same as :func:`subsample_labels`.
+
+    Returns:
+        sampled_idx (Tensor): 1D vector of the indices in [0, N) sampled from all rows,
+            concatenated. For each row, the sampled positives come first, followed by
+            the sampled negatives.
+        num_sampled (Tensor): (B,) the number of indices sampled from each row.
+    """
+    positive = (labels != -1) & (labels != bg_label)
+    negative = labels == bg_label
+
+    num_positive = positive.sum(dim=1)
+    # protect against not enough positive examples
+    num_pos = num_positive.clamp(max=int(num_samples * positive_fraction))
+    # protect against not enough negative examples
+    num_neg = torch.min(negative.sum(dim=1), num_samples - num_pos)
+
+    # Sort each row in a random order of the positives, followed by a random order of
+    # the negatives, followed by the others.
+    keys = torch.rand(labels.shape, device=labels.device)
+    keys += (~positive).to(keys.dtype) + (~positive & ~negative).to(keys.dtype)
+    order = keys.argsort(dim=1)
+    positions = torch.arange(labels.shape[1], device=labels.device)[None, :]
+    is_sampled = (positions < num_pos[:, None]) | (
+        (positions >= num_positive[:, None]) & (positions < (num_positive + num_neg)[:, None])
+    )
+    return order[is_sampled], num_pos + num_neg
@@ -215,7 +215,9 @@ class GeneralizedRCNNWithTTA(nn.Module):
             del augmented_inputs, augmented_instances
             # average the predictions
             merged_instances.pred_masks = self._reduce_pred_masks(outputs, tfms)
-            merged_instances = detector_postprocess(merged_instances, *orig_shape)
+            merged_instances = detector_postprocess(
+                merged_instances, *orig_shape, mask_format=self.cfg.TEST.MASK_FORMAT
+            )
             return {"instances": merged_instances}
         else:
             return {"instances": merged_instances}
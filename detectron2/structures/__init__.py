@@ -4,7 +4,14 @@ from .image_list import ImageList
 
 from .instances import Instances
 from .keypoints import Keypoints, heatmaps_to_keypoints
-from .masks import BitMasks, PolygonMasks, rasterize_polygons_within_box, polygons_to_bitmask
+from .masks import (
+    BitMasks,
+    PolygonMasks,
+    RLEMasks,
+    rasterize_polygons_within_box,
+    rasterize_polygons_within_boxes,
+    polygons_to_bitmask,
+)
 from .rotated_boxes import RotatedBoxes
 from .rotated_boxes import pairwise_iou as pairwise_iou_rotated
 
@@ -6,6 +6,7 @@ from typing import Any, Iterator, List, Union
 import pycocotools.mask as mask_util
 import torch
 
+from detectron2 import _C
 from detectron2.layers.roi_align import ROIAlign
 
 from .boxes import Boxes
@@ -29,7 +30,7 @@ def polygons_to_bitmask(polygons: List[np.ndarray], height: int, width: int) ->
     assert len(polygons) > 0, "COCOAPI does not support empty polygons"
     rles = mask_util.frPyObjects(polygons, height, width)
     rle = mask_util.merge(rles)
-    return mask_util.decode(rle).astype(np.bool)
+    return mask_util.decode(rle).astype(bool)
 
 
 def rasterize_polygons_within_box(
@@ -81,6 +82,70 @@ def rasterize_polygons_within_box(
     return mask
 
 
+def _flatten_polygons(polygons: List[List[np.ndarray]]):
+    """
+    Args:
+        polygons (list[list[ndarray]]): the polygons of each instance
+
+    Returns:
+        coords, polygon_offsets, instance_offsets: the arguments of
+            :func:`rasterize_polygons_within_boxes`
+    """
+    flat = list(itertools.chain.from_iterable(polygons))
+    coords = np.concatenate(flat).astype(np.float64) if len(flat) else np.zeros((0,))
+    polygon_offsets = np.cumsum([0] + [len(p) for p in flat], dtype=np.int64)
+    instance_offsets = np.cumsum([0] + [len(p) for p in polygons], dtype=np.int64)
+    return coords, polygon_offsets, instance_offsets
+
+
+def rasterize_polygons_within_boxes(
+    coords: np.ndarray,
+    polygon_offsets: np.ndarray,
+    instance_offsets: np.ndarray,
+    boxes: np.ndarray,
+    mask_size: int,
+) -> torch.Tensor:
+    """
+    Same as calling :func:`rasterize_polygons_within_box` for every instance,
+    but rasterizes the polygons of all instances in one pass, using multiple threads.
+
+    Args:
+        coords (ndarray): float64 array, the concatenated (x, y) coordinates of the
+            polygons of all instances.
+        polygon_offsets (ndarray): int array of size P+1. Polygon i is
+            ``coords[polygon_offsets[i]:polygon_offsets[i+1]]``.
+        instance_offsets (ndarray): int array of size N+1. Instance i consists of
+            polygons ``instance_offsets[i]`` to ``instance_offsets[i+1] - 1``.
+        boxes (ndarray): Nx4 array
+        mask_size (int):
+
+    Returns:
+        Tensor: BoolTensor of shape (N, mask_size, mask_size)
+    """
+    num_instances = len(instance_offsets) - 1
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    # Compute the scale factors in the same precision as rasterize_polygons_within_box,
+    # where max(w, 0.1) is a python float if w < 0.1 and of the dtype of boxes otherwise
+    wh = boxes[:, 2:] - boxes[:, :2]
+    ratios = np.where(wh < 0.1, mask_size / 0.1, mask_size / np.maximum(wh, 0.1))
+    ratios = ratios.astype(np.float64)
+
+    # Shift and rescale the coordinates of every point w.r.t. its box
+    point_instance = np.repeat(
+        np.repeat(np.arange(num_instances), np.diff(instance_offsets)),
+        np.diff(polygon_offsets) // 2,
+    )
+    xy = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    xy = (xy - boxes[point_instance, :2].astype(np.float64)) * ratios[point_instance]
+    return _C.rasterize_polygons(
+        torch.from_numpy(xy.reshape(-1)),
+        torch.as_tensor(polygon_offsets, dtype=torch.int64),
+        torch.as_tensor(instance_offsets, dtype=torch.int64),
+        mask_size,
+        mask_size,
+    )
+
+
 class BitMasks:
     """
     This class stores the segmentation masks for all objects in one image, in
@@ -163,8 +228,16 @@ class BitMasks:
         """
         if isinstance(polygon_masks, PolygonMasks):
             polygon_masks = polygon_masks.polygons
-        masks = [polygons_to_bitmask(p, height, width) for p in polygon_masks]
-        return BitMasks(torch.stack([torch.from_numpy(x) for x in masks]))
+        coords, polygon_offsets, instance_offsets = _flatten_polygons(polygon_masks)
+        assert (np.diff(instance_offsets) > 0).all(), "COCOAPI does not support empty polygons"
+        masks = _C.rasterize_polygons(
+            torch.from_numpy(coords),
+            torch.from_numpy(polygon_offsets),
+            torch.from_numpy(instance_offsets),
+            height,
+            width,
+        )
+        return BitMasks(masks)
 
     def crop_and_resize(self, boxes: torch.Tensor, mask_size: int) -> torch.Tensor:
         """
@@ -386,17 +459,11 @@ class PolygonMasks:
         # (several small tensors for representing a single instance mask)
         boxes = boxes.to(torch.device("cpu"))
 
-        results = [
-            rasterize_polygons_within_box(poly, box.numpy(), mask_size)
-            for poly, box in zip(self.polygons, boxes)
-        ]
-        """
-        poly: list[list[float]], the polygons for one instance
-        box: a tensor of shape (4,)
-        """
-        if len(results) == 0:
-            return torch.empty(0, mask_size, mask_size, dtype=torch.bool, device=device)
-        return torch.stack(results, dim=0).to(device=device)
+        # Rasterize the polygons of all instances together
+        results = rasterize_polygons_within_boxes(
+            *_flatten_polygons(self.polygons), boxes.numpy(), mask_size
+        )
+        return results.to(device=device)
 
     def area(self):
         """
@@ -436,3 +503,288 @@ class PolygonMasks:
             list(itertools.chain.from_iterable(pm.polygons for pm in polymasks_list))
         )
         return cat_polymasks
+
+
+def _rle_counts(rle: dict) -> np.ndarray:
+    """
+    Returns:
+        ndarray: the uncompressed run lengths of a COCO-style RLE, as an int64 array.
+            It's a vectorized port of `rleFrString` in the COCO API.
+    """
+    counts = rle["counts"]
+    if isinstance(counts, list):
+        return np.asarray(counts, dtype=np.int64)
+    if isinstance(counts, str):
+        counts = counts.encode("ascii")
+    c = np.frombuffer(counts, dtype=np.uint8).astype(np.int64) - 48
+    if len(c) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    # Each count is encoded by a group of 5-bit chunks, where 0x20 means "more chunks follow"
+    group_end = (c & 0x20) == 0
+    last = np.nonzero(group_end)[0]
+    group_start = np.concatenate([[0], last[:-1] + 1])
+    chunk_index = np.arange(len(c)) - np.repeat(group_start, last - group_start + 1)
+    values = np.add.reduceat((c & 0x1F) << (5 * chunk_index), group_start)
+    # sign extension
+    negative = (c[last] & 0x10) != 0
+    values[negative] -= np.left_shift(1, 5 * (chunk_index[last[negative]] + 1))
+    # Counts after the 3rd one are encoded as the difference with the count two places before
+    if len(values) > 2:
+        values[2::2] = np.cumsum(values[2::2])
+        values[1::2] = np.cumsum(values[1::2])
+    return values
+
+
+def _decode_rle_window(rle: dict, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+    """
+    Decode the region [y0:y1, x0:x1] of a COCO-style RLE, without decoding the full mask.
+
+    Returns:
+        ndarray: a bool array of shape (y1 - y0, x1 - x0)
+    """
+    height = rle["size"][0]
+    # The value of the mask toggles at these positions in column-major order
+    toggles = np.cumsum(_rle_counts(rle))
+    pos = np.arange(x0, x1)[None, :] * height + np.arange(y0, y1)[:, None]
+    return np.searchsorted(toggles, pos, side="right") % 2 == 1
+
+
+def encode_rle_in_region(mask: np.ndarray, y0: int, x0: int, height: int, width: int) -> dict:
+    """
+    Encode a mask whose non-zero pixels all lie within a region of the image
+    into a full-image COCO-style RLE, without creating the full-image mask.
+
+    Args:
+        mask (ndarray): a bool array, the mask inside the region
+        y0, x0 (int): the top-left corner of the region in the image
+        height, width (int): the size of the image
+
+    Returns:
+        dict: a compressed RLE, same as ``mask_util.encode`` of the full-image mask.
+    """
+    region_h, region_w = mask.shape
+    assert y0 >= 0 and x0 >= 0 and y0 + region_h <= height and x0 + region_w <= width
+    # Find where the value changes within every column of the region
+    padded = np.zeros((region_w, region_h + 2), dtype=bool)
+    padded[:, 1:-1] = mask.T
+    cols, rows = np.divmod(np.flatnonzero(padded[:, 1:] != padded[:, :-1]), region_h + 1)
+    toggles = (x0 + cols) * height + y0 + rows
+    # A run that ends at the bottom of one column and continues at the top of the
+    # next column toggles twice at the same position
+    dup = toggles[1:] == toggles[:-1]
+    keep = np.ones(len(toggles), dtype=bool)
+    keep[1:] &= ~dup
+    keep[:-1] &= ~dup
+    toggles = toggles[keep]
+    counts = np.diff(np.concatenate([[0], toggles, [height * width]]))
+    if len(counts) > 1 and counts[-1] == 0:
+        counts = counts[:-1]
+    rle = {"counts": counts.tolist(), "size": [height, width]}
+    return mask_util.frPyObjects(rle, height, width)
+
+
+class RLEMasks:
+    """
+    This class stores the segmentation masks for all objects in one image, in
+    COCO's compressed run-length encoding (RLE).
+    Full-image masks take much less memory than :class:`BitMasks` in this format, and
+    all operations here work without decoding the masks to full resolution.
+
+    Attributes:
+        rles (list[dict]): COCO-style RLEs, each has "size" ([height, width]) and
+            "counts" (compressed, as bytes).
+    """
+
+    def __init__(self, rles: List[dict]):
+        """
+        Args:
+            rles (list[dict]): COCO-style RLEs of all instances. Both compressed and
+                uncompressed RLEs are supported.
+        """
+        assert isinstance(rles, list), (
+            "Cannot create RLEMasks: Expect a list of RLEs per image. "
+            "Got '{}' instead.".format(type(rles))
+        )
+
+        def _make_rle(rle: dict) -> dict:
+            assert "counts" in rle and "size" in rle, rle
+            h, w = rle["size"]
+            counts = rle["counts"]
+            if isinstance(counts, list):
+                # uncompressed RLE
+                return mask_util.frPyObjects(rle, h, w)
+            if isinstance(counts, str):
+                counts = counts.encode("ascii")
+            return {"size": [int(h), int(w)], "counts": counts}
+
+        self.rles: List[dict] = [_make_rle(rle) for rle in rles]
+
+    def to(self, *args: Any, **kwargs: Any) -> "RLEMasks":
+        return self
+
+    @property
+    def device(self) -> torch.device:
+        return torch.device("cpu")
+
+    @staticmethod
+    def from_bitmasks(bitmasks: Union["BitMasks", torch.Tensor]) -> "RLEMasks":
+        """
+        Args:
+            bitmasks (BitMasks or Tensor): masks of shape (N, H, W)
+        """
+        if isinstance(bitmasks, BitMasks):
+            bitmasks = bitmasks.tensor
+        masks = bitmasks.to(device="cpu", dtype=torch.uint8).numpy()
+        if len(masks) == 0:
+            return RLEMasks([])
+        return RLEMasks(mask_util.encode(np.asfortranarray(masks.transpose(1, 2, 0))))
+
+    @staticmethod
+    def from_polygon_masks(
+        polygon_masks: Union["PolygonMasks", List[List[np.ndarray]]], height: int, width: int
+    ) -> "RLEMasks":
+        """
+        Args:
+            polygon_masks (list[list[ndarray]] or PolygonMasks)
+            height, width (int)
+        """
+        if isinstance(polygon_masks, PolygonMasks):
+            polygon_masks = polygon_masks.polygons
+        rles = []
+        for polygons in polygon_masks:
+            assert len(polygons) > 0, "COCOAPI does not support empty polygons"
+            rles.append(mask_util.merge(mask_util.frPyObjects(polygons, height, width)))
+        return RLEMasks(rles)
+
+    def get_bounding_boxes(self) -> Boxes:
+        """
+        Returns:
+            Boxes: tight bounding boxes around the masks.
+            If a mask is empty, it's bounding box will be all zero.
+        """
+        if len(self.rles) == 0:
+            return Boxes(torch.zeros(0, 4, dtype=torch.float32))
+        boxes = mask_util.toBbox(self.rles).reshape(-1, 4)
+        boxes[:, 2:] += boxes[:, :2]
+        return Boxes(torch.as_tensor(boxes, dtype=torch.float32))
+
+    def area(self) -> torch.Tensor:
+        """
+        Returns:
+            Tensor: a vector, the number of foreground pixels of each instance
+        """
+        if len(self.rles) == 0:
+            return torch.zeros(0, dtype=torch.int64)
+        return torch.as_tensor(mask_util.area(self.rles).astype(np.int64))
+
+    def nonempty(self) -> torch.Tensor:
+        """
+        Find masks that are non-empty.
+
+        Returns:
+            Tensor:
+                a BoolTensor which represents whether each mask is empty (False) or not (True).
+        """
+        return self.area() > 0
+
+    def __getitem__(self, item: Union[int, slice, List[int], torch.BoolTensor]) -> "RLEMasks":
+        """
+        Support indexing over the instances and return a `RLEMasks` object.
+        `item` can be:
+
+        1. An integer. It will return an object with only one instance.
+        2. A slice. It will return an object with the selected instances.
+        3. A list[int]. It will return an object with the selected instances,
+           correpsonding to the indices in the list.
+        4. A vector mask of type BoolTensor, whose length is num_instances.
+           It will return an object with the instances whose mask is nonzero.
+        """
+        if isinstance(item, int):
+            selected_rles = [self.rles[item]]
+        elif isinstance(item, slice):
+            selected_rles = self.rles[item]
+        elif isinstance(item, list):
+            selected_rles = [self.rles[i] for i in item]
+        elif isinstance(item, torch.Tensor):
+            if item.dtype == torch.bool:
+                assert item.dim() == 1, item.shape
+                item = item.nonzero().squeeze(1).cpu().numpy().tolist()
+            elif item.dtype in [torch.int32, torch.int64]:
+                item = item.cpu().numpy().tolist()
+            else:
+                raise ValueError("Unsupported tensor dtype={} for indexing!".format(item.dtype))
+            selected_rles = [self.rles[i] for i in item]
+        return RLEMasks(selected_rles)
+
+    def __iter__(self) -> Iterator[dict]:
+        """
+        Yields:
+            dict: the RLE of one instance.
+        """
+        return iter(self.rles)
+
+    def __repr__(self) -> str:
+        s = self.__class__.__name__ + "("
+        s += "num_instances={})".format(len(self.rles))
+        return s
+
+    def __len__(self) -> int:
+        return len(self.rles)
+
+    def crop_and_resize(self, boxes: torch.Tensor, mask_size: int) -> torch.Tensor:
+        """
+        Crop each mask by the given box, and resize results to (mask_size, mask_size).
+        This can be used to prepare training targets for Mask R-CNN.
+        The results are the same as :meth:`BitMasks.crop_and_resize`, but only the
+        region around each box is decoded.
+
+        Args:
+            boxes (Tensor): Nx4 tensor storing the boxes for each mask
+            mask_size (int): the size of the rasterized mask.
+
+        Returns:
+            Tensor: A bool tensor of shape (N, mask_size, mask_size), where
+            N is the number of predicted boxes for this image.
+        """
+        assert len(boxes) == len(self), "{} != {}".format(len(boxes), len(self))
+        device = boxes.device
+        boxes = boxes.to(device=torch.device("cpu"), dtype=torch.float32)
+        roi_align = ROIAlign((mask_size, mask_size), 1.0, 0, aligned=True)
+
+        results = torch.zeros(len(boxes), mask_size, mask_size, dtype=torch.bool)
+        for idx, (rle, box) in enumerate(zip(self.rles, boxes)):
+            height, width = rle["size"]
+            # The region that ROIAlign samples from, with a margin so that the sampling
+            # is not affected by the border of the region unless it's the image border.
+            bx0, by0, bx1, by1 = box.tolist()
+            x0 = min(max(int(np.floor(bx0)) - 2, 0), width)
+            y0 = min(max(int(np.floor(by0)) - 2, 0), height)
+            x1 = min(max(int(np.ceil(bx1)) + 2, x0), width)
+            y1 = min(max(int(np.ceil(by1)) + 2, y0), height)
+            if x1 == x0 or y1 == y0:
+                continue
+            region = torch.from_numpy(_decode_rle_window(rle, x0, y0, x1, y1))
+            roi = torch.cat([box.new_zeros(1), box - box.new_tensor([x0, y0, x0, y0])])
+            output = roi_align.forward(region[None, None].to(dtype=torch.float32), roi[None])
+            results[idx] = output[0, 0] >= 0.5
+        return results.to(device=device)
+
+    @staticmethod
+    def cat(rlemasks_list: List["RLEMasks"]) -> "RLEMasks":
+        """
+        Concatenates a list of RLEMasks into a single RLEMasks
+
+        Arguments:
+            rlemasks_list (list[RLEMasks])
+
+        Returns:
+            RLEMasks: the concatenated RLEMasks
+        """
+        assert isinstance(rlemasks_list, (list, tuple))
+        assert len(rlemasks_list) > 0
+        assert all(isinstance(rlemask, RLEMasks) for rlemask in rlemasks_list)
+
+        cat_rlemasks = type(rlemasks_list[0])(
+            list(itertools.chain.from_iterable(rm.rles for rm in rlemasks_list))
+        )
+        return cat_rlemasks
@@ -7,7 +7,10 @@ This is useful when doing distributed training.
 import functools
 import logging
 import numpy as np
+import os
 import pickle
+import shutil
+import tempfile
 import torch
 import torch.distributed as dist
 
@@ -217,6 +220,29 @@ def gather(data, dst=0, group=None):
         return []
 
 
+def all_reduce_sum(array, group=None):
+    """
+    Sum a numpy array over all ranks. Unlike :func:`all_gather`, it does not pickle
+    the data, and the amount of data each rank receives does not grow with the
+    number of ranks.
+
+    Args:
+        array (ndarray): an array of the same shape and dtype in all ranks.
+        group: a torch process group. By default, will use a group which
+            contains all ranks on gloo backend.
+
+    Returns:
+        ndarray: the sum of `array` of all ranks.
+    """
+    if get_world_size() == 1:
+        return array
+    if group is None:
+        group = _get_global_gloo_group()
+    tensor = torch.from_numpy(np.ascontiguousarray(array)).clone()
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM, group=group)
+    return tensor.numpy()
+
+
 def shared_random_seed():
     """
     Returns:
@@ -231,6 +257,49 @@ def shared_random_seed():
     return all_ints[0]
 
 
+def share_arrays_from_local_master(func, shm_dir="/dev/shm"):
+    """
+    Call `func` only in the local master process (local rank 0) of each machine,
+    and share the numpy arrays it returns with all processes on the same machine.
+
+    The arrays are written to files in `shm_dir`, which is an in-memory file system
+    that implements POSIX shared memory on Linux. Every process memory-maps the files,
+    so the data is held only once per machine. The files are removed after every process
+    has mapped them, so they are released once all processes exit.
+
+    All processes have to call this function, otherwise it will deadlock.
+    It assumes the global rank of the local master is ``get_rank() - get_local_rank()``,
+    which is the case for processes started by `launch()` in "engine/launch.py".
+
+    Args:
+        func (callable): returns a dict[str, ndarray]. Only called by the local master.
+        shm_dir (str): directory of the shared memory files. A regular temporary
+            directory is used if it does not exist.
+
+    Returns:
+        dict[str, ndarray]: read-only arrays that map the shared memory.
+    """
+    local_rank = get_local_rank()
+    info = None
+    if local_rank == 0:
+        arrays = func()
+        path = tempfile.mkdtemp(
+            prefix="detectron2-", dir=shm_dir if os.path.isdir(shm_dir) else None
+        )
+        for k, v in arrays.items():
+            np.save(os.path.join(path, "{}.npy".format(k)), v)
+        info = (path, list(arrays.keys()))
+        del arrays
+    info = all_gather(info)[get_rank() - local_rank]
+
+    path, keys = info
+    ret = {k: np.load(os.path.join(path, "{}.npy".format(k)), mmap_mode="r") for k in keys}
+    synchronize()
+    if local_rank == 0:
+        shutil.rmtree(path)
+    return ret
+
+
 def reduce_dict(input_dict, average=True):
     """
     Reduce the values in the dictionary from all processes so that process with rank
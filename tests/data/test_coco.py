@@ -7,7 +7,11 @@ import unittest
 import pycocotools.mask as mask_util
 
 from detectron2.data import DatasetCatalog, MetadataCatalog
-from detectron2.data.datasets.coco import convert_to_coco_dict, load_coco_json
+from detectron2.data.datasets.coco import (
+    convert_to_coco_dict,
+    load_coco_json,
+    load_coco_json_cached,
+)
 from detectron2.structures import BoxMode
 
 
@@ -101,3 +105,66 @@ class TestRLEToJson(unittest.TestCase):
         uncompressed = uncompressed_rle(mask)
         compressed = mask_util.frPyObjects(uncompressed, *rle["size"])
         self.assertEqual(rle, compressed)
+
+
+class TestLoadCOCOJsonCached(unittest.TestCase):
+    def _make_json_dict(self):
+        images = [{"id": 2, "file_name": "b.jpg", "height": 100, "width": 80}]
+        images.append({"id": 1, "file_name": "a.jpg", "height": 50, "width": 60})
+        rle = mask_util.encode(np.asarray(make_mask(), order="F"))
+        rle["counts"] = rle["counts"].decode("ascii")
+        polygon = [10.0, 10.0, 20.0, 10.0, 20.0, 20.5]
+        annotations = [
+            {"id": 1, "image_id": 2, "bbox": [1, 2, 3, 4], "category_id": 3, "iscrowd": 0},
+            {"id": 2, "image_id": 1, "bbox": [1, 2, 3, 4], "category_id": 5, "iscrowd": 1},
+            {"id": 3, "image_id": 2, "bbox": [0, 0, 9, 9], "category_id": 5, "iscrowd": 1},
+            {"id": 4, "image_id": 2, "bbox": [2, 2, 9, 9], "category_id": 3, "iscrowd": 0},
+            {"id": 5, "image_id": 1, "bbox": [2, 2, 9, 9], "category_id": 3, "iscrowd": 0},
+        ]
+        annotations[0]["segmentation"] = [polygon, polygon[:4]]
+        annotations[1]["segmentation"] = rle
+        annotations[3]["keypoints"] = [3, 4, 2, 0, 0, 0, 5, 6, 1]
+        annotations[4]["segmentation"] = [polygon[:4]]  # invalid and filtered out
+        categories = [{"id": 5, "name": "b"}, {"id": 3, "name": "a"}]
+        return {"images": images, "annotations": annotations, "categories": categories}
+
+    def test(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_file = os.path.join(tmpdir, "test.json")
+            with open(json_file, "w") as f:
+                json.dump(self._make_json_dict(), f)
+            dicts = load_coco_json(json_file, "root", "test_cached")
+            for _ in range(2):  # create, then load the cache
+                cached = load_coco_json_cached(json_file, "root", "test_cached", tmpdir)
+                self.assertEqual(len(cached), len(dicts))
+                for d1, d2 in zip(cached, dicts):
+                    self.assertEqual(d1.keys(), d2.keys())
+                    self.assertEqual(d1["file_name"], d2["file_name"])
+                    self.assertEqual(d1["image_id"], d2["image_id"])
+                    annos1, annos2 = d1["annotations"], d2["annotations"]
+                    self.assertEqual(len(annos1), len(annos2))
+                    for a1, a2 in zip(annos1, annos2):
+                        self.assertEqual(a1.keys(), a2.keys())
+                        self.assertEqual(a1["bbox"], a2["bbox"])
+                        self.assertEqual(a1["category_id"], a2["category_id"])
+                        self.assertEqual(a1.get("keypoints"), a2.get("keypoints"))
+                        if isinstance(a2.get("segmentation"), dict):
+                            self.assertTrue(
+                                np.array_equal(
+                                    mask_util.decode(a1["segmentation"]),
+                                    mask_util.decode(a2["segmentation"]),
+                                )
+                            )
+                        else:
+                            self.assertEqual(a1.get("segmentation"), a2.get("segmentation"))
+            meta = MetadataCatalog.get("test_cached")
+            self.assertEqual(meta.thing_classes, ["a", "b"])
+            self.assertEqual(meta.thing_dataset_id_to_contiguous_id, {3: 0, 5: 1})
+
+            self.assertEqual(cached.num_non_crowd_instances().tolist(), [0, 2])
+            self.assertEqual(cached.num_visible_keypoints().tolist(), [0, 2])
+            self.assertEqual(cached.category_histogram(2).tolist(), [2, 0])
+            subset = cached.subset(cached.num_non_crowd_instances() > 0)
+            self.assertEqual(len(subset), 1)
+            self.assertEqual(subset[0]["image_id"], 2)
+            self.assertEqual(subset.category_histogram(2).tolist(), [2, 0])
@@ -5,12 +5,60 @@ import io
 import json
 import numpy as np
 import os
+import pickle
 import tempfile
+import torch
 import unittest
+from unittest import mock
+import pycocotools.mask as mask_util
 from pycocotools.coco import COCO
 from pycocotools.cocoeval import COCOeval
 
+from detectron2.config import get_cfg
+from detectron2.data import MetadataCatalog
+from detectron2.evaluation import COCOEvaluator
+from detectron2.evaluation.coco_evaluation import _ShardedPredictions
 from detectron2.evaluation.fast_eval_api import COCOeval_opt
+from detectron2.structures import Boxes, BoxMode, Instances
+
+
+def _random_coco_dataset(num_images=10, seed=0):
+    """
+    Returns a COCO-format dict of ground truth and a list of detections in COCO's result format.
+    """
+    rng = np.random.RandomState(seed)
+    images, annotations, detections = [], [], []
+    for img_id in range(1, num_images + 1):
+        images.append({"id": img_id, "height": 200, "width": 300, "file_name": ""})
+        for _ in range(rng.randint(0, 6)):
+            x0, y0 = rng.uniform(0, 150, size=2)
+            w, h = rng.uniform(5, 100, size=2)
+            bbox = [x0, y0, w, h]
+            annotations.append(
+                {
+                    "id": len(annotations) + 1,
+                    "image_id": img_id,
+                    "category_id": int(rng.randint(1, 4)),
+                    "bbox": bbox,
+                    "segmentation": [[x0, y0, x0 + w, y0, x0 + w, y0 + h]],
+                    "area": w * h / 2,
+                    "iscrowd": int(rng.rand() < 0.1),
+                }
+            )
+            # A detection close to each ground truth, and some random ones
+            for _ in range(rng.randint(0, 3)):
+                jitter = rng.uniform(-10, 10, size=4)
+                detections.append(
+                    {
+                        "image_id": img_id,
+                        "category_id": int(rng.randint(1, 4)),
+                        "bbox": (np.asarray(bbox) + jitter).clip(min=1).tolist(),
+                        "score": float(rng.rand()),
+                    }
+                )
+    categories = [{"id": k, "name": str(k)} for k in range(1, 4)]
+    gt = {"images": images, "annotations": annotations, "categories": categories}
+    return gt, detections
 
 
 class TestCOCOeval(unittest.TestCase):
@@ -118,3 +166,200 @@ class TestCOCOeval(unittest.TestCase):
                         abs_diff = np.max(diff) if diff.size > 0 else 0.0
                         msg = "%s: comparing COCO APIs, %s differs by %f" % (name, k, abs_diff)
                         self.assertTrue(abs_diff < 1e-4, msg=msg)
+
+    def test_evaluate_stream(self):
+        gt, detections = _random_coco_dataset()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_file_name = os.path.join(tmpdir, "gt.json")
+            with open(json_file_name, "w") as f:
+                json.dump(gt, f)
+            with contextlib.redirect_stdout(io.StringIO()):
+                coco_api = COCO(json_file_name)
+
+        for iou_type in ["bbox", "segm"]:
+            dt = copy.deepcopy(detections)
+            if iou_type == "segm":
+                for d in dt:
+                    x0, y0, w, h = d.pop("bbox")
+                    poly = [[x0, y0, x0 + w, y0, x0, y0 + h]]
+                    d["segmentation"] = mask_util.merge(mask_util.frPyObjects(poly, 200, 300))
+            for params in [{}, {"useCats": 0}]:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    coco_dt = coco_api.loadRes(copy.deepcopy(dt))
+                    coco_eval = COCOeval_opt(coco_api, coco_dt, iou_type)
+                    stream_eval = COCOeval_opt(coco_api, iouType=iou_type)
+                    for p, v in params.items():
+                        setattr(coco_eval.params, p, v)
+                        setattr(stream_eval.params, p, v)
+                    coco_eval.evaluate()
+                    coco_eval.accumulate()
+
+                    # Group the detections by image, in an arbitrary order
+                    image_results = {}
+                    for d in copy.deepcopy(dt):
+                        image_results.setdefault(d["image_id"], []).append(d)
+                    image_results = list(image_results.values())[::-1]
+                    num_detections = stream_eval.evaluate_stream(image_results)
+                    stream_eval.accumulate()
+
+                self.assertEqual(num_detections, len(dt))
+                for k in ["precision", "recall", "scores"]:
+                    self.assertTrue(np.array_equal(coco_eval.eval[k], stream_eval.eval[k]))
+
+    def test_num_threads(self):
+        gt, detections = _random_coco_dataset(num_images=50)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_file_name = os.path.join(tmpdir, "gt.json")
+            with open(json_file_name, "w") as f:
+                json.dump(gt, f)
+            with contextlib.redirect_stdout(io.StringIO()):
+                coco_api = COCO(json_file_name)
+                coco_dt = coco_api.loadRes(detections)
+
+        results = []
+        for num_threads in [1, 4, 0]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                coco_eval = COCOeval_opt(coco_api, coco_dt, "bbox", num_threads=num_threads)
+                coco_eval.evaluate()
+                coco_eval.accumulate()
+            results.append(coco_eval.eval)
+        # Multithreaded evaluation is bit-identical to the serial one
+        for k in ["precision", "recall", "scores"]:
+            self.assertTrue(np.array_equal(results[0][k], results[1][k]))
+            self.assertTrue(np.array_equal(results[0][k], results[2][k]))
+
+    def test_evaluate_image(self):
+        gt, detections = _random_coco_dataset()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_file_name = os.path.join(tmpdir, "gt.json")
+            with open(json_file_name, "w") as f:
+                json.dump(gt, f)
+            with contextlib.redirect_stdout(io.StringIO()):
+                coco_api = COCO(json_file_name)
+        # Only half of the images have detections
+        img_ids = coco_api.getImgIds()[::2]
+        detections = [d for d in detections if d["image_id"] in img_ids]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            coco_eval = COCOeval_opt(coco_api, coco_api.loadRes(copy.deepcopy(detections)), "bbox")
+            coco_eval.evaluate()
+            coco_eval.accumulate()
+
+            image_eval = COCOeval_opt(coco_api, iouType="bbox")
+            image_eval.begin_image_evaluation()
+            evaluations = {}
+            for img_id in img_ids:
+                dt = [copy.deepcopy(d) for d in detections if d["image_id"] == img_id]
+                evaluations[img_id] = image_eval.evaluate_image(img_id, dt)
+            # The results can be sent to other processes
+            evaluations = pickle.loads(pickle.dumps(evaluations))
+            image_eval.end_image_evaluation(evaluations)
+            image_eval.accumulate()
+
+        for k in ["precision", "recall", "scores"]:
+            self.assertTrue(np.array_equal(coco_eval.eval[k], image_eval.eval[k]))
+
+
+class TestCOCOEvaluator(unittest.TestCase):
+    def _run_evaluators(self, tmpdir, kwargs_list, proposals=False):
+        """
+        Run COCOEvaluator with each of the given keyword arguments on the same predictions.
+        The predictions are instances, or box proposals if `proposals` is True.
+
+        Returns:
+            list[tuple]: the evaluation results and the content of the dumped file.
+        """
+        gt, detections = _random_coco_dataset()
+        json_file_name = os.path.join(tmpdir, "gt.json")
+        with open(json_file_name, "w") as f:
+            json.dump(gt, f)
+        dataset_name = "test_coco_evaluator_" + os.path.basename(tmpdir)
+        MetadataCatalog.get(dataset_name).set(
+            json_file=json_file_name,
+            thing_dataset_id_to_contiguous_id={k: k - 1 for k in range(1, 4)},
+            thing_classes=["1", "2", "3"],
+        )
+
+        inputs, outputs = [], []
+        for image in gt["images"]:
+            dt = [d for d in detections if d["image_id"] == image["id"]]
+            boxes = np.asarray([d["bbox"] for d in dt]).reshape(-1, 4)
+            instances = Instances((image["height"], image["width"]))
+            boxes = BoxMode.convert(boxes, BoxMode.XYWH_ABS, BoxMode.XYXY_ABS)
+            instances.pred_boxes = Boxes(torch.as_tensor(boxes, dtype=torch.float64))
+            instances.scores = torch.tensor([d["score"] for d in dt])
+            instances.pred_classes = torch.tensor([d["category_id"] - 1 for d in dt])
+            inputs.append({"image_id": image["id"]})
+            if proposals:
+                instances = Instances(
+                    instances.image_size,
+                    proposal_boxes=Boxes(instances.pred_boxes.tensor.float()),
+                    objectness_logits=instances.scores,
+                )
+                outputs.append({"proposals": instances})
+            else:
+                outputs.append({"instances": instances})
+
+        ret = []
+        for idx, kwargs in enumerate(kwargs_list):
+            output_dir = os.path.join(tmpdir, str(idx))
+            evaluator = COCOEvaluator(dataset_name, get_cfg(), False, output_dir, **kwargs)
+            evaluator.reset()
+            for k in range(0, len(inputs), 3):
+                evaluator.process(inputs[k : k + 3], outputs[k : k + 3])
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = evaluator.evaluate()
+            if proposals:
+                with open(os.path.join(output_dir, "box_proposals.pkl"), "rb") as f:
+                    ret.append((results, f.read()))
+            else:
+                with open(os.path.join(output_dir, "coco_instances_results.json")) as f:
+                    ret.append((results, f.read()))
+        return ret
+
+    def _assert_same_results(self, results1, results2):
+        # NaN metrics are compared as equal
+        self.assertEqual(results1.keys(), results2.keys())
+        for task in results1:
+            self.assertEqual(results1[task].keys(), results2[task].keys())
+            for k in results1[task]:
+                np.testing.assert_array_equal(results1[task][k], results2[task][k])
+
+    def test_shard_dir(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shard_dir = os.path.join(tmpdir, "shards")
+            (results1, json1), (results2, json2) = self._run_evaluators(
+                tmpdir, [{}, {"shard_dir": shard_dir}]
+            )
+            self._assert_same_results(results1, results2)
+            self.assertEqual(json1, json2)
+            self.assertEqual(os.listdir(shard_dir), ["instances_predictions_rank0.pkl"])
+
+    def test_shard_dir_proposals(self):
+        num_iterations = []
+        iterate = _ShardedPredictions.__iter__
+
+        def counted_iterate(self):
+            num_iterations.append(1)
+            return iterate(self)
+
+        with tempfile.TemporaryDirectory() as tmpdir, mock.patch.object(
+            _ShardedPredictions, "__iter__", counted_iterate
+        ):
+            shard_dir = os.path.join(tmpdir, "shards")
+            (results1, dump1), (results2, dump2) = self._run_evaluators(
+                tmpdir, [{}, {"shard_dir": shard_dir}], proposals=True
+            )
+        self.assertIn("AR@100", results1["box_proposals"])
+        self._assert_same_results(results1, results2)
+        self.assertEqual(pickle.loads(dump1)["ids"], pickle.loads(dump2)["ids"])
+        # the shard files are read by the check of the first prediction, then once
+        self.assertEqual(len(num_iterations), 2)
+
+    def test_num_workers(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            (results1, json1), (results2, json2) = self._run_evaluators(
+                tmpdir, [{}, {"num_workers": 2}]
+            )
+            self._assert_same_results(results1, results2)
+            self.assertEqual(json1, json2)
@@ -0,0 +1,159 @@
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import os
+import pickle
+import tempfile
+import unittest
+import numpy as np
+import torch
+
+from detectron2.data import DatasetFromList, MetadataCatalog
+from detectron2.data.build import _get_dataset_cache_key
+from detectron2.data.common import SizeGroupedDataset
+from detectron2.data.shared_memory import SharedMemoryBatchTransfer
+from detectron2.utils.events import EventStorage
+
+
+class TestDatasetFromList(unittest.TestCase):
+    def _make_list(self, n=10):
+        return [{"file_name": str(k), "annotations": list(range(k))} for k in range(n)]
+
+    def test_cache_file(self):
+        lst = self._make_list()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = os.path.join(tmpdir, "cache", "data.bin")
+            dataset = DatasetFromList(lst, cache_file=cache_file)
+            self.assertTrue(os.path.isfile(cache_file))
+            self.assertEqual(len(dataset), len(lst))
+            for k in range(len(lst)):
+                self.assertEqual(dataset[k], lst[k])
+
+            # The second dataset reuses the existing file
+            mtime = os.path.getmtime(cache_file)
+            dataset = DatasetFromList(lst, cache_file=cache_file)
+            self.assertEqual(os.path.getmtime(cache_file), mtime)
+            self.assertEqual(dataset[3], lst[3])
+
+            # Pickling does not copy the content
+            serialized = pickle.dumps(dataset)
+            self.assertLess(len(serialized), 1024)
+            dataset = pickle.loads(serialized)
+            self.assertEqual(dataset[len(lst) - 1], lst[-1])
+
+    def test_stale_cache_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = os.path.join(tmpdir, "data.bin")
+            DatasetFromList(self._make_list(10), cache_file=cache_file)
+            with self.assertRaises(AssertionError):
+                DatasetFromList(self._make_list(5), cache_file=cache_file)
+
+    def test_cache_key(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = os.path.join(tmpdir, "data.bin")
+            DatasetFromList(self._make_list(10), cache_file=cache_file, cache_key="a")
+            # A different key rewrites the file
+            dataset = DatasetFromList(self._make_list(5), cache_file=cache_file, cache_key="b")
+            self.assertEqual(len(dataset), 5)
+
+    def test_from_cache_file(self):
+        lst = self._make_list()
+        num_calls = []
+
+        def load_func():
+            num_calls.append(1)
+            return lst
+
+        def extra_func(x):
+            return {"num_annotations": sum(len(d["annotations"]) for d in x)}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = os.path.join(tmpdir, "data.bin")
+            for key, expected_num_calls in [("a", 1), ("a", 1), ("b", 2)]:
+                dataset, extra = DatasetFromList.from_cache_file(
+                    load_func, cache_file, key, extra_func=extra_func
+                )
+                self.assertEqual(len(num_calls), expected_num_calls)
+                self.assertEqual(extra, {"num_annotations": 45})
+                self.assertEqual(len(dataset), len(lst))
+                self.assertEqual(dataset[4], lst[4])
+            dataset = pickle.loads(pickle.dumps(dataset))
+            self.assertEqual(dataset[len(lst) - 1], lst[-1])
+
+    def test_dataset_cache_key(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_file = os.path.join(tmpdir, "a.json")
+            with open(json_file, "w") as f:
+                f.write("[]")
+            dataset_name = "test_dataset_cache_key_" + os.path.basename(tmpdir)
+            MetadataCatalog.get(dataset_name).set(json_file=json_file)
+            key = _get_dataset_cache_key([dataset_name], filter_empty=True)
+            self.assertEqual(key, _get_dataset_cache_key([dataset_name], filter_empty=True))
+            self.assertNotEqual(key, _get_dataset_cache_key([dataset_name], filter_empty=False))
+            with open(json_file, "w") as f:
+                f.write("[{}]")
+            self.assertNotEqual(key, _get_dataset_cache_key([dataset_name], filter_empty=True))
+
+    def test_from_local_master(self):
+        lst = self._make_list()
+        dataset = DatasetFromList.from_local_master(lambda: lst)
+        self.assertEqual(len(dataset), len(lst))
+        for k in range(len(lst)):
+            self.assertEqual(dataset[k], lst[k])
+        dataset = pickle.loads(pickle.dumps(dataset))
+        self.assertEqual(dataset[2], lst[2])
+
+
+class TestSizeGroupedDataset(unittest.TestCase):
+    def test_batches(self):
+        rng = np.random.RandomState(0)
+        sizes = rng.choice([300, 500, 800], size=(200, 2))
+        dataset = [{"image": torch.zeros(3, h, w), "id": k} for k, (h, w) in enumerate(sizes)]
+
+        grouped = SizeGroupedDataset(dataset, 4, quantum=100, max_buffered=40)
+        with EventStorage() as storage:
+            batches = list(grouped)
+            overhead = storage.history("padding_overhead").values()
+        self.assertEqual(len(overhead), len(batches))
+        self.assertTrue(all(x >= 0 for x, _ in overhead))
+
+        ids = [d["id"] for batch in batches for d in batch]
+        self.assertEqual(len(set(ids)), len(ids))
+        # at most max_buffered images are left in the buffers
+        self.assertEqual(len(ids) + grouped._num_buffered, len(dataset))
+        self.assertLessEqual(grouped._num_buffered, 40)
+        num_same_size = 0
+        for batch in batches:
+            self.assertEqual(len(batch), 4)
+            num_same_size += len({tuple(d["image"].shape) for d in batch}) == 1
+        # most batches are formed by a full bucket
+        self.assertGreater(num_same_size, len(batches) // 2)
+
+        # the overhead includes the padding to the size divisibility
+        same_size = [{"image": torch.zeros(3, 30, 40)}, {"image": torch.zeros(3, 30, 40)}]
+        with EventStorage() as storage:
+            list(SizeGroupedDataset(same_size, 2, size_divisibility=32))
+            overhead = storage.history("padding_overhead").latest()
+        self.assertAlmostEqual(overhead, 32 * 64 / (30 * 40) - 1)
+
+        # without storage
+        grouped = SizeGroupedDataset(dataset, 4)
+        batches = list(grouped)
+        self.assertEqual(len(batches) * 4 + grouped._num_buffered, len(dataset))
+
+
+class TestSharedMemoryBatchTransfer(unittest.TestCase):
+    def test_data_loader(self):
+        dataset = [
+            {"image": torch.full((3, 10 + k, 20), k, dtype=torch.uint8), "id": k} for k in range(20)
+        ]
+        # too large for a slot, sent as usual
+        dataset[5]["image"] = torch.rand(3, 100, 100)
+        transfer = SharedMemoryBatchTransfer(2, 8192, collate_fn=lambda batch: batch)
+        data_loader = torch.utils.data.DataLoader(
+            dataset, batch_size=2, num_workers=2, collate_fn=transfer.collate
+        )
+        batches = list(transfer.wrap(data_loader))
+        self.assertEqual(len(batches), 10)
+        outputs = [d for batch in batches for d in batch]
+        self.assertEqual([d["id"] for d in outputs], list(range(20)))
+        for d, expected in zip(outputs, dataset):
+            self.assertTrue(torch.equal(d["image"], expected["image"]))
@@ -9,7 +9,7 @@ from fvcore.common.file_io import PathManager
 
 from detectron2.data import MetadataCatalog, detection_utils
 from detectron2.data import transforms as T
-from detectron2.structures import BitMasks, BoxMode
+from detectron2.structures import BitMasks, BoxMode, RLEMasks
 
 
 class TestTransformAnnotations(unittest.TestCase):
@@ -61,6 +61,66 @@ class TestTransformAnnotations(unittest.TestCase):
             )
         )
 
+    def test_transform_annotations_to_instances(self):
+        transforms = T.TransformList([T.HFlipTransform(400), T.ScaleTransform(400, 400, 300, 200)])
+        hflip_indices = detection_utils.create_keypoint_hflip_indices(["keypoints_coco_2017_train"])
+        mask = np.zeros((400, 400), dtype=np.uint8, order="F")
+        mask[20:100, 50:150] = 1
+        annos = []
+        for k in range(5):
+            keypoints = np.random.rand(17, 3) * 450 - 20
+            keypoints[:, 2] = k % 3
+            annos.append(
+                {
+                    "bbox": [10 + k, 10, 200, 300],
+                    "bbox_mode": BoxMode.XYXY_ABS if k % 2 else BoxMode.XYWH_ABS,
+                    "category_id": k,
+                    "segmentation": [[10, 10, 100, 100, 100, 10], [150, 150, 200, 150, 200, k]],
+                    "keypoints": keypoints.reshape(-1).tolist(),
+                }
+            )
+        annos[3]["segmentation"] = mask_util.encode(mask)
+
+        for mask_format in ["polygon", "bitmask"]:
+            if mask_format == "polygon":
+                annos_polygon = [a for a in annos if isinstance(a["segmentation"], list)]
+            else:
+                annos_polygon = annos
+            output = detection_utils.transform_annotations_to_instances(
+                annos_polygon,
+                transforms,
+                (300, 200),
+                mask_format=mask_format,
+                keypoint_hflip_indices=hflip_indices,
+            )
+            expected = detection_utils.annotations_to_instances(
+                [
+                    detection_utils.transform_instance_annotations(
+                        copy.deepcopy(a),
+                        transforms,
+                        (300, 200),
+                        keypoint_hflip_indices=hflip_indices,
+                    )
+                    for a in annos_polygon
+                ],
+                (300, 200),
+                mask_format=mask_format,
+            )
+            self.assertEqual(output.image_size, expected.image_size)
+            self.assertTrue(output.gt_boxes.tensor.equal(expected.gt_boxes.tensor))
+            self.assertTrue(output.gt_classes.equal(expected.gt_classes))
+            self.assertTrue(output.gt_keypoints.tensor.equal(expected.gt_keypoints.tensor))
+            if mask_format == "polygon":
+                for p1, p2 in zip(output.gt_masks.polygons, expected.gt_masks.polygons):
+                    self.assertEqual(len(p1), len(p2))
+                    for x, y in zip(p1, p2):
+                        self.assertTrue(np.array_equal(x, y))
+            else:
+                self.assertTrue(output.gt_masks.tensor.equal(expected.gt_masks.tensor))
+
+        output = detection_utils.transform_annotations_to_instances([], transforms, (300, 200))
+        self.assertEqual(len(output), 0)
+
     def test_crop(self):
         transforms = T.TransformList([T.CropTransform(300, 300, 10, 10)])
         keypoints = np.random.rand(17, 3) * 50 + 15
@@ -102,6 +162,23 @@ class TestTransformAnnotations(unittest.TestCase):
         )
         self.assertTrue(isinstance(inst.gt_masks, BitMasks))
 
+    def test_annotations_to_rle_masks(self):
+        mask = np.zeros((300, 400), order="F").astype("uint8")
+        mask[50:150, :200] = 1
+        annos = [
+            {"bbox": [10, 10, 200, 300], "bbox_mode": BoxMode.XYXY_ABS, "category_id": 3}
+            for _ in range(3)
+        ]
+        annos[0]["segmentation"] = [[10, 10, 100, 100, 100, 10], [150, 150, 200, 150, 200, 30]]
+        annos[1]["segmentation"] = mask_util.encode(mask)
+        annos[2]["segmentation"] = mask[::-1]
+
+        expected = detection_utils.annotations_to_instances(annos, (300, 400), "bitmask")
+        inst = detection_utils.annotations_to_instances(annos, (300, 400), "rle")
+        self.assertTrue(isinstance(inst.gt_masks, RLEMasks))
+        masks = np.stack([mask_util.decode(rle) for rle in inst.gt_masks])
+        self.assertTrue(np.array_equal(masks, expected.gt_masks.tensor.numpy()))
+
     def test_transform_RLE_resize(self):
         transforms = T.TransformList(
             [T.HFlipTransform(400), T.ScaleTransform(300, 400, 400, 400, "bilinear")]
@@ -0,0 +1,106 @@
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import json
+import numpy as np
+import os
+import tempfile
+import torch
+import unittest
+import PIL.Image as Image
+
+from detectron2.data import MetadataCatalog
+from detectron2.evaluation import COCOPanopticEvaluator
+
+
+def _id2rgb(id_map):
+    rgb = np.zeros(id_map.shape + (3,), dtype=np.uint8)
+    for k in range(3):
+        rgb[..., k] = (id_map >> (8 * k)) % 256
+    return rgb
+
+
+class TestCOCOPanopticEvaluator(unittest.TestCase):
+    def _register_dataset(self, tmpdir, num_images):
+        """
+        Every image has a crowd region of category 1 in rows 0-1, a segment of category 1
+        in rows 2-4, and a segment of category 2 in rows 5-9 except for two VOID columns.
+        """
+        pan_gt = np.zeros((10, 10), dtype=np.int64)
+        pan_gt[:2] = 3
+        pan_gt[2:5] = 1
+        pan_gt[5:, :8] = 2
+        segments_info = [
+            {"id": 1, "category_id": 1, "iscrowd": 0, "area": 30},
+            {"id": 2, "category_id": 2, "iscrowd": 0, "area": 40},
+            {"id": 3, "category_id": 1, "iscrowd": 1, "area": 20},
+        ]
+        annotations = []
+        for k in range(num_images):
+            file_name = "{}.png".format(k)
+            Image.fromarray(_id2rgb(pan_gt)).save(os.path.join(tmpdir, file_name))
+            annotations.append(
+                {"image_id": k, "file_name": file_name, "segments_info": segments_info}
+            )
+        gt_json = {
+            "annotations": annotations,
+            "categories": [
+                {"id": 1, "name": "thing", "isthing": 1},
+                {"id": 2, "name": "stuff", "isthing": 0},
+            ],
+        }
+        json_file = os.path.join(tmpdir, "panoptic.json")
+        with open(json_file, "w") as f:
+            json.dump(gt_json, f)
+
+        dataset_name = "test_panoptic_evaluator_" + os.path.basename(tmpdir)
+        MetadataCatalog.get(dataset_name).set(
+            panoptic_json=json_file,
+            panoptic_root=tmpdir,
+            thing_dataset_id_to_contiguous_id={1: 0},
+            stuff_dataset_id_to_contiguous_id={2: 0},
+        )
+        return dataset_name
+
+    def _correct_prediction(self):
+        pan_pred = torch.zeros((10, 10), dtype=torch.int32)
+        pan_pred[:2] = 3
+        pan_pred[2:5] = 1
+        pan_pred[5:] = 2
+        segments_info = [
+            {"id": 1, "category_id": 0, "isthing": True},
+            {"id": 2, "category_id": 0, "isthing": False},
+            # ignored because it covers a crowd region
+            {"id": 3, "category_id": 0, "isthing": True},
+        ]
+        return {"panoptic_seg": (pan_pred, segments_info)}
+
+    def _wrong_prediction(self):
+        pan_pred = torch.zeros((10, 10), dtype=torch.int32)
+        pan_pred[:5] = 5
+        pan_pred[5:] = 6
+        segments_info = [
+            {"id": 5, "category_id": 0, "isthing": False},
+            {"id": 6, "category_id": 0, "isthing": True},
+        ]
+        return {"panoptic_seg": (pan_pred, segments_info)}
+
+    def test_evaluate(self):
+        for num_workers in [0, 2]:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                dataset_name = self._register_dataset(tmpdir, 2)
+                evaluator = COCOPanopticEvaluator(dataset_name, tmpdir, num_workers=num_workers)
+
+                evaluator.reset()
+                evaluator.process([{"image_id": 0}], [self._correct_prediction()])
+                evaluator.process([{"image_id": 1}], [self._correct_prediction()])
+                res = evaluator.evaluate()["panoptic_seg"]
+                for key in ["PQ", "SQ", "RQ", "PQ_th", "PQ_st"]:
+                    self.assertAlmostEqual(res[key], 100.0)
+
+                # One TP, one FP and one FN for each category
+                evaluator.reset()
+                evaluator.process([{"image_id": 0}], [self._correct_prediction()])
+                evaluator.process([{"image_id": 1}], [self._wrong_prediction()])
+                res = evaluator.evaluate()["panoptic_seg"]
+                for key in ["PQ", "RQ", "PQ_th", "RQ_th", "PQ_st", "RQ_st"]:
+                    self.assertAlmostEqual(res[key], 50.0)
+                self.assertAlmostEqual(res["SQ"], 100.0)
@@ -0,0 +1,80 @@
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import os
+import tempfile
+import torch
+import unittest
+
+from detectron2.data import MetadataCatalog
+from detectron2.evaluation import PascalVOCDetectionEvaluator
+from detectron2.evaluation.pascal_voc_evaluation import load_voc_annotations
+from detectron2.structures import Boxes, Instances
+
+
+def _object_xml(name, box, difficult=0):
+    return (
+        "<object><name>{}</name><pose>Unspecified</pose><truncated>0</truncated>"
+        "<difficult>{}</difficult><bndbox><xmin>{}</xmin><ymin>{}</ymin>"
+        "<xmax>{}</xmax><ymax>{}</ymax></bndbox></object>"
+    ).format(name, difficult, *box)
+
+
+class TestPascalVOCEvaluator(unittest.TestCase):
+    def test_evaluate(self):
+        annotations = {
+            "0": [_object_xml("a", (10, 10, 50, 50)), _object_xml("a", (60, 60, 90, 90), 1)],
+            "1": [_object_xml("a", (0, 0, 30, 30)), _object_xml("b", (40, 40, 80, 80))],
+            "2": [],
+        }
+        # image_id, box, score, class
+        predictions = [
+            ("0", (10, 10, 50, 50), 0.9, 0),  # TP
+            ("0", (10, 10, 50, 50), 0.8, 0),  # duplicate, FP
+            ("0", (60, 60, 90, 90), 0.7, 0),  # difficult, ignored
+            ("1", (0, 0, 30, 30), 0.6, 0),  # TP
+            ("1", (40, 40, 80, 80), 0.5, 1),  # TP
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, "Annotations"))
+            os.makedirs(os.path.join(tmpdir, "ImageSets", "Main"))
+            with open(os.path.join(tmpdir, "ImageSets", "Main", "test.txt"), "w") as f:
+                f.write("\n".join(annotations.keys()))
+            for name, objects in annotations.items():
+                with open(os.path.join(tmpdir, "Annotations", name + ".xml"), "w") as f:
+                    f.write("<annotation>{}</annotation>".format("".join(objects)))
+
+            dataset_name = "test_pascal_voc_evaluator_" + os.path.basename(tmpdir)
+            MetadataCatalog.get(dataset_name).set(
+                dirname=tmpdir, split="test", thing_classes=["a", "b"], year=2012
+            )
+            evaluator = PascalVOCDetectionEvaluator(dataset_name)
+            evaluator.reset()
+            for image_id in annotations.keys():
+                preds = [p for p in predictions if p[0] == image_id]
+                instances = Instances((100, 100))
+                # The evaluator converts boxes back to the 1-based coordinates of annotations
+                instances.pred_boxes = Boxes(
+                    torch.tensor(
+                        [[x0 - 1, y0 - 1, x1, y1] for _, (x0, y0, x1, y1), _, _ in preds]
+                    ).reshape(-1, 4)
+                )
+                instances.scores = torch.tensor([p[2] for p in preds])
+                instances.pred_classes = torch.tensor([p[3] for p in preds], dtype=torch.int64)
+                evaluator.process([{"image_id": image_id}], [{"instances": instances}])
+            res = evaluator.evaluate()["bbox"]
+
+            # The cached annotations cannot be modified by callers
+            annotations = load_voc_annotations(
+                os.path.join(tmpdir, "Annotations", "{}.xml"),
+                os.path.join(tmpdir, "ImageSets", "Main", "test.txt"),
+                ("a", "b"),
+            )
+            self.assertEqual(len(annotations["bbox"]), 4)
+            with self.assertRaises(ValueError):
+                annotations["bbox"][0, 0] = 0
+            with self.assertRaises(TypeError):
+                annotations["image"] = None
+
+        # AP of "a" is 0.5 * 1 + 0.5 * 2 / 3, AP of "b" is 1
+        expected = (0.5 + 1.0 / 3 + 1.0) / 2 * 100
+        for key in ["AP", "AP50", "AP75"]:
+            self.assertAlmostEqual(res[key], expected)
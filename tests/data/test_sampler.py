@@ -1,8 +1,19 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved.
+import itertools
+import numpy as np
 import unittest
+from unittest import mock
+import torch
 from torch.utils.data.sampler import SequentialSampler
 
-from detectron2.data.samplers import GroupedBatchSampler
+from detectron2.data.columnar import ColumnarDatasetDicts
+from detectron2.data.samplers import (
+    GroupedBatchSampler,
+    InferenceGroupedBatchSampler,
+    InferenceSampler,
+    RepeatFactorTrainingSampler,
+)
+from detectron2.structures import BoxMode
 
 
 class TestGroupedBatchSampler(unittest.TestCase):
@@ -21,3 +32,119 @@ class TestGroupedBatchSampler(unittest.TestCase):
 
         for mini_batch in samples:
             self.assertEqual((mini_batch[0] + mini_batch[1]) % 2, 0)
+
+
+class TestInferenceGroupedBatchSampler(unittest.TestCase):
+    def test_batches(self):
+        aspect_ratios = np.random.RandomState(0).choice([0.75, 1.0, 1.33], size=100)
+        for batch_size, window_size in [(4, None), (4, 10), (3, 3), (1, 1)]:
+            sampler = SequentialSampler(list(range(len(aspect_ratios))))
+            batch_sampler = InferenceGroupedBatchSampler(
+                sampler, aspect_ratios, batch_size, window_size=window_size
+            )
+            batches = list(batch_sampler)
+            self.assertEqual(len(batches), len(batch_sampler))
+            # every index is produced exactly once, within its window
+            self.assertEqual(sorted(sum(batches, [])), list(range(len(aspect_ratios))))
+            window_size = batch_sampler.window_size
+            for batch in batches:
+                self.assertLessEqual(len(batch), batch_size)
+                self.assertEqual(len({k // window_size for k in batch}), 1)
+            self.assertEqual(batch_sampler.positions(), batches)
+
+        # a window of the whole dataset gives the minimal number of mixed batches
+        batch_sampler = InferenceGroupedBatchSampler(sampler, aspect_ratios, 4, window_size=100)
+        num_mixed = sum(len(set(aspect_ratios[batch])) > 1 for batch in batch_sampler)
+        self.assertLessEqual(num_mixed, 2)
+
+
+class TestInferenceSampler(unittest.TestCase):
+    def _shards(self, size, world_size, costs=None):
+        shards = []
+        for rank in range(world_size):
+            with mock.patch("detectron2.utils.comm.get_rank", return_value=rank), mock.patch(
+                "detectron2.utils.comm.get_world_size", return_value=world_size
+            ):
+                shards.append(list(InferenceSampler(size, costs=costs)))
+        return shards
+
+    def test_equal_count(self):
+        shards = self._shards(10, 4)
+        self.assertEqual(shards, [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]])
+
+    def test_costs(self):
+        costs = np.random.RandomState(0).choice([1.0, 5.0], size=101, p=[0.8, 0.2])
+        costs[:20] = 5.0
+        for world_size in [1, 3, 8]:
+            shards = self._shards(len(costs), world_size, costs=costs)
+            # contiguous shards in order
+            self.assertEqual(sum(shards, []), list(range(len(costs))))
+            shard_costs = [costs[shard].sum() for shard in shards]
+            self.assertLessEqual(max(shard_costs), costs.sum() / world_size + costs.max())
+        self.assertLess(len(shards[0]), len(shards[-1]))
+
+
+class TestRepeatFactorTrainingSampler(unittest.TestCase):
+    def _dataset_dicts(self, category_ids_per_image):
+        return [
+            {
+                "file_name": str(k),
+                "height": 10,
+                "width": 10,
+                "image_id": k,
+                "annotations": [
+                    {"bbox": [0, 0, 1, 1], "bbox_mode": BoxMode.XYWH_ABS, "category_id": c}
+                    for c in category_ids
+                ],
+            }
+            for k, category_ids in enumerate(category_ids_per_image)
+        ]
+
+    def test_repeat_factors(self):
+        # frequency of category 0: 0.8, 1: 0.4, 7: 0.2
+        dicts = self._dataset_dicts([[0, 0], [0, 1], [0, 1, 7, 7], [0], []])
+        expected = torch.tensor([1.0, 1.0, 2.0 ** 0.5, 1.0, 1.0])
+        for dataset_dicts in [dicts, ColumnarDatasetDicts(ColumnarDatasetDicts.from_dicts(dicts))]:
+            repeat_factors = RepeatFactorTrainingSampler.repeat_factors_from_category_frequency(
+                dataset_dicts, 0.4
+            )
+            self.assertTrue(torch.allclose(repeat_factors, expected))
+
+        # frequency of category 0: 1, 1: 0.5, 7: 0.5
+        columnar = ColumnarDatasetDicts(ColumnarDatasetDicts.from_dicts(dicts))
+        repeat_factors = RepeatFactorTrainingSampler.repeat_factors_from_category_frequency(
+            columnar.subset([2, 3]), 1.0
+        )
+        self.assertTrue(torch.allclose(repeat_factors, torch.tensor([2.0 ** 0.5, 1.0])))
+
+        # sparse and large category ids, e.g. hashed ids
+        dicts = self._dataset_dicts([[-5, -5], [-5, 2 ** 40], [-5, 2 ** 40, 2 ** 62], [-5], []])
+        repeat_factors = RepeatFactorTrainingSampler.repeat_factors_from_category_frequency(
+            dicts, 0.4
+        )
+        self.assertTrue(torch.allclose(repeat_factors, expected))
+
+    def test_stream(self):
+        repeat_factors = torch.tensor([1.0, 2.5, 0.0, 1.5])
+        num_samples = 100
+        streams = []
+        for rank in range(3):
+            with mock.patch("detectron2.utils.comm.get_rank", return_value=rank), mock.patch(
+                "detectron2.utils.comm.get_world_size", return_value=3
+            ):
+                sampler = RepeatFactorTrainingSampler(repeat_factors, shuffle=False, seed=0)
+                streams.append(list(itertools.islice(sampler, num_samples)))
+        # the workers take turns on the same stream of epochs
+        stream = [streams[k % 3][k // 3] for k in range(num_samples * 3)]
+        epochs, epoch = [], []
+        for idx in stream:
+            if epoch and idx < epoch[-1]:
+                epochs.append(epoch)
+                epoch = []
+            epoch.append(idx)
+        for epoch in epochs:
+            counts = np.bincount(epoch, minlength=4)
+            self.assertEqual(counts[0], 1)
+            self.assertIn(counts[1], [2, 3])
+            self.assertEqual(counts[2], 0)
+            self.assertIn(counts[3], [1, 2])
@@ -0,0 +1,69 @@
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import json
+import numpy as np
+import os
+import tempfile
+import torch
+import unittest
+import PIL.Image as Image
+
+from detectron2.data import DatasetCatalog, MetadataCatalog
+from detectron2.evaluation import SemSegEvaluator
+
+
+class TestSemSegEvaluator(unittest.TestCase):
+    def _run(self, tmpdir, num_classes, image_size, **kwargs):
+        """
+        Returns:
+            SemSegEvaluator: the evaluator after evaluation.
+            ndarray: the expected confusion matrix.
+        """
+        rng = np.random.RandomState(0)
+        dataset_name = "test_sem_seg_evaluator_" + os.path.basename(tmpdir)
+        dataset_dicts, outputs = [], []
+        expected = np.zeros((num_classes + 1, num_classes + 1), dtype=np.int64)
+        for k in range(5):
+            gt = rng.randint(num_classes, size=image_size)
+            gt[rng.rand(*image_size) < 0.1] = 255
+            # 16-bit png for many classes
+            gt_image = Image.fromarray(gt.astype(np.uint8 if num_classes < 256 else np.int32))
+            gt_file = os.path.join(tmpdir, "{}_{}.png".format(dataset_name, k))
+            gt_image.save(gt_file)
+            dataset_dicts.append({"file_name": str(k), "sem_seg_file_name": gt_file})
+
+            logits = torch.rand(num_classes, *image_size)
+            outputs.append({"sem_seg": logits})
+            pred = logits.argmax(dim=0).numpy()
+            gt[gt == 255] = num_classes
+            np.add.at(expected, (pred, gt), 1)
+
+        DatasetCatalog.register(dataset_name, lambda: dataset_dicts)
+        MetadataCatalog.get(dataset_name).set(stuff_classes=[str(k) for k in range(num_classes)])
+        evaluator = SemSegEvaluator(dataset_name, False, num_classes, output_dir=tmpdir, **kwargs)
+        evaluator.reset()
+        for k in range(0, len(outputs), 2):
+            evaluator.process(dataset_dicts[k : k + 2], outputs[k : k + 2])
+        results = evaluator.evaluate()
+        self.assertIn("mIoU", results["sem_seg"])
+        return evaluator, expected
+
+    def test_confusion_matrix(self):
+        # The dense path with few classes and the sparse path with many classes
+        for num_classes, image_size in [(5, (30, 40)), (300, (20, 15))]:
+            for num_workers in [0, 2]:
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    evaluator, expected = self._run(
+                        tmpdir, num_classes, image_size, num_workers=num_workers
+                    )
+                    self.assertTrue(np.array_equal(evaluator._conf_matrix, expected))
+
+    def test_dump_predictions(self):
+        for dump_predictions in [True, False]:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                self._run(tmpdir, 5, (30, 40), dump_predictions=dump_predictions)
+                file_path = os.path.join(tmpdir, "sem_seg_predictions.json")
+                self.assertEqual(os.path.isfile(file_path), dump_predictions)
+                if dump_predictions:
+                    with open(file_path) as f:
+                        predictions = json.load(f)
+                    self.assertEqual({p["file_name"] for p in predictions}, set("01234"))
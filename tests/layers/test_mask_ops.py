@@ -16,6 +16,8 @@ from torch.nn import functional as F
 
 from detectron2.data import MetadataCatalog
 from detectron2.layers.mask_ops import (
+    _do_paste_mask,
+    _paste_masks_cpu,
     pad_masks,
     paste_mask_in_image_old,
     paste_masks_in_image,
@@ -153,6 +155,35 @@ class TestMaskCropPaste(unittest.TestCase):
             self.assertEqual(area, target)
 
 
+class TestPasteMasksCPU(unittest.TestCase):
+    def test_same_as_grid_sample(self):
+        torch.manual_seed(42)
+        H, W = 150, 200
+        N = 20
+        masks = torch.rand(N, 28, 28)
+        boxes = torch.rand(N, 4) * torch.tensor([W, H, W, H])
+        boxes[:, 2:] = boxes[:, :2] + torch.rand(N, 2) * 100
+        # boxes that exceed the image
+        boxes[0] = torch.tensor([-10.0, -10.0, W + 10.0, H + 10.0])
+
+        expected = torch.zeros(N, H, W, dtype=torch.bool)
+        for k in range(N):
+            mask, spatial_inds = _do_paste_mask(masks[k : k + 1, None], boxes[k : k + 1], H, W)
+            expected[(k,) + spatial_inds] = mask[0] >= 0.5
+        self.assertTrue(torch.equal(_paste_masks_cpu(masks, boxes, (H, W)), expected))
+        self.assertTrue(torch.equal(paste_masks_in_image(masks, boxes, (H, W)), expected))
+
+        values, regions = _paste_masks_cpu(masks, boxes, (H, W), packed=True)
+        self.assertEqual(regions.shape, (N, 4))
+        offset = 0
+        for k, (x0, y0, x1, y1) in enumerate(regions.tolist()):
+            region = values[offset : offset + (y1 - y0) * (x1 - x0)].reshape(y1 - y0, x1 - x0)
+            offset += region.numel()
+            self.assertTrue(torch.equal(region, expected[k, y0:y1, x0:x1]))
+            self.assertEqual(region.sum(), expected[k].sum())
+        self.assertEqual(offset, len(values))
+
+
 def benchmark_paste():
     S = 800
     H, W = image_shape = (S, S)
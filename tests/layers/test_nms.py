@@ -2,6 +2,7 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 import unittest
 import torch
+from torchvision.ops import boxes as box_ops
 
 from detectron2.layers import batched_nms
 from detectron2.utils.env import TORCH_VERSION
@@ -34,6 +35,15 @@ class TestNMS(unittest.TestCase):
             assert torch.allclose(boxes, backup), "boxes modified by jit-scripted batched_nms"
             self.assertTrue(torch.equal(keep_ref, scripted_keep), err_msg.format(iou))
 
+    def test_batched_nms_many_categories(self):
+        N = 5000
+        boxes, scores = self._create_tensors(N)
+        idxs = torch.randint(0, 1000, (N,))
+        for iou in [0.2, 0.5, 0.8]:
+            keep_ref = box_ops.batched_nms(boxes, scores, idxs, iou)
+            keep = batched_nms(boxes, scores, idxs, iou)
+            self.assertTrue(torch.equal(keep, keep_ref))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -117,6 +117,35 @@ class TestAnchorGenerator(unittest.TestCase):
 
         assert torch.allclose(anchors[0].tensor, expected_anchor_tensor)
 
+    def test_anchor_cache(self):
+        for generator_cls, kwargs in [
+            (DefaultAnchorGenerator, {}),
+            (RotatedAnchorGenerator, {"angles": [0, 45]}),
+        ]:
+            anchor_generator = generator_cls(
+                sizes=[32, 64], aspect_ratios=[0.25, 1, 4], strides=[4], cache_size=2, **kwargs
+            )
+            features = [torch.rand(2, 8, k, 3) for k in range(1, 4)]
+            anchors = anchor_generator(features[:1])
+            self.assertIs(anchor_generator(features[:1])[0], anchors[0])
+
+            # the least recently used shape is evicted
+            anchor_generator(features[1:2])
+            anchor_generator(features[:1])
+            anchor_generator(features[2:3])
+            self.assertIs(anchor_generator(features[:1])[0], anchors[0])
+            other = anchor_generator(features[1:2])
+            self.assertEqual(len(other[0]), len(anchors[0]) * 2)
+
+            # the cache is keyed by dtype, and cleared when loading weights
+            anchors_double = anchor_generator.double()(features[:1])
+            self.assertIsNot(anchors_double[0], anchors[0])
+            anchor_generator.load_state_dict(anchor_generator.state_dict())
+            self.assertIsNot(anchor_generator(features[:1])[0], anchors_double[0])
+            self.assertTrue(
+                torch.equal(anchor_generator(features[:1])[0].tensor, anchors_double[0].tensor)
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
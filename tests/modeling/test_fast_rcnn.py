@@ -2,10 +2,15 @@
 import logging
 import unittest
 import torch
+from fvcore.common.benchmark import benchmark
 
 from detectron2.layers import ShapeSpec
 from detectron2.modeling.box_regression import Box2BoxTransform, Box2BoxTransformRotated
-from detectron2.modeling.roi_heads.fast_rcnn import FastRCNNOutputLayers
+from detectron2.modeling.roi_heads.fast_rcnn import (
+    FastRCNNOutputLayers,
+    fast_rcnn_inference_batched,
+    fast_rcnn_inference_single_image,
+)
 from detectron2.modeling.roi_heads.rotated_fast_rcnn import RotatedFastRCNNOutputLayers
 from detectron2.structures import Boxes, Instances, RotatedBoxes
 from detectron2.utils.events import EventStorage
@@ -102,5 +107,68 @@ class FastRCNNTest(unittest.TestCase):
             assert torch.allclose(losses[name], expected_losses[name])
 
 
+def _random_predictions(num_images, num_boxes, num_classes, class_specific=True):
+    image_shapes = [(100 + 10 * k, 150 - 10 * k) for k in range(num_images)]
+    boxes, scores = [], []
+    for k in range(num_images):
+        xy0 = torch.rand(num_boxes, num_classes if class_specific else 1, 2) * 160 - 10
+        wh = torch.rand(num_boxes, num_classes if class_specific else 1, 2) * 40 + 5
+        boxes.append(torch.cat([xy0, xy0 + wh], dim=2).flatten(1))
+        scores.append(torch.softmax(torch.randn(num_boxes, num_classes + 1) * 3, dim=1))
+    return boxes, scores, image_shapes
+
+
+class FastRCNNInferenceTest(unittest.TestCase):
+    def test_batched_inference(self):
+        torch.manual_seed(0)
+        for class_specific in [True, False]:
+            for num_boxes, topk in [(100, -1), (100, 10), (0, 10)]:
+                boxes, scores, image_shapes = _random_predictions(
+                    4, num_boxes, 5, class_specific=class_specific
+                )
+                if num_boxes:
+                    boxes[1][3, 0] = float("inf")
+                    scores[2][7, 0] = float("nan")
+                results, kept_indices = fast_rcnn_inference_batched(
+                    boxes, scores, image_shapes, 0.05, 0.5, topk
+                )
+                self.assertEqual(len(results), 4)
+                for k in range(4):
+                    expected, expected_indices = fast_rcnn_inference_single_image(
+                        boxes[k], scores[k], image_shapes[k], 0.05, 0.5, topk
+                    )
+                    self.assertEqual(results[k].image_size, image_shapes[k])
+                    self.assertTrue(torch.equal(kept_indices[k], expected_indices))
+                    self.assertTrue(torch.equal(results[k].pred_classes, expected.pred_classes))
+                    self.assertTrue(torch.equal(results[k].scores, expected.scores))
+                    self.assertTrue(
+                        torch.allclose(results[k].pred_boxes.tensor, expected.pred_boxes.tensor)
+                    )
+
+
+def benchmark_fast_rcnn_inference():
+    torch.manual_seed(42)
+    predictions = _random_predictions(16, 1000, 80)
+
+    def func(batch_size, batched):
+        boxes, scores, image_shapes = (x[:batch_size] for x in predictions)
+        if batched:
+            return lambda: fast_rcnn_inference_batched(boxes, scores, image_shapes, 0.05, 0.5, 100)
+
+        def bench():
+            for args in zip(boxes, scores, image_shapes):
+                fast_rcnn_inference_single_image(*args, 0.05, 0.5, 100)
+
+        return bench
+
+    specs = [
+        {"batch_size": batch_size, "batched": batched}
+        for batch_size in [1, 2, 4, 8, 16]
+        for batched in [False, True]
+    ]
+    benchmark(func, "fast_rcnn_inference", specs, num_iters=10, warmup_iters=2)
+
+
 if __name__ == "__main__":
+    benchmark_fast_rcnn_inference()
     unittest.main()
@@ -5,6 +5,7 @@ import torch
 
 from detectron2.config import get_cfg
 from detectron2.modeling.matcher import Matcher
+from detectron2.structures import Boxes, pairwise_iou
 from detectron2.utils.env import TORCH_VERSION
 
 
@@ -40,6 +41,54 @@ class TestMatcher(unittest.TestCase):
         self.assertTrue(torch.allclose(matches, expected_matches))
         self.assertTrue(torch.allclose(match_labels, expected_match_labels))
 
+    def test_match_pairwise(self):
+        torch.manual_seed(0)
+
+        def random_boxes(num_boxes):
+            xy0 = torch.rand(num_boxes, 2) * 100
+            return Boxes(torch.cat([xy0, xy0 + torch.rand(num_boxes, 2) * 50 + 1], dim=1))
+
+        gt_boxes, anchors = random_boxes(30), random_boxes(500)
+        # duplicated anchors tie for the highest quality of a gt box, across chunks
+        anchors.tensor[450] = anchors.tensor[3] = gt_boxes.tensor[0] + 2
+        # a gt box that does not overlap with any anchor
+        gt_boxes.tensor[1] = torch.tensor([500.0, 500.0, 510.0, 510.0])
+        for allow_low_quality_matches in [True, False]:
+            matcher = Matcher([0.3, 0.7], [0, -1, 1], allow_low_quality_matches)
+            for chunk_size in [0, 64, 100, 1000]:
+                chunked_matcher = Matcher(
+                    [0.3, 0.7], [0, -1, 1], allow_low_quality_matches, chunk_size=chunk_size
+                )
+                for gt in [gt_boxes, gt_boxes[:0]]:
+                    expected_matches, expected_labels = matcher(pairwise_iou(gt, anchors))
+                    matches, labels = chunked_matcher.match_pairwise(pairwise_iou, gt, anchors)
+                    self.assertTrue(torch.equal(matches, expected_matches))
+                    self.assertTrue(torch.equal(labels, expected_labels))
+
+    def test_match_batched(self):
+        torch.manual_seed(0)
+        matcher = Matcher([0.3, 0.7], [0, -1, 1], allow_low_quality_matches=True)
+        # different numbers of gt and predictions, including an item without gt
+        shapes = [(3, 20), (0, 15), (5, 25)]
+        matrices = [torch.rand(m, n) for m, n in shapes]
+        matrices[2][1, 4] = matrices[2][1, 7] = 1.0  # ties for the highest quality
+        batch = torch.zeros(len(shapes), 5, 25)
+        gt_mask = torch.zeros(len(shapes), 5, dtype=torch.bool)
+        pred_mask = torch.zeros(len(shapes), 25, dtype=torch.bool)
+        for k, (m, n) in enumerate(shapes):
+            batch[k, :m, :n] = matrices[k]
+            gt_mask[k, :m] = True
+            pred_mask[k, :n] = True
+
+        matches, labels = matcher.match_batched(batch, gt_mask, pred_mask)
+        for k, (_, n) in enumerate(shapes):
+            expected_matches, expected_labels = matcher(matrices[k])
+            self.assertTrue(torch.equal(matches[k, :n], expected_matches))
+            self.assertTrue(torch.equal(labels[k, :n], expected_labels))
+
+        matches, labels = matcher.match_batched(batch[:, :0], gt_mask[:, :0], pred_mask)
+        self.assertTrue((matches == 0).all() and (labels == 0).all())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -3,22 +3,26 @@
 
 import numpy as np
 import unittest
+from unittest import mock
+import pycocotools.mask as mask_util
 import torch
 
 import detectron2.model_zoo as model_zoo
 from detectron2.config import get_cfg
+from detectron2.evaluation.coco_evaluation import instances_to_coco_json
 from detectron2.modeling import build_model
-from detectron2.structures import BitMasks, Boxes, ImageList, Instances
+from detectron2.structures import BitMasks, Boxes, ImageList, Instances, RLEMasks
 from detectron2.utils.events import EventStorage
 
 
-def get_model_zoo(config_path):
+def get_model_zoo(config_path, opts=()):
     """
     Like model_zoo.get, but do not load any weights (even pretrained)
     """
     cfg_file = model_zoo.get_config_file(config_path)
     cfg = get_cfg()
     cfg.merge_from_file(cfg_file)
+    cfg.merge_from_list(list(opts))
     if not torch.cuda.is_available():
         cfg.MODEL.DEVICE = "cpu"
     return build_model(cfg)
@@ -129,6 +133,31 @@ class MaskRCNNE2ETest(ModelE2ETest, unittest.TestCase):
             det, _ = self.model.roi_heads(images, features, props)
             self.assertEqual(len(det[0]), 0)
 
+    def test_rle_mask_format(self):
+        opts = ["TEST.MASK_FORMAT", "rle", "MODEL.ROI_HEADS.SCORE_THRESH_TEST", 0.0]
+        model = get_model_zoo(self.CONFIG_PATH, opts)
+        model.load_state_dict(self.model.state_dict())
+        model.eval()
+        inputs = [create_model_input(torch.rand(3, 200, 250) * 255)]
+
+        # RLE masks are encoded from the pasted regions, the full-image masks are never built
+        with mock.patch(
+            "detectron2.modeling.postprocessing.paste_masks_in_image",
+            side_effect=AssertionError("masks are made dense"),
+        ):
+            with torch.no_grad():
+                instances = model(inputs)[0]["instances"].to("cpu")
+            self.assertIsInstance(instances.pred_masks, RLEMasks)
+            self.assertGreater(len(instances), 0)
+            results = instances_to_coco_json(instances, 1)
+
+        model.mask_format = "bitmask"
+        with torch.no_grad():
+            expected = model(inputs)[0]["instances"].to("cpu")
+        self.assertEqual(len(results), len(expected))
+        for result, mask in zip(results, expected.pred_masks.numpy()):
+            self.assertTrue(np.array_equal(mask_util.decode(result["segmentation"]), mask))
+
 
 class RetinaNetE2ETest(ModelE2ETest, unittest.TestCase):
     CONFIG_PATH = "COCO-Detection/retinanet_R_50_FPN_1x.yaml"
@@ -140,6 +140,71 @@ class ROIHeadsTest(unittest.TestCase):
             ),
         )
 
+    def test_batched_label_and_sample(self):
+        torch.manual_seed(121)
+        cfg = get_cfg()
+        cfg.MODEL.ROI_BOX_HEAD.NAME = "FastRCNNConvFCHead"
+        cfg.MODEL.ROI_BOX_HEAD.NUM_FC = 2
+        cfg.MODEL.MASK_ON = True
+        feature_shape = {"res4": ShapeSpec(channels=1024, stride=16)}
+
+        def random_boxes(num_boxes, size):
+            xy0 = torch.rand(num_boxes, 2) * size
+            return Boxes(torch.cat([xy0, xy0 + torch.rand(num_boxes, 2) * size / 2 + 1], dim=1))
+
+        image_shapes = [(40, 40), (60, 50), (30, 30)]
+        num_gts = [3, 0, 5]
+        proposals, targets = [], []
+        for k, (image_shape, num_gt) in enumerate(zip(image_shapes, num_gts)):
+            num_proposals = 200 + 50 * k
+            proposal = Instances(image_shape)
+            proposal.proposal_boxes = random_boxes(num_proposals, 40)
+            proposal.objectness_logits = torch.rand(num_proposals)
+            proposals.append(proposal)
+            target = Instances(image_shape)
+            target.gt_boxes = random_boxes(num_gt, 40)
+            target.gt_classes = torch.randint(80, (num_gt,))
+            target.gt_masks = BitMasks(torch.rand((num_gt,) + image_shape) > 0.5)
+            target.gt_ids = torch.arange(num_gt) + 10 * k
+            targets.append(target)
+
+        def label_and_sample(batched, batch_size_per_image):
+            cfg.MODEL.ROI_HEADS.BATCHED_LABEL_AND_SAMPLE = batched
+            cfg.MODEL.ROI_HEADS.BATCH_SIZE_PER_IMAGE = batch_size_per_image
+            roi_heads = StandardROIHeads(cfg, feature_shape)
+            with EventStorage() as storage:
+                outputs = roi_heads.label_and_sample_proposals(deepcopy(proposals), targets)
+                num_fg = storage.history("roi_head/num_fg_samples").latest()
+            return outputs, num_fg
+
+        # All proposals that are not ignored are sampled, in a different order
+        expected, expected_num_fg = label_and_sample(False, 10000)
+        outputs, num_fg = label_and_sample(True, 10000)
+        self.assertEqual(num_fg, expected_num_fg)
+        for output, expected_output in zip(outputs, expected):
+            self.assertEqual(output.image_size, expected_output.image_size)
+            self.assertEqual(output.get_fields().keys(), expected_output.get_fields().keys())
+            # the proposal boxes are unique
+            order = output.proposal_boxes.tensor[:, 0].argsort()
+            expected_order = expected_output.proposal_boxes.tensor[:, 0].argsort()
+            output, expected_output = output[order], expected_output[expected_order]
+            for name in ["proposal_boxes", "gt_boxes", "gt_masks"]:
+                if expected_output.has(name):
+                    self.assertTrue(
+                        torch.equal(output.get(name).tensor, expected_output.get(name).tensor)
+                    )
+            for name in ["objectness_logits", "gt_classes", "gt_ids"]:
+                if expected_output.has(name):
+                    self.assertTrue(torch.equal(output.get(name), expected_output.get(name)))
+
+        # The sampled proposals respect the batch size and positive fraction
+        outputs, _ = label_and_sample(True, 64)
+        for output, proposal in zip(outputs, proposals):
+            self.assertLessEqual(len(output), 64)
+            self.assertEqual(len(output.proposal_boxes.tensor.unique(dim=0)), len(output))
+            num_fg = (output.gt_classes != cfg.MODEL.ROI_HEADS.NUM_CLASSES).sum().item()
+            self.assertLessEqual(num_fg, 64 * cfg.MODEL.ROI_HEADS.POSITIVE_FRACTION)
+
     @unittest.skipIf(TORCH_VERSION < (1, 7), "Insufficient pytorch version")
     def test_box_head_scriptability(self):
         input_shape = ShapeSpec(channels=1024, height=14, width=14)
@@ -251,6 +251,45 @@ class RPNTest(unittest.TestCase):
         pred_logits[0][1][3:5].fill_(float("inf"))
         find_top_rpn_proposals(proposals, pred_logits, [(10, 10)], 0.5, 1000, 1000, 0, False)
 
+    def test_find_rpn_proposals_batched(self):
+        torch.manual_seed(0)
+        N = 4
+        image_sizes = [(60, 80), (80, 60), (50, 50), (100, 90)]
+        proposals, pred_logits = [], []
+        for Hi_Wi_A in [300, 75]:
+            xy0 = torch.rand(N, Hi_Wi_A, 2) * 120 - 10
+            wh = torch.rand(N, Hi_Wi_A, 2) * 30
+            proposals.append(torch.cat([xy0, xy0 + wh], dim=2))
+            pred_logits.append(torch.randn(N, Hi_Wi_A))
+        pred_logits[0][1, 5] = float("nan")
+
+        for post_nms_topk in [1000, 20]:
+            # multiple images are processed together
+            results = find_top_rpn_proposals(
+                proposals, pred_logits, image_sizes, 0.7, 200, post_nms_topk, 5.0, False
+            )
+            for n in range(N):
+                expected = find_top_rpn_proposals(
+                    [x[n : n + 1] for x in proposals],
+                    [x[n : n + 1] for x in pred_logits],
+                    [image_sizes[n]],
+                    0.7,
+                    200,
+                    post_nms_topk,
+                    5.0,
+                    False,
+                )[0]
+                self.assertEqual(results[n].image_size, image_sizes[n])
+                self.assertTrue(
+                    torch.equal(results[n].proposal_boxes.tensor, expected.proposal_boxes.tensor)
+                )
+                self.assertTrue(
+                    torch.equal(results[n].objectness_logits, expected.objectness_logits)
+                )
+
+        with self.assertRaises(FloatingPointError):
+            find_top_rpn_proposals(proposals, pred_logits, image_sizes, 0.7, 200, 20, 5.0, True)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,37 @@
+import numpy as np
 import unittest
+import pycocotools.mask as mask_util
 import torch
+from fvcore.common.benchmark import benchmark
 
-from detectron2.structures.masks import BitMasks, PolygonMasks, polygons_to_bitmask
+from detectron2.structures.masks import (
+    BitMasks,
+    PolygonMasks,
+    RLEMasks,
+    encode_rle_in_region,
+    polygons_to_bitmask,
+    rasterize_polygons_within_box,
+)
+
+
+def _random_polygon_masks(num_instances, rng):
+    polygons = []
+    for _ in range(num_instances):
+        instance = []
+        for _ in range(rng.randint(1, 4)):
+            num_points = rng.randint(3, 20)
+            poly = rng.uniform(-10, 110, size=2 * num_points)
+            if rng.rand() < 0.3:
+                # integer coordinates hit the boundary cases of the rasterizer
+                poly = np.round(poly)
+            if rng.rand() < 0.2:
+                # duplicate points
+                poly[2:4] = poly[0:2]
+            instance.append(poly)
+        polygons.append(instance)
+    boxes = rng.uniform(0, 50, size=(num_instances, 2))
+    boxes = np.concatenate([boxes, boxes + rng.uniform(0, 60, size=(num_instances, 2))], axis=1)
+    return PolygonMasks(polygons), torch.tensor(boxes, dtype=torch.float32)
 
 
 class TestBitMask(unittest.TestCase):
@@ -38,5 +68,132 @@ class TestBitMask(unittest.TestCase):
             self.assertTrue(torch.all(box == reconstruct_box).item())
 
 
+class TestPolygonMasks(unittest.TestCase):
+    def test_crop_and_resize(self):
+        rng = np.random.RandomState(42)
+        for num_instances in [1, 5, 30]:
+            masks, boxes = _random_polygon_masks(num_instances, rng)
+            # a degenerate box
+            boxes[0, 2] = boxes[0, 0]
+            for mask_size in [7, 28]:
+                results = masks.crop_and_resize(boxes, mask_size)
+                self.assertEqual(results.shape, (num_instances, mask_size, mask_size))
+                self.assertEqual(results.dtype, torch.bool)
+                for poly, box, result in zip(masks.polygons, boxes, results):
+                    expected = rasterize_polygons_within_box(poly, box.numpy(), mask_size)
+                    self.assertTrue(torch.equal(result, expected))
+
+    def test_to_bitmasks(self):
+        rng = np.random.RandomState(42)
+        masks, _ = _random_polygon_masks(10, rng)
+        bitmasks = BitMasks.from_polygon_masks(masks, 90, 100)
+        self.assertEqual(bitmasks.tensor.shape, (10, 90, 100))
+        for poly, result in zip(masks.polygons, bitmasks.tensor):
+            expected = torch.from_numpy(polygons_to_bitmask(poly, 90, 100))
+            self.assertTrue(torch.equal(result, expected))
+
+    def test_crop_and_resize_empty(self):
+        results = PolygonMasks([]).crop_and_resize(torch.zeros(0, 4), 28)
+        self.assertEqual(results.shape, (0, 28, 28))
+
+
+class TestRLEMasks(unittest.TestCase):
+    def _random_bitmasks(self, num_instances, height, width, rng):
+        masks = torch.zeros(num_instances, height, width, dtype=torch.bool)
+        for mask in masks[:-1]:
+            y0, x0 = rng.randint(0, height), rng.randint(0, width)
+            y1, x1 = rng.randint(y0, height + 1), rng.randint(x0, width + 1)
+            mask[y0:y1, x0:x1] = torch.from_numpy(rng.rand(y1 - y0, x1 - x0) < 0.7)
+        # the last one is empty
+        return BitMasks(masks)
+
+    def test_same_as_bitmasks(self):
+        rng = np.random.RandomState(42)
+        bitmasks = self._random_bitmasks(10, 67, 83, rng)
+        rlemasks = RLEMasks.from_bitmasks(bitmasks)
+        self.assertEqual(len(rlemasks), 10)
+        for rle, mask in zip(rlemasks, bitmasks.tensor):
+            self.assertTrue(np.array_equal(mask_util.decode(rle), mask.numpy()))
+
+        self.assertTrue(torch.equal(rlemasks.area(), bitmasks.tensor.flatten(1).sum(dim=1)))
+        self.assertTrue(torch.equal(rlemasks.nonempty(), bitmasks.nonempty()))
+        self.assertTrue(
+            torch.equal(rlemasks.get_bounding_boxes().tensor, bitmasks.get_bounding_boxes().tensor)
+        )
+
+        boxes = rng.uniform(-20, 90, size=(10, 2))
+        boxes = np.concatenate([boxes, boxes + rng.uniform(0, 60, size=(10, 2))], axis=1)
+        boxes = torch.tensor(boxes, dtype=torch.float32)
+        self.assertTrue(
+            torch.equal(rlemasks.crop_and_resize(boxes, 28), bitmasks.crop_and_resize(boxes, 28))
+        )
+
+    def test_indexing_and_cat(self):
+        rng = np.random.RandomState(42)
+        rlemasks = RLEMasks.from_bitmasks(self._random_bitmasks(10, 20, 30, rng))
+        self.assertEqual(rlemasks[3].rles, [rlemasks.rles[3]])
+        self.assertEqual(rlemasks[2:5].rles, rlemasks.rles[2:5])
+        self.assertEqual(rlemasks[[1, 4]].rles, [rlemasks.rles[1], rlemasks.rles[4]])
+        keep = rlemasks.nonempty()
+        self.assertEqual(rlemasks[keep].rles, [r for r, k in zip(rlemasks.rles, keep) if k])
+        self.assertEqual(rlemasks[torch.tensor([0, 9])].rles, [rlemasks.rles[0], rlemasks.rles[9]])
+
+        cat = RLEMasks.cat([rlemasks[:4], rlemasks[4:]])
+        self.assertEqual(cat.rles, rlemasks.rles)
+
+    def test_from_polygon_masks(self):
+        rng = np.random.RandomState(42)
+        masks, _ = _random_polygon_masks(10, rng)
+        rlemasks = RLEMasks.from_polygon_masks(masks, 90, 100)
+        bitmasks = BitMasks.from_polygon_masks(masks, 90, 100)
+        for rle, mask in zip(rlemasks, bitmasks.tensor):
+            self.assertTrue(np.array_equal(mask_util.decode(rle), mask.numpy()))
+
+    def test_encode_rle_in_region(self):
+        rng = np.random.RandomState(42)
+        masks = self._random_bitmasks(10, 20, 30, rng).tensor.numpy()
+        # regions that span the full height are merged across columns
+        masks[0, :, 5:10] = True
+        for mask in masks:
+            expected = mask_util.encode(np.asfortranarray(mask, dtype=np.uint8))
+            ys, xs = np.nonzero(mask)
+            y0, x0 = (ys.min(), xs.min()) if len(ys) else (3, 4)
+            rle = encode_rle_in_region(mask[y0:, x0:], y0, x0, 20, 30)
+            self.assertEqual(rle, expected)
+
+
+def benchmark_crop_and_resize():
+    # Polygons of random objects, and proposal boxes that roughly cover them
+    rng = np.random.RandomState(42)
+    polygons, boxes = [], []
+    for _ in range(512):
+        x0, y0 = rng.uniform(0, 600, size=2)
+        w, h = rng.uniform(10, 300, size=2)
+        instance = []
+        for _ in range(rng.randint(1, 3)):
+            num_points = rng.randint(10, 40)
+            angles = np.sort(rng.uniform(0, 2 * np.pi, size=num_points))
+            radius = rng.uniform(0.5, 1, size=num_points)
+            x = x0 + w / 2 * (1 + radius * np.cos(angles))
+            y = y0 + h / 2 * (1 + radius * np.sin(angles))
+            instance.append(np.stack([x, y], axis=1).reshape(-1))
+        polygons.append(instance)
+        boxes.append(np.array([x0, y0, x0 + w, y0 + h]) + rng.uniform(-0.1, 0.1, size=4) * w)
+    masks = PolygonMasks(polygons)
+    boxes = torch.tensor(np.asarray(boxes), dtype=torch.float32)
+
+    def func(batched):
+        if batched:
+            return lambda: masks.crop_and_resize(boxes, 28)
+        return lambda: [
+            rasterize_polygons_within_box(poly, box.numpy(), 28)
+            for poly, box in zip(masks.polygons, boxes)
+        ]
+
+    specs = [{"batched": True}, {"batched": False}]
+    benchmark(func, "crop_and_resize", specs, num_iters=10, warmup_iters=2)
+
+
 if __name__ == "__main__":
+    benchmark_crop_and_resize()
     unittest.main()
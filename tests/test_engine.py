@@ -3,13 +3,21 @@
 import json
 import os
 import tempfile
+import threading
 import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock
+import numpy as np
 import torch
 from torch import nn
 
-from detectron2.engine import SimpleTrainer, hooks
+from detectron2.config import get_cfg
+from detectron2.data.build import _get_inference_costs
+from detectron2.data.samplers import InferenceGroupedBatchSampler
+from detectron2.engine import BatchPredictor, SimpleTrainer, hooks
+from detectron2.evaluation import DatasetEvaluator, inference_on_dataset
+from detectron2.modeling import META_ARCH_REGISTRY
 from detectron2.utils.events import CommonMetricPrinter, JSONWriter
 
 
@@ -25,6 +33,17 @@ class SimpleModel(nn.Module):
         return {"loss": x.sum() + sum([x.mean() for x in self.parameters()])}
 
 
+@META_ARCH_REGISTRY.register()
+class _BatchPredictorTestModel(nn.Module):
+    def __init__(self, cfg):
+        super().__init__()
+        self.batch_sizes = []
+
+    def forward(self, batched_inputs):
+        self.batch_sizes.append(len(batched_inputs))
+        return [{"sum": x["image"].sum(), "height": x["height"]} for x in batched_inputs]
+
+
 class TestTrainer(unittest.TestCase):
     def _data_loader(self, device):
         device = torch.device(device)
@@ -73,3 +92,132 @@ class TestTrainer(unittest.TestCase):
                 self.assertIn(f"iter: {iter}", log)
 
             self.assertIn("eta: 0:00:00", all_logs[-1], "Last ETA must be 0!")
+
+
+class TestBatchPredictor(unittest.TestCase):
+    def test_batch_predictor(self):
+        cfg = get_cfg()
+        cfg.MODEL.META_ARCHITECTURE = "_BatchPredictorTestModel"
+        cfg.MODEL.DEVICE = "cpu"
+        cfg.INPUT.MIN_SIZE_TEST = 20
+        cfg.INPUT.MAX_SIZE_TEST = 40
+        # a long wait, so that the batches of images submitted at once are full
+        predictor = BatchPredictor(cfg, max_batch_size=4, max_wait=1.0)
+        images = [np.full((10 + k, 15, 3), k, dtype=np.uint8) for k in range(8)]
+
+        futures = [predictor.submit(img) for img in images]
+        for k, future in enumerate(futures):
+            output = future.result()
+            self.assertEqual(output["height"], 10 + k)
+            expected = predictor._preprocess(images[k])["image"].sum()
+            self.assertEqual(output["sum"].item(), expected.item())
+        self.assertEqual(predictor.model.batch_sizes, [4, 4])
+
+        # concurrent calls from multiple threads, batched after max_wait
+        with ThreadPoolExecutor(3) as pool:
+            outputs = list(pool.map(predictor, images[:3]))
+        self.assertEqual([x["height"] for x in outputs], [10, 11, 12])
+        predictor.close()
+
+        stats = predictor.stats()
+        self.assertEqual(stats["num_images"], 11)
+        self.assertEqual(sum(predictor.model.batch_sizes), 11)
+        for key in ["throughput", "latency/queue", "latency/model", "latency/total"]:
+            self.assertGreater(stats[key], 0)
+
+    def test_close_while_submitting(self):
+        cfg = get_cfg()
+        cfg.MODEL.META_ARCHITECTURE = "_BatchPredictorTestModel"
+        cfg.MODEL.DEVICE = "cpu"
+        predictor = BatchPredictor(cfg, max_batch_size=4, max_wait=0.001)
+        image = np.zeros((10, 15, 3), dtype=np.uint8)
+
+        def submit_many():
+            futures = []
+            for _ in range(100):
+                try:
+                    futures.append(predictor.submit(image))
+                except AssertionError:  # closed
+                    break
+            return futures
+
+        with ThreadPoolExecutor(3) as pool:
+            results = [pool.submit(submit_many) for _ in range(3)]
+            time.sleep(0.01)
+            predictor.close()
+            futures = [f for r in results for f in r.result()]
+        # every submitted image is processed
+        for future in futures:
+            self.assertEqual(future.result(timeout=10)["height"], 10)
+
+
+class _RecordingEvaluator(DatasetEvaluator):
+    def reset(self):
+        self.outputs = []
+        self.threads = set()
+
+    def process(self, inputs, outputs):
+        time.sleep(0.01)
+        self.outputs.extend(outputs)
+        self.threads.add(threading.get_ident())
+
+    def evaluate(self):
+        return {"outputs": self.outputs}
+
+
+class TestInferenceOnDataset(unittest.TestCase):
+    def test_pipelined(self):
+        model = nn.Linear(3, 2)
+        data = [torch.rand(2, 3) for _ in range(10)]
+        expected = [x for inputs in data for x in model(inputs)]
+        for pipelined in [False, True]:
+            evaluator = _RecordingEvaluator()
+            results = inference_on_dataset(model, data, evaluator, pipelined=pipelined)
+            self.assertEqual(len(results["outputs"]), len(expected))
+            for x, y in zip(results["outputs"], expected):
+                self.assertTrue(torch.allclose(x, y))
+            # process is never called concurrently
+            self.assertEqual(len(evaluator.threads), 1)
+            self.assertEqual(threading.get_ident() in evaluator.threads, not pipelined)
+
+    def test_restore_order(self):
+        model = nn.Linear(3, 2)
+        data = [torch.rand(3) for _ in range(20)]
+        aspect_ratios = np.random.RandomState(0).rand(20)
+        batch_sampler = InferenceGroupedBatchSampler(
+            torch.utils.data.SequentialSampler(data), aspect_ratios, 3, window_size=9
+        )
+        data_loader = torch.utils.data.DataLoader(
+            data, batch_sampler=batch_sampler, collate_fn=lambda batch: torch.stack(batch)
+        )
+        for pipelined in [False, True]:
+            evaluator = _RecordingEvaluator()
+            results = inference_on_dataset(model, data_loader, evaluator, pipelined=pipelined)
+            self.assertEqual(len(results["outputs"]), len(data))
+            for x, y in zip(results["outputs"], data):
+                self.assertTrue(torch.allclose(x, model(y)))
+
+    def test_timings_file(self):
+        class SleepModel(nn.Module):
+            def forward(self, inputs):
+                for x in inputs:
+                    time.sleep(x["sleep"])
+                return inputs
+
+        # image 10 is slow; the first 5 batches are warmup and not timed
+        dataset_dicts = [{"image_id": k, "sleep": 0.05 if k == 10 else 0.0} for k in range(14)]
+        data = [dataset_dicts[k : k + 2] for k in range(0, 14, 2)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            timings_file = os.path.join(tmpdir, "timings", "inference_timings.json")
+            inference_on_dataset(SleepModel(), data, None, timings_file=timings_file)
+            with open(timings_file) as f:
+                timings = json.load(f)
+            self.assertEqual(set(timings.keys()), {"10", "11", "12", "13"})
+            self.assertGreaterEqual(timings["10"], 0.025)
+            self.assertEqual(timings["10"], timings["11"])
+
+            # the timings are read back to estimate the costs of the images
+            costs = _get_inference_costs(dataset_dicts, timings_file)
+            self.assertEqual(costs[10], costs[11])
+            self.assertGreater(costs[10], costs[12])
+            self.assertGreater(costs[10], costs[0])
@@ -22,8 +22,11 @@ from detectron2.data import (
     build_detection_train_loader,
 )
 from detectron2.engine import SimpleTrainer, default_argument_parser, hooks, launch
+from detectron2.layers.mask_ops import _do_paste_mask, _paste_masks_cpu
 from detectron2.modeling import build_model
+from detectron2.modeling.postprocessing import _paste_masks_as_rle
 from detectron2.solver import build_optimizer
+from detectron2.structures import Boxes
 from detectron2.utils import comm
 from detectron2.utils.events import CommonMetricPrinter
 from detectron2.utils.logger import setup_logger
@@ -148,9 +151,54 @@ def benchmark_eval(args):
     logger.info("{} iters in {} seconds.".format(max_iter, timer.seconds()))
 
 
+def benchmark_paste_masks(args):
+    """
+    Compare the implementations of pasting predicted masks into the image on CPU.
+    """
+    setup_logger()
+    logger.info("Using {} threads.".format(torch.get_num_threads()))
+    N = 100
+    image_shape = H, W = (800, 1333)
+    torch.manual_seed(42)
+    masks = torch.rand(N, 28, 28)
+    center = torch.rand(N, 2) * torch.tensor([W, H])
+    wh = torch.clamp(torch.randn(N, 2) * 100 + 150, min=10)
+    boxes = torch.cat([center - wh / 2, center + wh / 2], dim=1)
+    boxes = Boxes(boxes)
+    boxes.clip(image_shape)
+
+    def grid_sample():
+        # the implementation in paste_masks_in_image before the CPU-specific one
+        img_masks = torch.zeros(N, H, W, dtype=torch.bool)
+        for k in range(N):
+            mask, spatial_inds = _do_paste_mask(
+                masks[k : k + 1, None], boxes.tensor[k : k + 1], H, W
+            )
+            img_masks[(k,) + spatial_inds] = mask[0] >= 0.5
+        return img_masks
+
+    funcs = {
+        "grid_sample": grid_sample,
+        "cpu": lambda: _paste_masks_cpu(masks, boxes, image_shape),
+        "cpu_packed": lambda: _paste_masks_cpu(masks, boxes, image_shape, packed=True),
+        "cpu_rle": lambda: _paste_masks_as_rle(masks, boxes, image_shape, 0.5),
+    }
+    max_iter = 20
+    for name, f in funcs.items():
+        f()  # warmup
+        timer = Timer()
+        for _ in range(max_iter):
+            f()
+        logger.info(
+            "{}: {:.2f} ms per image with {} masks.".format(
+                name, timer.seconds() / max_iter * 1000, N
+            )
+        )
+
+
 if __name__ == "__main__":
     parser = default_argument_parser()
-    parser.add_argument("--task", choices=["train", "eval", "data"], required=True)
+    parser.add_argument("--task", choices=["train", "eval", "data", "paste_masks"], required=True)
     args = parser.parse_args()
     assert not args.eval_only
 
@@ -168,4 +216,7 @@ if __name__ == "__main__":
         f = benchmark_eval
         # only benchmark single-GPU inference.
         assert args.num_gpus == 1 and args.num_machines == 1
+    elif args.task == "paste_masks":
+        f = benchmark_paste_masks
+        assert args.num_gpus == 1 and args.num_machines == 1
     launch(f, args.num_gpus, args.num_machines, args.machine_rank, args.dist_url, args=(args,))
@@ -113,7 +113,18 @@ def do_test(cfg, model):
         evaluator = get_evaluator(
             cfg, dataset_name, os.path.join(cfg.OUTPUT_DIR, "inference", dataset_name)
         )
-        results_i = inference_on_dataset(model, data_loader, evaluator)
+        timings_file = None
+        if cfg.TEST.DUMP_INFERENCE_TIMINGS:
+            timings_file = os.path.join(
+                cfg.OUTPUT_DIR, "inference_timings_{}.json".format(dataset_name)
+            )
+        results_i = inference_on_dataset(
+            model,
+            data_loader,
+            evaluator,
+            pipelined=cfg.TEST.PIPELINED_EVAL,
+            timings_file=timings_file,
+        )
         results[dataset_name] = results_i
         if comm.is_main_process():
             logger.info("Evaluation results for {} in csv format:".format(dataset_name))